@@ -0,0 +1,290 @@
+# core/answer_cache.py
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import rag_utils
+from .tracing import stage
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+DEFAULT_TIMESTAMP_BUCKET_SECONDS = 15
+# How often to check the ingestion manifest for re-ingested videos.
+MANIFEST_POLL_SECONDS = 5
+
+
+def normalize_query(query):
+    """Lowercases, strips punctuation (keeping timestamp colons) and collapses whitespace."""
+    query = re.sub(r'[^\w\s:]', ' ', query.lower())
+    return ' '.join(query.split())
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+class _Entry:
+    __slots__ = ('answer', 'expires_at', 'group', 'vector')
+
+    def __init__(self, answer, expires_at, group, vector):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.group = group
+        self.vector = vector
+
+
+class AnswerCache:
+    """
+    In-process cache of assistant answers.
+
+    Exact hits are keyed by (video_id, normalized query, timestamp bucket).
+    Near-duplicates of questions about a video's content are matched by
+    cosine similarity of query embeddings; the router reuses that embedding
+    for retrieval. Timestamp and no-video questions never need an embedding,
+    so they are matched exactly only. Entries expire after a TTL and the
+    least recently used ones are evicted past max_entries. Fixed fallback
+    answers (rag_utils.FIXED_ANSWERS) are not cached.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 bucket_seconds=DEFAULT_TIMESTAMP_BUCKET_SECONDS, semantic=True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.bucket_seconds = bucket_seconds
+        self.semantic = semantic
+
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._video_hashes = None
+        self._manifest_mtime = None
+        self._manifest_checked_at = 0.0
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    # --- Keys ---
+    def _group(self, video_id, query, timestamp):
+        """Returns (video_id, timestamp bucket); the bucket is None unless the query is time-sensitive."""
+        is_time_sensitive, effective_timestamp = rag_utils.classify_query(query, timestamp)
+        bucket = None
+        if is_time_sensitive:
+            try:
+                bucket = int(float(effective_timestamp) // self.bucket_seconds)
+            except (TypeError, ValueError):
+                bucket = 0
+        return (str(video_id) if video_id else None, bucket)
+
+    def _is_semantic(self, group):
+        # Only questions the router answers from retrieval: they have a
+        # video and no timestamp.
+        video_id, bucket = group
+        return self.semantic and video_id is not None and bucket is None
+
+    # --- Public API ---
+    def get(self, video_id, query, timestamp=0):
+        """
+        Returns (answer, query_vector). answer is None on a miss; query_vector
+        is the embedding computed for the semantic lookup, if any, and should
+        be passed back to set().
+        """
+        if self._manifest_check_due():
+            self._sync_with_manifest()
+        group, exact, has_candidates = self._get_exact(video_id, query, timestamp)
+        if exact is not None:
+            return exact
+        query_vector = self._embed(query) if self._is_semantic(group) else None
+        return self._get_semantic(group, query_vector, has_candidates)
+
+    async def aget(self, video_id, query, timestamp=0):
+        """Async get: the semantic lookup awaits the embedding client instead of a thread."""
+        if self._manifest_check_due():
+            # The manifest read is file I/O; keep it off the event loop.
+            await asyncio.to_thread(self._sync_with_manifest)
+        group, exact, has_candidates = self._get_exact(video_id, query, timestamp)
+        if exact is not None:
+            return exact
+        query_vector = await self._aembed(query) if self._is_semantic(group) else None
+        return self._get_semantic(group, query_vector, has_candidates)
+
+    def set(self, video_id, query, timestamp, answer, query_vector=None):
+        if not answer or answer in rag_utils.FIXED_ANSWERS:
+            return
+        group = self._group(video_id, query, timestamp)
+        key = group + (normalize_query(query),)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(answer, time.monotonic() + self.ttl, group, query_vector)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_video(self, video_id):
+        """Drops every cached answer for a video."""
+        video_id = str(video_id)
+        with self._lock:
+            for group in [g for g in self._groups if g[0] == video_id]:
+                for key in list(self._groups.get(group, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            'entries': len(self._entries),
+            'exact_hits': self.exact_hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+    # --- Lookup steps ---
+    def _get_exact(self, video_id, query, timestamp):
+        """Returns (group, (answer, vector) on an exact hit or None, whether the group has entries)."""
+        group = self._group(video_id, query, timestamp)
+        key = group + (normalize_query(query),)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return group, (entry.answer, entry.vector), True
+                self._remove(key)
+            return group, None, bool(self._groups.get(group))
+
+    def _get_semantic(self, group, query_vector, has_candidates):
+        with self._lock:
+            if query_vector is not None and has_candidates:
+                match = self._best_semantic_match(group, query_vector, time.monotonic())
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    return self._entries[match].answer, query_vector
+            self.misses += 1
+        return None, query_vector
+
+    # --- Internals (callers hold the lock) ---
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._groups.get(entry.group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry.group]
+
+    def _best_semantic_match(self, group, query_vector, now):
+        candidates = [
+            key for key in self._groups.get(group, ())
+            if self._entries[key].vector is not None and self._entries[key].expires_at > now
+        ]
+        if not candidates:
+            return None
+        matrix = np.stack([self._entries[key].vector for key in candidates])
+        scores = matrix @ query_vector
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.similarity_threshold else None
+
+    def _embed(self, query):
+        """Returns the unit-normalized query embedding, or None if embedding fails."""
+        try:
+            with stage('embed'):
+                return _unit(rag_utils.get_embedding_function().embed_query(query))
+        except Exception as e:
+            logger.warning(f"Answer cache could not embed the query: {e}")
+            return None
+
+    async def _aembed(self, query):
+        try:
+            with stage('embed'):
+                return _unit(await rag_utils.get_embedding_function().aembed_query(query))
+        except Exception as e:
+            logger.warning(f"Answer cache could not embed the query: {e}")
+            return None
+
+    # --- Invalidation on re-ingestion ---
+    def _manifest_check_due(self):
+        """True at most once every MANIFEST_POLL_SECONDS."""
+        now = time.monotonic()
+        if now - self._manifest_checked_at < MANIFEST_POLL_SECONDS:
+            return False
+        self._manifest_checked_at = now
+        return True
+
+    def _sync_with_manifest(self):
+        """
+        Ingestion in this process invalidates directly (invalidate_video_answers);
+        ingestion in another process is picked up by watching its manifest
+        and dropping answers for every video whose transcript hash changed.
+        The manifest is only re-read when its mtime changes.
+        """
+        from .ingestion import MANIFEST_PATH, load_manifest
+        try:
+            mtime = os.path.getmtime(MANIFEST_PATH)
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+
+        hashes = {vid: info.get('hash') for vid, info in load_manifest()['videos'].items()}
+        if self._video_hashes is not None:
+            changed = {vid for vid in set(hashes) | set(self._video_hashes)
+                       if hashes.get(vid) != self._video_hashes.get(vid)}
+            for video_id in changed:
+                self.invalidate_video(video_id)
+            if changed:
+                logger.info(f"Answer cache invalidated for re-ingested videos: {sorted(changed)}")
+        self._manifest_mtime = mtime
+        self._video_hashes = hashes
+
+
+# --- Process-wide cache ---
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Returns the shared AnswerCache configured from settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    ttl=getattr(settings, 'ASSISTANT_CACHE_TTL', DEFAULT_TTL_SECONDS),
+                    max_entries=getattr(settings, 'ASSISTANT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+                    similarity_threshold=getattr(settings, 'ASSISTANT_CACHE_SIMILARITY', DEFAULT_SIMILARITY_THRESHOLD),
+                    bucket_seconds=getattr(settings, 'ASSISTANT_CACHE_TIMESTAMP_BUCKET', DEFAULT_TIMESTAMP_BUCKET_SECONDS),
+                    semantic=getattr(settings, 'ASSISTANT_CACHE_SEMANTIC', True),
+                )
+    return _cache
+
+
+def invalidate_video_answers(video_id):
+    """Drops a video's cached answers in this process, if the cache has been created."""
+    if _cache is not None:
+        _cache.invalidate_video(video_id)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registers the playlist cache invalidation handlers.
+        from . import signals  # noqa: F401
+        # Trace log lines are written by a background thread.
+        from .tracing import start_log_queue
+        start_log_queue()
@@ -0,0 +1,88 @@
+# core/audio_cache.py
+
+import glob
+import os
+import threading
+
+from django.conf import settings
+
+# --- Constants ---
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+# Files yt-dlp is still writing; they are renamed into place when complete.
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+
+class AudioCache:
+    """
+    Downloaded audio kept under one directory as <youtube_id>.<ext>, in the
+    format YouTube served it (Whisper decodes it through ffmpeg directly).
+    File mtimes record last use; past max_bytes the least recently used
+    files are deleted.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def output_template(self, youtube_id):
+        """yt-dlp outtmpl that downloads straight into the cache."""
+        return os.path.join(self.root, f'{youtube_id}.%(ext)s')
+
+    def get(self, youtube_id):
+        """Returns the cached audio path for a video and marks it used, or None."""
+        for path in glob.glob(os.path.join(self.root, f'{glob.escape(youtube_id)}.*')):
+            if not path.endswith(PARTIAL_SUFFIXES):
+                self.touch(path)
+                return path
+        return None
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIXES):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, used_before=None):
+        """
+        Deletes least recently used files until the cache fits max_bytes.
+        Files used at or after used_before (a timestamp) are kept, so a
+        running job never loses the audio it is working on.
+        Returns the number of files removed.
+        """
+        removed = 0
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if used_before is not None and mtime >= used_before:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        return removed
+
+
+def get_audio_cache():
+    return AudioCache(
+        getattr(settings, 'AUDIO_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'audio_cache')),
+        max_bytes=getattr(settings, 'AUDIO_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+    )
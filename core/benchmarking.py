@@ -0,0 +1,334 @@
+# core/benchmarking.py
+
+import asyncio
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.conf import settings
+from django.test.utils import override_settings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from . import embedding_cache, rag_utils, transcript_index
+from .chunking import chunk_segments, segment_intervals
+from .transcript_index import invalidate_interval_index, prime_interval_index
+from .vector_shards import get_shard_cache_size, save_shard
+
+# --- Constants ---
+# Same dimension as text-embedding-004, so shards have a realistic size.
+DEFAULT_DIM = 768
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a list of numbers; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def latency_summary(timings_ms):
+    """count / mean / p50 / p95 / p99 / max of a list of latencies in milliseconds."""
+    if not timings_ms:
+        return {'count': 0}
+    return {
+        'count': len(timings_ms),
+        'mean_ms': round(float(np.mean(timings_ms)), 3),
+        'p50_ms': round(percentile(timings_ms, 50), 3),
+        'p95_ms': round(percentile(timings_ms, 95), 3),
+        'p99_ms': round(percentile(timings_ms, 99), 3),
+        'max_ms': round(max(timings_ms), 3),
+    }
+
+
+# --- Deterministic embeddings ---
+@lru_cache(maxsize=200_000)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic embeddings that need no model or network: every word and
+    word bigram is hashed to a signed dimension of a unit vector. Texts that
+    share words get similar vectors, which is enough to exercise retrieval
+    end to end and to compare index changes against a fixed baseline.
+    """
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = TOKEN_PATTERN.findall(text.lower())
+        features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        for feature in features:
+            h = _feature_hash(feature)
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts):
+        return [self.embed(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed(text).tolist()
+
+
+# --- Fake Gemini endpoints ---
+class FakeEmbeddingServer:
+    """
+    Serves the Gemini batchEmbedContents endpoint on localhost, answering
+    with HashingEmbeddings vectors after `latency` seconds. Point
+    GEMINI_API_BASE at `url` to send the real embedding client to it.
+
+    Status codes appended to `failures` (or (status, retry_after) pairs) are
+    returned, in order, to the next requests instead of vectors; the size of
+    every batch that was answered is recorded in `batch_sizes`.
+    """
+
+    def __init__(self, embeddings=None, latency=0.0, host='127.0.0.1', port=0):
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.latency = latency
+        self.requests = 0
+        self.failures = []
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1beta'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    texts = [item['content']['parts'][0]['text'] for item in json.loads(body)['requests']]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    self.send_error(400, 'Malformed batchEmbedContents request')
+                    return
+                with server._lock:
+                    server.requests += 1
+                    failure = server.failures.pop(0) if server.failures else None
+                    if failure is None:
+                        server.batch_sizes.append(len(texts))
+                if server.latency:
+                    time.sleep(server.latency)
+                if failure is not None:
+                    status, retry_after = failure if isinstance(failure, tuple) else (failure, None)
+                    self.send_response(status)
+                    if retry_after is not None:
+                        self.send_header('Retry-After', str(retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                payload = json.dumps({
+                    'embeddings': [{'values': values} for values in server.embeddings.embed_documents(texts)]
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, name='fake-embeddings', daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that stands in for Gemini: waits `latency` seconds before the
+    first token and `token_latency` seconds between streamed words, and
+    answers with a fixed sentence. Install it with rag_utils.set_llm().
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    response: str = 'This is a placeholder answer from the benchmark chat model.'
+
+    @property
+    def _llm_type(self):
+        return 'fake-gemini'
+
+    def _words(self):
+        return [word + ' ' for word in self.response.split()]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency + self.token_latency * len(self._words()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency + self.token_latency * len(self._words()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, word in enumerate(self._words()):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._words()):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+# --- Corpus from the bundled transcript CSVs ---
+def read_csv_segments(path):
+    """Returns the (start, end, content) segments of a start[,duration],text transcript CSV."""
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        if next(reader, None) is None:
+            return []
+        for row in reader:
+            if len(row) == 3:
+                start, duration, content = row
+            elif len(row) == 2:
+                (start, content), duration = row, None
+            else:
+                continue
+            try:
+                rows.append((float(start), float(duration) if duration else None, content))
+            except ValueError:
+                continue
+    rows.sort(key=lambda row: row[0])
+    return segment_intervals(rows)
+
+
+def load_csv_corpus(root=None, limit=None):
+    """
+    Reads every CSV under media/transcripts/<course>/<youtube_id>.csv in a
+    stable order. Returns one dict per video with a synthetic video_id
+    (1, 2, ...), its course, youtube_id, segments and chunks. Nothing is
+    read from or written to the database.
+    """
+    root = root or os.path.join(settings.MEDIA_ROOT, 'transcripts')
+    paths = sorted(
+        os.path.join(course, name)
+        for course in os.listdir(root) if os.path.isdir(os.path.join(root, course))
+        for name in os.listdir(os.path.join(root, course)) if name.endswith('.csv')
+    )
+    videos = []
+    for relative_path in paths[:limit]:
+        course, name = os.path.split(relative_path)
+        segments = read_csv_segments(os.path.join(root, relative_path))
+        chunks = chunk_segments(segments)
+        if not chunks:
+            continue
+        videos.append({
+            'video_id': len(videos) + 1,
+            'course': course,
+            'youtube_id': name[:-len('.csv')],
+            'segments': segments,
+            'chunks': chunks,
+        })
+    return videos
+
+
+def build_corpus_index(index_path, videos, embedding_function, quantization='none'):
+    """
+    Embeds every video's chunks and writes one shard per video under
+    index_path, in the same layout ingestion produces. Returns the seconds
+    spent embedding and the seconds spent writing shards.
+    """
+    embed_seconds = write_seconds = 0.0
+    for video in videos:
+        documents = [
+            Document(page_content=chunk['content'], metadata={
+                'video_id': str(video['video_id']),
+                'course_id': video['course'],
+                'video_title': video['youtube_id'],
+                'start': chunk['start'],
+                'end': chunk['end'],
+            })
+            for chunk in video['chunks']
+        ]
+        ids = [f"{video['video_id']}:{i}" for i in range(len(documents))]
+
+        started = time.perf_counter()
+        vectors = embedding_function.embed_documents([doc.page_content for doc in documents])
+        embed_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        save_shard(index_path, video['video_id'], vectors, documents, ids, quantization=quantization)
+        write_seconds += time.perf_counter() - started
+    return embed_seconds, write_seconds
+
+
+@contextmanager
+def use_corpus_index(index_path, videos, embedding_function=None):
+    """
+    Points the assistant at the shards under index_path for the duration of
+    the block: retrieval opens them through a fresh shard cache, timestamp
+    lookups use the corpus chunks and queries are embedded with
+    embedding_function (None builds the configured client on first use).
+    The previous state is restored afterwards.
+
+    The primed interval indexes have no database rows behind them, so they
+    must not expire or be evicted mid-run: TRANSCRIPT_INDEX_TTL is read at
+    import, so the module constant is pinned, and the cache cap is raised to
+    hold every corpus video.
+    """
+    saved = (rag_utils.FAISS_INDEX_PATH, rag_utils.shard_cache, rag_utils.embedding_function, embedding_cache._cache,
+             transcript_index.INDEX_TTL_SECONDS)
+    rag_utils.FAISS_INDEX_PATH = index_path
+    rag_utils.shard_cache = None
+    rag_utils.embedding_function = embedding_function
+    embedding_cache._cache = None
+    transcript_index.INDEX_TTL_SECONDS = math.inf
+    try:
+        with override_settings(VECTOR_SHARD_CACHE_SIZE=max(get_shard_cache_size(), len(videos))):
+            for video in videos:
+                prime_interval_index(video['video_id'], video['chunks'])
+            yield
+    finally:
+        (rag_utils.FAISS_INDEX_PATH, rag_utils.shard_cache, rag_utils.embedding_function, embedding_cache._cache,
+         transcript_index.INDEX_TTL_SECONDS) = saved
+        invalidate_interval_index()
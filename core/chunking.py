@@ -0,0 +1,119 @@
+# core/chunking.py
+
+import math
+
+from django.db import transaction
+
+from .models import Transcript, TranscriptChunk
+
+# --- Constants ---
+# Transcripts without a duration column only store start times, so the final
+# segment of a video has no natural end. Assume it lasts this many seconds.
+LAST_SEGMENT_DURATION = 30.0
+# Gemini counts roughly four characters per token for English text.
+CHARS_PER_TOKEN = 4
+CHUNK_MAX_TOKENS = 250
+# A silence of at least PAUSE_SECONDS ends a chunk once it holds CHUNK_MIN_TOKENS.
+CHUNK_MIN_TOKENS = 80
+PAUSE_SECONDS = 2.0
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def segment_intervals(rows):
+    """
+    Turns (start, duration, content) rows sorted by start into
+    (start, end, content) segments. The end is start + duration when the
+    duration is known, otherwise the next segment's start; it never runs
+    past the next segment's start.
+    """
+    rows = [(float(start), duration, content.strip()) for start, duration, content in rows]
+    segments = []
+    for i, (start, duration, content) in enumerate(rows):
+        next_start = rows[i + 1][0] if i + 1 < len(rows) else None
+        if duration is not None and duration > 0:
+            end = start + float(duration)
+            if next_start is not None:
+                end = min(end, next_start)
+        else:
+            end = next_start if next_start is not None else start + LAST_SEGMENT_DURATION
+        segments.append((start, max(end, start), content))
+    return segments
+
+
+def chunk_segments(segments, max_tokens=CHUNK_MAX_TOKENS, min_tokens=CHUNK_MIN_TOKENS, pause_seconds=PAUSE_SECONDS):
+    """
+    Groups (start, end, content) segments into chunks of at most max_tokens,
+    preferring to break at pauses in speech. Returns a list of dicts with
+    start, end, content and token_count. A single segment over the budget
+    becomes a chunk of its own.
+    """
+    chunks = []
+    texts, chunk_start, chunk_end, tokens = [], None, None, 0
+
+    def flush():
+        chunks.append({
+            'start': chunk_start,
+            'end': chunk_end,
+            'content': ' '.join(texts),
+            'token_count': tokens,
+        })
+
+    for start, end, content in segments:
+        if not content:
+            continue
+        segment_tokens = estimate_tokens(content)
+        if texts and (
+            tokens + segment_tokens > max_tokens
+            or (tokens >= min_tokens and start - chunk_end >= pause_seconds)
+        ):
+            flush()
+            texts, tokens = [], 0
+        if not texts:
+            chunk_start = start
+        texts.append(content)
+        chunk_end = end
+        tokens += segment_tokens
+
+    if texts:
+        flush()
+    return chunks
+
+
+def compute_video_chunks(video_id):
+    """Chunks a video's Transcript rows in memory without saving them."""
+    rows = (
+        Transcript.objects
+        .filter(video_id=video_id)
+        .order_by('start', 'id')
+        .values_list('start', 'duration', 'content')
+    )
+    return chunk_segments(segment_intervals(rows))
+
+
+def rebuild_video_chunks(video):
+    """Recomputes a video's chunks from its transcript and replaces the stored ones."""
+    chunks = compute_video_chunks(video.id)
+    with transaction.atomic():
+        TranscriptChunk.objects.filter(video=video).delete()
+        TranscriptChunk.objects.bulk_create([
+            TranscriptChunk(video=video, course_id=video.course_id, index=i, **chunk)
+            for i, chunk in enumerate(chunks)
+        ])
+    return chunks
+
+
+def get_video_chunks(video_id):
+    """
+    Returns the stored chunks of a video as dicts, falling back to chunking
+    its transcript in memory if it has not been chunked yet.
+    """
+    chunks = list(
+        TranscriptChunk.objects
+        .filter(video_id=video_id)
+        .order_by('index')
+        .values('start', 'end', 'content', 'token_count')
+    )
+    return chunks or compute_video_chunks(video_id)
@@ -0,0 +1,236 @@
+# core/embedding_cache.py
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+# --- Constants ---
+DEFAULT_CACHE_PATH = settings.BASE_DIR / 'embedding_cache.sqlite3'
+DEFAULT_MAX_ENTRIES = 200_000
+SQLITE_MAX_VARIABLES = 500
+# last_used is only rewritten on a hit when it is older than this, so hot
+# entries cost no writes; LRU order at this resolution is enough for eviction.
+TOUCH_RESOLUTION_SECONDS = 3600
+# Other processes insert too, so the row count is re-read from the database
+# at least this often (in rows inserted here) and always before evicting.
+COUNT_REFRESH_INSERTS = 1000
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk float32 embedding store keyed by (model, sha256(text)).
+    Least recently used entries are evicted once max_entries is exceeded.
+    Several processes may share the file, so the entry count is read from
+    the database rather than tracked per process.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            ' model TEXT NOT NULL,'
+            ' text_hash TEXT NOT NULL,'
+            ' vector BLOB NOT NULL,'
+            ' last_used REAL NOT NULL,'
+            ' PRIMARY KEY (model, text_hash)'
+            ') WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._count = self._count_rows()
+        self._inserted_since_count = 0
+
+    def get_many(self, model, hashes):
+        """Returns a list aligned with hashes holding cached vectors or None."""
+        found, stale = {}, []
+        now = time.time()
+        stale_before = now - TOUCH_RESOLUTION_SECONDS
+        with self._lock:
+            for i in range(0, len(hashes), SQLITE_MAX_VARIABLES):
+                batch = hashes[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    'SELECT text_hash, vector, last_used FROM embeddings'
+                    f' WHERE model = ? AND text_hash IN ({placeholders})',
+                    [model, *batch]
+                ).fetchall()
+                found.update((h, vector) for h, vector, _ in rows)
+                stale.extend(h for h, _, last_used in rows if last_used < stale_before)
+
+            if stale:
+                self._conn.execute('BEGIN')
+                self._conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+                    [(now, model, h) for h in stale]
+                )
+                self._conn.execute('COMMIT')
+            hit_count = sum(1 for h in hashes if h in found)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+
+        return [
+            np.frombuffer(found[h], dtype=np.float32).tolist() if h in found else None
+            for h in hashes
+        ]
+
+    def put_many(self, model, hashes, vectors):
+        now = time.time()
+        rows = [
+            (model, h, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for h, vector in zip(hashes, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self._conn.execute('COMMIT')
+            inserted = self._conn.total_changes - before
+            self._count += inserted
+            self._inserted_since_count += inserted
+            if self._count > self.max_entries or self._inserted_since_count >= COUNT_REFRESH_INSERTS:
+                self._count = self._count_rows()
+                self._inserted_since_count = 0
+                if self._count > self.max_entries:
+                    self._evict()
+
+    def _count_rows(self):
+        return self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def _evict(self):
+        # Trim to 90% of the cap so eviction does not run on every insert.
+        excess = self._count - int(self.max_entries * 0.9)
+        cursor = self._conn.execute(
+            'DELETE FROM embeddings WHERE (model, text_hash) IN ('
+            ' SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)',
+            (excess,)
+        )
+        self._count -= cursor.rowcount
+        self.evictions += cursor.rowcount
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object so that only texts missing from the cache are
+    sent to the API. Document and query embeddings are cached separately
+    because the model uses a different task type for each.
+    """
+
+    def __init__(self, inner, cache, model):
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts):
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_documents_with_stats(self, texts):
+        """
+        Returns (vectors, stats) for this call: the inner client's stats for
+        the texts it embedded (if it reports any) plus cache_hits and
+        cache_misses.
+        """
+        inner_with_stats = getattr(self.inner, 'embed_documents_with_stats', None)
+        if inner_with_stats is None:
+            def inner_with_stats(missing):
+                return self.inner.embed_documents(missing), {}
+        return self._embed(list(texts), f'{self.model}|document', inner_with_stats)
+
+    def embed_query(self, text):
+        return self._embed(
+            [text], f'{self.model}|query', lambda missing: ([self.inner.embed_query(missing[0])], {})
+        )[0][0]
+
+    async def aembed_documents(self, texts):
+        async def embed_missing(missing):
+            return await self.inner.aembed_documents(missing), {}
+        return (await self._aembed(list(texts), f'{self.model}|document', embed_missing))[0]
+
+    async def aembed_query(self, text):
+        async def embed_missing(missing):
+            return [await self.inner.aembed_query(missing[0])], {}
+        return (await self._aembed([text], f'{self.model}|query', embed_missing))[0][0]
+
+    def _embed(self, texts, namespace, embed_missing):
+        """embed_missing(texts) returns (vectors, stats); this returns (vectors, stats) for all texts."""
+        if not texts:
+            return [], {'cache_hits': 0, 'cache_misses': 0}
+        hashes, vectors, missing = self._lookup(texts, namespace)
+        stats = {}
+        if missing:
+            new_vectors, stats = embed_missing(list(missing.values()))
+            vectors = self._fill(namespace, hashes, vectors, missing, new_vectors)
+        return vectors, {**stats, 'cache_hits': len(texts) - len(missing), 'cache_misses': len(missing)}
+
+    async def _aembed(self, texts, namespace, embed_missing):
+        """Async _embed; embed_missing is a coroutine function. SQLite runs in a worker thread."""
+        if not texts:
+            return [], {'cache_hits': 0, 'cache_misses': 0}
+        hashes, vectors, missing = await asyncio.to_thread(self._lookup, texts, namespace)
+        stats = {}
+        if missing:
+            new_vectors, stats = await embed_missing(list(missing.values()))
+            vectors = await asyncio.to_thread(self._fill, namespace, hashes, vectors, missing, new_vectors)
+        return vectors, {**stats, 'cache_hits': len(texts) - len(missing), 'cache_misses': len(missing)}
+
+    def _lookup(self, texts, namespace):
+        """Returns (hashes, cached vectors or None, {hash: text} of each distinct missing text)."""
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(namespace, hashes)
+        missing = {}
+        for h, text, vector in zip(hashes, texts, vectors):
+            if vector is None and h not in missing:
+                missing[h] = text
+        return hashes, vectors, missing
+
+    def _fill(self, namespace, hashes, vectors, missing, new_vectors):
+        self.cache.put_many(namespace, list(missing), new_vectors)
+        by_hash = dict(zip(missing, new_vectors))
+        return [vector if vector is not None else by_hash[h] for h, vector in zip(hashes, vectors)]
+
+
+# --- Process-wide cache ---
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Returns the shared EmbeddingCache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    getattr(settings, 'EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH),
+                    max_entries=getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+                )
+    return _cache
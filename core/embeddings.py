@@ -0,0 +1,329 @@
+# core/embeddings.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_API_BASE = 'https://generativelanguage.googleapis.com/v1beta'
+MAX_BATCH_SIZE = 100  # Upper limit of the batchEmbedContents endpoint
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingAPIError(Exception):
+    """Raised when the embedding endpoint fails after all retries."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _AdaptiveLimiter:
+    """
+    A semaphore whose limit shrinks on throttling (multiplicative decrease)
+    and grows back slowly on success (additive increase).
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled):
+        with self._cond:
+            self.in_flight -= 1
+            self._adjust(throttled)
+            self._cond.notify_all()
+
+    def _adjust(self, throttled):
+        if throttled:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+        else:
+            self._successes += 1
+            if self.limit < self.max_limit and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+
+
+class _AsyncAdaptiveLimiter(_AdaptiveLimiter):
+    """The same limiter for coroutines on one event loop."""
+
+    def __init__(self, max_limit):
+        super().__init__(max_limit)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled):
+        async with self._cond:
+            self.in_flight -= 1
+            self._adjust(throttled)
+            self._cond.notify_all()
+
+
+class GeminiBatchEmbeddings(Embeddings):
+    """
+    LangChain-compatible client for the Gemini batchEmbedContents REST endpoint.
+
+    Texts are packed into maximum-size batches and sent with a bounded number
+    of requests in flight. 429 and 5xx responses shrink the concurrency limit
+    and are retried with jittered exponential backoff (or Retry-After), capped
+    at max_backoff.
+
+    The aembed_* methods are native coroutines on httpx; each event loop gets
+    its own connection pool and concurrency limiter; the pool is closed when
+    its loop shuts down.
+    """
+
+    def __init__(self, model, api_key, api_base=DEFAULT_API_BASE, batch_size=MAX_BATCH_SIZE,
+                 max_in_flight=4, max_retries=6, backoff_base=1.0, max_backoff=60.0, timeout=60):
+        self.model = model
+        self.api_key = api_key
+        self.api_base = api_base.rstrip('/')
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self._limiter = _AdaptiveLimiter(self.max_in_flight)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._async_state = weakref.WeakKeyDictionary()
+        self._async_state_lock = threading.Lock()
+
+    # --- LangChain Embeddings interface ---
+    def embed_documents(self, texts):
+        return self.embed_texts(texts, task_type='RETRIEVAL_DOCUMENT')
+
+    def embed_documents_with_stats(self, texts):
+        return self.embed_texts_with_stats(texts, task_type='RETRIEVAL_DOCUMENT')
+
+    def embed_query(self, text):
+        return self.embed_texts([text], task_type='RETRIEVAL_QUERY')[0]
+
+    async def aembed_documents(self, texts):
+        return (await self.aembed_texts_with_stats(texts, task_type='RETRIEVAL_DOCUMENT'))[0]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_texts_with_stats([text], task_type='RETRIEVAL_QUERY'))[0][0]
+
+    # --- Batching and scheduling ---
+    def embed_texts(self, texts, task_type='RETRIEVAL_DOCUMENT'):
+        """Embeds texts in order, running up to max_in_flight batches concurrently."""
+        return self.embed_texts_with_stats(texts, task_type)[0]
+
+    def embed_texts_with_stats(self, texts, task_type='RETRIEVAL_DOCUMENT'):
+        """
+        Same as embed_texts, but returns (vectors, stats) where stats describes
+        this call only: chunks, batches, retries, seconds and chunks_per_sec.
+        The client is shared between threads, so nothing per call is kept on it.
+        """
+        texts = list(texts)
+        if not texts:
+            return [], _stats(0, 0, [], 0.0)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.perf_counter()
+
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0], task_type)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as pool:
+                results = list(pool.map(lambda batch: self._embed_batch(batch, task_type), batches))
+
+        return _vectors_and_stats(len(texts), len(batches), results, time.perf_counter() - started)
+
+    async def aembed_texts_with_stats(self, texts, task_type='RETRIEVAL_DOCUMENT'):
+        """Async embed_texts_with_stats: batches are awaited on the running event loop."""
+        texts = list(texts)
+        if not texts:
+            return [], _stats(0, 0, [], 0.0)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._aembed_batch(batch, task_type) for batch in batches))
+        return _vectors_and_stats(len(texts), len(batches), results, time.perf_counter() - started)
+
+    def _embed_batch(self, texts, task_type):
+        """Returns (vectors, number of retries) for one batch."""
+        url, payload, headers = self._batch_request(texts, task_type)
+        for attempt in range(self.max_retries + 1):
+            retry_after, status_code, throttled = None, None, False
+            self._limiter.acquire()
+            try:
+                response = self._session.post(url, json=payload, headers=headers, timeout=self.timeout)
+                status_code = response.status_code
+                vectors, retry_after = self._read_response(response)
+                if vectors is not None:
+                    return vectors, attempt
+                throttled = True
+            except (requests.ConnectionError, requests.Timeout) as e:
+                throttled = True
+                logger.warning("Embedding request error: %s", e)
+            finally:
+                self._limiter.release(throttled)
+
+            if attempt == self.max_retries:
+                break
+            time.sleep(self._retry_delay(attempt, retry_after, status_code, self._limiter))
+
+        raise EmbeddingAPIError(
+            f'Embedding request failed after {self.max_retries + 1} attempts.', status_code=status_code
+        )
+
+    async def _aembed_batch(self, texts, task_type):
+        """Async _embed_batch."""
+        import httpx
+
+        client, limiter = await self._async_client()
+        url, payload, headers = self._batch_request(texts, task_type)
+        for attempt in range(self.max_retries + 1):
+            retry_after, status_code, throttled = None, None, False
+            await limiter.acquire()
+            try:
+                response = await client.post(url, json=payload, headers=headers)
+                status_code = response.status_code
+                vectors, retry_after = self._read_response(response)
+                if vectors is not None:
+                    return vectors, attempt
+                throttled = True
+            except httpx.TransportError as e:
+                throttled = True
+                logger.warning("Embedding request error: %s", e)
+            finally:
+                await limiter.release(throttled)
+
+            if attempt == self.max_retries:
+                break
+            await asyncio.sleep(self._retry_delay(attempt, retry_after, status_code, limiter))
+
+        raise EmbeddingAPIError(
+            f'Embedding request failed after {self.max_retries + 1} attempts.', status_code=status_code
+        )
+
+    async def _async_client(self):
+        """Returns (httpx.AsyncClient, limiter) for the running event loop."""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        with self._async_state_lock:
+            state = self._async_state.get(loop)
+            created = state is None
+            if created:
+                client = httpx.AsyncClient(
+                    timeout=self.timeout, limits=httpx.Limits(max_connections=self.max_in_flight)
+                )
+                closer = _close_on_loop_shutdown(client)
+                state = self._async_state[loop] = (client, _AsyncAdaptiveLimiter(self.max_in_flight), closer)
+        if created:
+            # Starting the generator registers it with this loop.
+            await closer.asend(None)
+        return state[:2]
+
+    def _batch_request(self, texts, task_type):
+        url = f'{self.api_base}/{self.model}:batchEmbedContents'
+        payload = {
+            'requests': [
+                {'model': self.model, 'content': {'parts': [{'text': text}]}, 'taskType': task_type}
+                for text in texts
+            ]
+        }
+        return url, payload, {'x-goog-api-key': self.api_key or ''}
+
+    def _read_response(self, response):
+        """
+        Returns (vectors, None) on success and (None, retry_after) for a
+        retryable status; raises EmbeddingAPIError for other errors.
+        Works on both requests and httpx responses.
+        """
+        status_code = response.status_code
+        if status_code in RETRYABLE_STATUS_CODES:
+            return None, _parse_retry_after(response)
+        if status_code >= 400:
+            raise EmbeddingAPIError(
+                f'Embedding request failed with status {status_code}: {response.text[:200]}',
+                status_code=status_code
+            )
+        return [item['values'] for item in response.json()['embeddings']], None
+
+    def _retry_delay(self, attempt, retry_after, status_code, limiter):
+        if retry_after:
+            # A server asking for minutes would stall the whole ingestion run.
+            delay = min(self.max_backoff, retry_after)
+        else:
+            delay = min(self.max_backoff, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        logger.warning(
+            "Embedding request throttled (status %s). Retrying in %.1fs with concurrency %d.",
+            status_code, delay, limiter.limit
+        )
+        return delay
+
+
+async def _close_on_loop_shutdown(client):
+    """
+    Parks until the event loop shuts down its async generators (asyncio.run
+    and async_to_sync both do before closing the loop), then closes the
+    client on that loop. Short-lived loops would otherwise leak a pool each.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def _stats(chunks, batches, results, elapsed):
+    if elapsed > 0:
+        chunks_per_sec = chunks / elapsed
+    else:
+        chunks_per_sec = float('inf') if chunks else 0.0
+    return {
+        'chunks': chunks,
+        'batches': batches,
+        'retries': sum(batch_retries for _, batch_retries in results),
+        'seconds': elapsed,
+        'chunks_per_sec': chunks_per_sec,
+    }
+
+
+def _vectors_and_stats(chunks, batches, results, elapsed):
+    """Joins per-batch (vectors, retries) results into (vectors, stats)."""
+    stats = _stats(chunks, batches, results, elapsed)
+    if batches > 1:
+        logger.info(
+            "Embedded %d chunks in %d batches (%.1f chunks/sec, %d retries)",
+            chunks, batches, stats['chunks_per_sec'], stats['retries']
+        )
+    return [vector for vectors, _ in results for vector in vectors], stats
+
+
+def _parse_retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
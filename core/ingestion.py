@@ -0,0 +1,208 @@
+# core/ingestion.py
+
+import hashlib
+import json
+import os
+import shutil
+
+from langchain_core.documents import Document
+
+from .answer_cache import invalidate_video_answers
+from .chunking import rebuild_video_chunks
+from .models import Video, Transcript, TranscriptChunk
+from .transcript_index import invalidate_interval_index
+from .vector_shards import save_shard, delete_shard, shards_root, get_quantization
+from . import rag_utils
+
+# --- Constants ---
+MANIFEST_PATH = os.path.join(rag_utils.FAISS_INDEX_PATH, 'ingest_manifest.json')
+# Version 4: one memory-mapped shard (vectors + BM25) per video under
+# faiss_index/videos/<video_id>/.
+# Version 5: shards embed the stored TranscriptChunk rows (core/chunking.py).
+MANIFEST_VERSION = 5
+# Chunks from several videos are embedded together so the embedding client
+# can fill whole batches and keep several requests in flight.
+EMBED_GROUP_CHUNKS = 800
+
+
+# --- Manifest (checkpoint) helpers ---
+def _empty_manifest():
+    return {
+        'version': MANIFEST_VERSION,
+        'embedding_model': rag_utils.EMBEDDING_MODEL,
+        'quantization': get_quantization(),
+        'videos': {},
+    }
+
+
+def load_manifest():
+    """Reads the ingestion manifest, returning an empty one if missing or unreadable."""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _empty_manifest()
+    # Only the transcript hash is kept per video: the answer cache re-reads
+    # this file after every checkpoint, and chunk ids live in the shards.
+    manifest['videos'] = {vid: {'hash': info.get('hash')} for vid, info in manifest.get('videos', {}).items()}
+    return manifest
+
+
+def save_manifest(manifest):
+    """Writes the manifest atomically so a crash never leaves a half-written file."""
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+# --- Content hashing and document building ---
+def compute_content_hashes():
+    """
+    Streams every Transcript row once, ordered by video and start time,
+    and returns {video_id: sha256 hex digest} for each video with transcripts.
+    """
+    hashes = {}
+    current_id, digest = None, None
+    rows = (
+        Transcript.objects
+        .order_by('video_id', 'start', 'id')
+        .values_list('video_id', 'start', 'duration', 'content')
+    )
+    for video_id, start, duration, content in rows.iterator(chunk_size=2000):
+        if video_id != current_id:
+            if current_id is not None:
+                hashes[str(current_id)] = digest.hexdigest()
+            current_id, digest = video_id, hashlib.sha256()
+        digest.update(f'{start!r}\t{duration!r}\t{content}\n'.encode('utf-8'))
+    if current_id is not None:
+        hashes[str(current_id)] = digest.hexdigest()
+    return hashes
+
+
+def build_video_documents(video):
+    """
+    Re-chunks a video's transcript, stores the chunks and returns them as
+    (documents, ids) with deterministic ids.
+    """
+    documents, ids = [], []
+    for index, chunk in enumerate(rebuild_video_chunks(video)):
+        documents.append(Document(
+            page_content=chunk['content'],
+            metadata={
+                'video_id': str(video.id),
+                'course_id': str(video.course_id),
+                'video_title': video.title,
+                'start': chunk['start'],
+                'end': chunk['end'],
+            },
+        ))
+        ids.append(f'{video.id}:{index}')
+    return documents, ids
+
+
+# --- Vector store helpers ---
+def _remove_legacy_index():
+    """Deletes the pre-sharding global index, which is no longer read."""
+    for filename in ('index.faiss', 'index.pkl'):
+        path = os.path.join(rag_utils.FAISS_INDEX_PATH, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _ingest_group(embedding_function, group, manifest, pending, stats, position, log):
+    """
+    Embeds all chunks of a group of videos in one batched call, then writes
+    and checkpoints each video's shard separately.
+    """
+    texts = [doc.page_content for _, documents, _ in group for doc in documents]
+    embed_with_stats = getattr(embedding_function, 'embed_documents_with_stats', None)
+    if embed_with_stats is not None:
+        group_vectors, run_stats = embed_with_stats(texts)
+    else:
+        group_vectors, run_stats = embedding_function.embed_documents(texts), {}
+    vectors = iter(group_vectors)
+    if run_stats.get('chunks'):
+        log(f"  Embedded {run_stats['chunks']} chunks at {run_stats['chunks_per_sec']:.1f} chunks/sec.")
+    if 'cache_hits' in run_stats and texts:
+        log(f"  Embedding cache: {run_stats['cache_hits']} hits, {run_stats['cache_misses']} misses.")
+
+    done = manifest['videos']
+    for video, documents, ids in group:
+        position += 1
+        video_id = str(video.id)
+        previous = done.get(video_id)
+        log(f'[{position}/{len(pending)}] Indexing "{video.title}" ({len(documents)} chunks)...')
+
+        video_vectors = [next(vectors) for _ in documents]
+        if documents:
+            save_shard(rag_utils.FAISS_INDEX_PATH, video_id, video_vectors, documents, ids,
+                       quantization=manifest['quantization'])
+        else:
+            delete_shard(rag_utils.FAISS_INDEX_PATH, video_id)
+
+        done[video_id] = {'hash': pending[video_id]}
+        stats['updated' if previous else 'added'] += 1
+        save_manifest(manifest)
+        invalidate_interval_index(video_id)
+        invalidate_video_answers(video_id)
+    return position
+
+
+# --- Ingestion engine ---
+def create_or_update_vector_store(rebuild=False, log=print):
+    """
+    Incrementally syncs the per-video vector shards with the Transcript table.
+
+    Only videos whose transcript hash changed are re-embedded, shards of
+    videos without transcripts are removed, and progress is checkpointed
+    after every video so an interrupted run resumes where it stopped.
+    Returns a dict with counts of added, updated, removed and skipped videos.
+    """
+    embedding_function = rag_utils.get_embedding_function()
+    manifest = load_manifest()
+
+    quantization = get_quantization()
+    if (rebuild or manifest.get('embedding_model') != rag_utils.EMBEDDING_MODEL
+            or manifest.get('version') != MANIFEST_VERSION or manifest.get('quantization') != quantization):
+        log('Full rebuild requested, or the embedding model or index format changed. Re-indexing everything.')
+        manifest = _empty_manifest()
+        shutil.rmtree(shards_root(rag_utils.FAISS_INDEX_PATH), ignore_errors=True)
+        _remove_legacy_index()
+
+    current_hashes = compute_content_hashes()
+    done = manifest['videos']
+    stats = {'added': 0, 'updated': 0, 'removed': 0, 'skipped': 0}
+
+    # 1. Remove shards of videos that no longer have transcripts.
+    for video_id in [vid for vid in done if vid not in current_hashes]:
+        log(f'Removing shard for deleted video {video_id}...')
+        delete_shard(rag_utils.FAISS_INDEX_PATH, video_id)
+        TranscriptChunk.objects.filter(video_id=int(video_id)).delete()
+        invalidate_interval_index(video_id)
+        invalidate_video_answers(video_id)
+        del done[video_id]
+        stats['removed'] += 1
+        save_manifest(manifest)
+
+    # 2. Embed new or changed videos, one checkpoint per video.
+    pending = {vid: h for vid, h in current_hashes.items() if done.get(vid, {}).get('hash') != h}
+    stats['skipped'] = len(current_hashes) - len(pending)
+    videos = Video.objects.filter(id__in=[int(vid) for vid in pending]).order_by('id')
+
+    group, group_size, position = [], 0, 0
+    for video in videos.iterator():
+        documents, ids = build_video_documents(video)
+        group.append((video, documents, ids))
+        group_size += len(documents)
+        if group_size >= EMBED_GROUP_CHUNKS:
+            position = _ingest_group(embedding_function, group, manifest, pending, stats, position, log)
+            group, group_size = [], 0
+    if group:
+        position = _ingest_group(embedding_function, group, manifest, pending, stats, position, log)
+
+    rag_utils.get_shard_cache().invalidate()
+    return stats
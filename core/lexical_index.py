@@ -0,0 +1,120 @@
+# core/lexical_index.py
+
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# --- Constants ---
+VOCAB_FILENAME = 'lexical_vocab.json'
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Identifiers such as os.path.join or __init__ stay single tokens. Stop words
+# are kept on purpose: "for" and "in" matter in programming lectures.
+TOKEN_PATTERN = re.compile(r'[a-z0-9_]+(?:\.[a-z0-9_]+)*')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks of one shard, stored in CSR form:
+    postings for term t are docs[indptr[t]:indptr[t + 1]] with matching
+    term frequencies. Arrays are memory-mapped like the vector files.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, VOCAB_FILENAME), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        self.indptr = load('lexical_indptr.npy')
+        self.docs = load('lexical_docs.npy')
+        self.tfs = load('lexical_tfs.npy')
+        self.doc_lengths = load('lexical_doclens.npy')
+        self.num_docs = len(self.doc_lengths)
+        self.avg_length = float(self.doc_lengths.mean()) if self.num_docs else 0.0
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, VOCAB_FILENAME))
+
+    @staticmethod
+    def write(path, texts):
+        """Builds the index for a list of chunk texts and writes it into path."""
+        term_docs = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_docs.setdefault(term, []).append((doc_id, tf))
+
+        terms = sorted(term_docs)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(term_docs[t]) for t in terms])
+        postings = [pair for t in terms for pair in term_docs[t]]
+        np.save(os.path.join(path, 'lexical_indptr.npy'), indptr)
+        np.save(os.path.join(path, 'lexical_docs.npy'), np.array([d for d, _ in postings], dtype=np.int32))
+        np.save(os.path.join(path, 'lexical_tfs.npy'), np.array([tf for _, tf in postings], dtype=np.uint16))
+        np.save(os.path.join(path, 'lexical_doclens.npy'), np.array(doc_lengths, dtype=np.int32))
+        with open(os.path.join(path, VOCAB_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({term: i for i, term in enumerate(terms)}, f)
+
+    def idf(self, terms):
+        """BM25 idf for each term; terms missing from the shard get the maximum idf."""
+        values = []
+        for term in terms:
+            term_id = self.vocab.get(term)
+            df = 0 if term_id is None else int(self.indptr[term_id + 1] - self.indptr[term_id])
+            values.append(math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5)))
+        return np.array(values, dtype=np.float32)
+
+    def search(self, query, k):
+        """
+        Returns (indices, scores) of the top k chunks. Scores are BM25 scores
+        relative to an average-length chunk containing every query term once,
+        capped at 1, so they are comparable across queries. Query terms the
+        shard does not contain count at the maximum idf, so a chunk matching
+        only part of the query cannot score near 1.
+        """
+        terms = set(tokenize(query))
+        term_ids = {self.vocab[t] for t in terms if t in self.vocab}
+        if not term_ids or not self.num_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        max_possible = float(self.idf(terms).sum())
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.avg_length)
+            # Postings of one term never repeat a doc, so plain fancy indexing is safe.
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, np.minimum(scores[top] / max_possible, 1.0)
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuses ranked lists of ids; each list contributes 1 / (k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
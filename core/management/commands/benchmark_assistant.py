@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import random
+import secrets
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from core import answer_cache, rag_utils
+from core.answer_cache import AnswerCache
+from core.benchmarking import (
+    FakeChatModel, FakeEmbeddingServer, HashingEmbeddings, build_corpus_index, latency_summary, load_csv_corpus,
+    use_corpus_index,
+)
+
+ROUTES = ('timestamp', 'rag', 'general')
+GENERAL_QUESTIONS = [
+    'What is the difference between a list and a tuple?',
+    'How do I become a better programmer?',
+    'Explain what an HTTP request is.',
+    'What are good habits for writing readable code?',
+    'Why do people use version control?',
+]
+
+# The root span of each request logs one JSON line on core.tracing; the
+# benchmark reads the route and stage timings from it.
+_trace = ContextVar('benchmark_trace', default=None)
+
+
+class _TraceRecorder(logging.Handler):
+    def emit(self, record):
+        box = _trace.get()
+        if box is not None:
+            try:
+                box.update(json.loads(record.getMessage()))
+            except ValueError:
+                pass
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _build_queries(videos, count, routes, rng):
+    """Returns `count` request payloads, cycling through the requested routes."""
+    queries = []
+    for i in range(count):
+        route = routes[i % len(routes)]
+        video = rng.choice(videos)
+        if route == 'timestamp':
+            start = rng.choice([s for s, _, _ in video['segments'] if s >= 1] or [1.0])
+            seconds = int(start) + 1
+            query = f'What is being explained at {seconds // 60}:{seconds % 60:02d}?'
+        elif route == 'rag':
+            words = rng.choice(video['chunks'])['content'].split()
+            offset = rng.randrange(max(1, len(words) - 6))
+            query = f"Can you explain {' '.join(words[offset:offset + 6])}?"
+        else:
+            queries.append({'route': route, 'payload': {'query': rng.choice(GENERAL_QUESTIONS)}})
+            continue
+        queries.append({'route': route, 'payload': {
+            'query': query,
+            'video_id': video['video_id'],
+            'video_title': video['youtube_id'],
+        }})
+    return queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the assistant API against an index built from media/transcripts/*.csv, with local fake '
+        'Gemini chat and embedding endpoints, and reports throughput and p50/p95/p99 latency per route. '
+        'Requests go through URL routing and the middleware stack as a logged-in user. The user and its '
+        'sessions live in a throwaway test database created for the run, as for manage.py test.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Measured requests per concurrency level.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                            help='Concurrent clients; several values run one level after another.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests sent first.')
+        parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES),
+                            help='Routes to include; requests cycle through them evenly.')
+        parser.add_argument('--llm-latency', type=float, default=0.5, help='Fake chat model seconds to first token.')
+        parser.add_argument('--llm-token-latency', type=float, default=0.0,
+                            help='Fake chat model seconds between streamed words.')
+        parser.add_argument('--embed-latency', type=float, default=0.05,
+                            help='Fake embedding endpoint seconds per request.')
+        parser.add_argument('--stream', action='store_true', help='Request NDJSON streaming answers.')
+        parser.add_argument('--async', dest='use_async', action='store_true', default=None,
+                            help='Send requests through the ASGI handler (default: follows ASSISTANT_ASYNC, '
+                                 'which also picks the view bound to /api/assistant/).')
+        parser.add_argument('--no-answer-cache', action='store_true',
+                            help='Disable the answer cache so every request is routed '
+                                 '(default: the cache as configured in settings).')
+        parser.add_argument('--videos', type=int, help='Only index the first N transcript CSVs.')
+        parser.add_argument('--quantization', choices=['none', 'int8'], default='none')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Optional path to write the results as JSON.')
+        parser.add_argument('--use-configured-database', action='store_true',
+                            help='Create the temporary benchmark user in the configured database instead of a '
+                                 'test database (for accounts without CREATE DATABASE). The user is deleted '
+                                 'afterwards.')
+
+    def handle(self, *args, **options):
+        use_async = options['use_async'] if options['use_async'] is not None else settings.ASSISTANT_ASYNC
+        rng = random.Random(options['seed'])
+
+        videos = load_csv_corpus(limit=options['videos'])
+        if not videos:
+            self.stdout.write(self.style.ERROR('No transcript CSVs found under media/transcripts/.'))
+            return
+
+        saved_answer_cache = answer_cache._cache
+        tracing_logger = logging.getLogger('core.tracing')
+        saved_logging = (tracing_logger.handlers[:], tracing_logger.level, tracing_logger.propagate)
+
+        with tempfile.TemporaryDirectory(prefix='assistant-benchmark-') as tmp, \
+                FakeEmbeddingServer(HashingEmbeddings(), latency=options['embed_latency']) as server, \
+                override_settings(
+                    GEMINI_API_KEY='benchmark-placeholder-key',
+                    GEMINI_API_BASE=server.url,
+                    EMBEDDING_CACHE_PATH=f'{tmp}/embedding_cache.sqlite3',
+                    TRACING_EXPORT_PATH='',
+                    # The test clients send Host: testserver.
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                ):
+            # Shards go to a temporary directory; the real index is untouched.
+            index_stats = self.build_index(tmp, videos, options['quantization'])
+            try:
+                # A fresh cache built from settings, as a newly started server has.
+                answer_cache._cache = AnswerCache(ttl=0, semantic=False) if options['no_answer_cache'] else None
+                rag_utils.set_llm(FakeChatModel(
+                    latency=options['llm_latency'], token_latency=options['llm_token_latency'],
+                ))
+                tracing_logger.handlers = [_TraceRecorder()]
+                tracing_logger.setLevel(logging.INFO)
+                tracing_logger.propagate = False
+
+                runs = []
+                # Never write to the real database unless asked to.
+                old_db_config = None if options['use_configured_database'] else setup_databases(
+                    verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS})
+                try:
+                    self.user = get_user_model().objects.create_user(f'benchmark-{secrets.token_hex(4)}')
+                    try:
+                        with use_corpus_index(tmp, videos):
+                            warmup = _build_queries(videos, options['warmup'], options['routes'], rng)
+                            if warmup:
+                                self.run_level(warmup, 1, options['stream'], use_async)
+                            for concurrency in options['concurrency']:
+                                queries = _build_queries(videos, options['requests'], options['routes'], rng)
+                                runs.append(self.run_level(queries, concurrency, options['stream'], use_async))
+                    finally:
+                        self.user.delete()
+                finally:
+                    if old_db_config is not None:
+                        teardown_databases(old_db_config, verbosity=0)
+                embedding_requests = server.requests
+                view = resolve(reverse('assistant_api')).func
+            finally:
+                answer_cache._cache = saved_answer_cache
+                rag_utils.reset_chain_registry()
+                tracing_logger.handlers, level, tracing_logger.propagate = saved_logging
+                tracing_logger.setLevel(level)
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'git_revision': _git_revision(),
+            'config': {
+                'handler': 'asgi' if use_async else 'wsgi',
+                'view': getattr(view, 'view_class', view).__name__,
+                'stream': options['stream'],
+                'answer_cache': not options['no_answer_cache'],
+                'routes': options['routes'],
+                'llm_latency': options['llm_latency'],
+                'llm_token_latency': options['llm_token_latency'],
+                'embed_latency': options['embed_latency'],
+                'quantization': options['quantization'],
+                'reranker': getattr(settings, 'RAG_RERANKER', None),
+                'seed': options['seed'],
+            },
+            'index': index_stats,
+            'embedding_requests': embedding_requests,
+            'runs': runs,
+        }
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def build_index(self, index_path, videos, quantization):
+        started = time.perf_counter()
+        embed_seconds, write_seconds = build_corpus_index(index_path, videos, HashingEmbeddings(), quantization)
+        stats = {
+            'videos': len(videos),
+            'chunks': sum(len(video['chunks']) for video in videos),
+            'embed_seconds': round(embed_seconds, 3),
+            'write_seconds': round(write_seconds, 3),
+            'build_seconds': round(time.perf_counter() - started, 3),
+        }
+        self.stdout.write(
+            f"Indexed {stats['chunks']} chunks from {stats['videos']} transcripts in {stats['build_seconds']:.2f}s."
+        )
+        return stats
+
+    # --- Load generation ---
+    def run_level(self, queries, concurrency, stream, use_async):
+        self._clients = threading.local()
+        started = time.perf_counter()
+        if use_async:
+            samples = asyncio.run(self.run_async(queries, concurrency, stream))
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda query: self.send_sync(query, stream), queries))
+        wall_seconds = time.perf_counter() - started
+
+        timings, stages, errors = defaultdict(list), defaultdict(lambda: defaultdict(float)), 0
+        for sample in samples:
+            if not sample['ok']:
+                errors += 1
+                continue
+            timings[sample['route']].append(sample['ms'])
+            for name, ms in sample['stages_ms'].items():
+                stages[sample['route']][name] += ms
+
+        return {
+            'concurrency': concurrency,
+            'requests': len(samples),
+            'errors': errors,
+            'wall_seconds': round(wall_seconds, 3),
+            'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+            'overall': latency_summary([ms for route_timings in timings.values() for ms in route_timings]),
+            'routes': {
+                route: {
+                    **latency_summary(route_timings),
+                    'stages_mean_ms': {
+                        name: round(total / len(route_timings), 3) for name, total in stages[route].items()
+                    },
+                }
+                for route, route_timings in sorted(timings.items())
+            },
+            # Routes the router actually took; a RAG query with no relevant chunk becomes general.
+            'misrouted': sum(
+                1 for sample in samples
+                if sample['ok'] and sample['route'] not in (sample['expected'], 'cached')
+            ),
+        }
+
+    def send_sync(self, query, stream):
+        # Test clients are not thread-safe: each load thread logs in its own.
+        client = getattr(self._clients, 'client', None)
+        if client is None:
+            client = self._clients.client = Client(raise_request_exception=False)
+            client.force_login(self.user)
+        trace = {}
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = client.post(
+                reverse('assistant_api'), {**query['payload'], 'stream': stream}, content_type='application/json'
+            )
+            if response.streaming:
+                ok = b'"error"' not in b''.join(response.streaming_content)
+            else:
+                ok = response.status_code == 200
+        finally:
+            _trace.reset(token)
+        return self.sample(query, trace, ok, started)
+
+    async def run_async(self, queries, concurrency, stream):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient(raise_request_exception=False)
+        await client.aforce_login(self.user)
+
+        async def send(query):
+            async with semaphore:
+                trace = {}
+                token = _trace.set(trace)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        reverse('assistant_api'), {**query['payload'], 'stream': stream},
+                        content_type='application/json',
+                    )
+                    if response.streaming:
+                        body = b''.join([chunk async for chunk in response])
+                        ok = b'"error"' not in body
+                    else:
+                        ok = response.status_code == 200
+                finally:
+                    _trace.reset(token)
+                return self.sample(query, trace, ok, started)
+
+        return await asyncio.gather(*(send(query) for query in queries))
+
+    @staticmethod
+    def sample(query, trace, ok, started):
+        return {
+            'expected': query['route'],
+            # No trace means the answer came from the answer cache.
+            'route': trace.get('route', 'cached') if trace else 'cached',
+            'ok': ok and trace.get('status', 'OK') == 'OK',
+            'ms': (time.perf_counter() - started) * 1000,
+            'stages_ms': trace.get('stages_ms', {}),
+        }
+
+    def report(self, results):
+        config = results['config']
+        self.stdout.write(
+            f"{config['view']} via {config['handler']} (stream={config['stream']}, "
+            f"answer cache {'on' if config['answer_cache'] else 'off'}), fake LLM {config['llm_latency'] * 1000:.0f}ms, "
+            f"fake embeddings {config['embed_latency'] * 1000:.0f}ms; "
+            f"{results['embedding_requests']} embedding requests served."
+        )
+        for run in results['runs']:
+            self.stdout.write(
+                f"concurrency={run['concurrency']}: {run['throughput_rps']} req/s, "
+                f"{run['errors']} errors, {run['misrouted']} routed differently than generated"
+            )
+            for route, summary in run['routes'].items():
+                stages = ' '.join(f'{name}={ms:.1f}' for name, ms in summary['stages_mean_ms'].items())
+                self.stdout.write(
+                    f"  {route:<10} n={summary['count']:<5} p50={summary['p50_ms']:>8.1f}ms  "
+                    f"p95={summary['p95_ms']:>8.1f}ms  p99={summary['p99_ms']:>8.1f}ms  [{stages}]"
+                )
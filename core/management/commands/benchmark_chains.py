@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import rag_utils
+
+
+def _time_calls(func, iterations):
+    """Calls func repeatedly and returns per-call timings in microseconds."""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks the per-request cost of building LLM chains versus reusing them from the registry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Number of simulated requests per variant.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if not settings.GEMINI_API_KEY:
+            # Construction only validates that a key is present; no request is sent.
+            settings.GEMINI_API_KEY = 'benchmark-placeholder-key'
+
+        rag_utils.reset_chain_registry()
+
+        def per_request_rebuild():
+            # The previous behaviour: a new client, prompt and graph on every request.
+            rag_utils.build_rag_answer_chain(rag_utils.create_llm())
+            rag_utils.build_general_chain(rag_utils.create_llm())
+
+        def registry_reuse():
+            rag_utils.get_rag_chain()
+            rag_utils.get_general_chain()
+
+        results = {
+            'rebuild per request': _time_calls(per_request_rebuild, iterations),
+            'shared registry': _time_calls(registry_reuse, iterations),
+        }
+
+        self.stdout.write(f'Per-request chain setup overhead over {iterations} iterations (microseconds):')
+        for name, timings in results.items():
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(
+                f'  {name:<22} mean={statistics.mean(timings):>10.1f}  '
+                f'p50={statistics.median(timings):>10.1f}  p95={p95:>10.1f}'
+            )
+        self.stdout.write(self.style.WARNING(
+            'Connection reuse is not measured here: a rebuilt client also repeats its TLS handshake on the first call.'
+        ))
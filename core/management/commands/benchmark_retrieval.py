@@ -0,0 +1,225 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core import rag_utils
+from core.benchmarking import (
+    TOKEN_PATTERN, HashingEmbeddings, build_corpus_index, latency_summary, load_csv_corpus, use_corpus_index,
+)
+from core.vector_shards import shards_root
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def _rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _disk_bytes(path):
+    sizes = {'total': 0, 'vectors': 0}
+    for directory, _, names in os.walk(path):
+        for name in names:
+            size = os.path.getsize(os.path.join(directory, name))
+            sizes['total'] += size
+            if name.startswith('vectors'):
+                sizes['vectors'] += size
+    return sizes
+
+
+def _build_queries(videos, count, words, drop, rng):
+    """
+    Samples `count` queries, each a run of `words` consecutive words from one
+    transcript segment (and the ones after it), with a fraction `drop` of the
+    words removed. The target is the segment's start time.
+    """
+    queries = []
+    while len(queries) < count:
+        video = rng.choice(videos)
+        segments = video['segments']
+        i = rng.randrange(len(segments))
+        tokens = []
+        for _, _, content in segments[i:]:
+            tokens.extend(content.split())
+            if len(tokens) >= words:
+                break
+        tokens = [token for token in tokens[:words] if rng.random() >= drop]
+        if not any(TOKEN_PATTERN.search(token.lower()) for token in tokens):
+            continue
+        queries.append({
+            'video_id': video['video_id'],
+            'query': ' '.join(tokens),
+            'target': segments[i][0],
+        })
+    return queries
+
+
+def _hit_rank(starts_ends, target):
+    """1-based rank of the first result whose [start, end] covers the target, or None."""
+    for rank, (start, end) in enumerate(starts_ends, 1):
+        if start <= target <= end:
+            return rank
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds per-video indexes from media/transcripts/*.csv with deterministic hashing embeddings and '
+        'replays queries with known target timestamps, reporting build time, memory, latency and recall@k.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500, help='Number of queries to replay.')
+        parser.add_argument('--k', type=int, default=5, help='Results per query for recall@k.')
+        parser.add_argument('--words', type=int, default=8, help='Words per query, taken from the target segment.')
+        parser.add_argument('--drop', type=float, default=0.25,
+                            help='Fraction of query words removed, so queries are not verbatim.')
+        parser.add_argument('--dim', type=int, default=768, help='Hashing embedding dimension.')
+        parser.add_argument('--videos', type=int, help='Only index the first N transcript CSVs.')
+        parser.add_argument('--quantization', choices=['none', 'int8'], default='none')
+        parser.add_argument('--reranker', choices=['none', 'lexical', 'cross-encoder'],
+                            help='Reranker for the router search (default: RAG_RERANKER).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Optional path to write the results, including every query, as JSON.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k = options['k']
+        embeddings = HashingEmbeddings(dim=options['dim'])
+
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        videos = load_csv_corpus(limit=options['videos'])
+        if not videos:
+            self.stdout.write(self.style.ERROR('No transcript CSVs found under media/transcripts/.'))
+            return
+        read_seconds = time.perf_counter() - started
+        queries = _build_queries(videos, options['queries'], options['words'], options['drop'], rng)
+
+        reranker = options['reranker'] or getattr(settings, 'RAG_RERANKER', None) or 'none'
+        with tempfile.TemporaryDirectory(prefix='retrieval-benchmark-') as tmp, \
+                override_settings(RAG_RERANKER='' if reranker == 'none' else reranker):
+            embed_seconds, write_seconds = build_corpus_index(tmp, videos, embeddings, options['quantization'])
+            build = {
+                'videos': len(videos),
+                'chunks': sum(len(video['chunks']) for video in videos),
+                'read_and_chunk_seconds': round(read_seconds, 3),
+                'embed_seconds': round(embed_seconds, 3),
+                'write_seconds': round(write_seconds, 3),
+            }
+            memory = {'disk': _disk_bytes(shards_root(tmp))}
+
+            with use_corpus_index(tmp, videos, embeddings):
+                # Open every shard first so load time is not charged to the first query of each video.
+                started = time.perf_counter()
+                for video in videos:
+                    rag_utils.get_vector_store(video['video_id'])
+                build['open_seconds'] = round(time.perf_counter() - started, 3)
+                memory['rss_after_open_bytes'] = _rss_bytes()
+
+                modes = {'vector': self.vector_search, 'router': self.router_search}
+                records = {mode: [] for mode in modes}
+                for query in queries:
+                    store = rag_utils.get_vector_store(query['video_id'])
+                    for mode, search in modes.items():
+                        records[mode].append(search(store, query, k))
+
+        memory['rss_before_bytes'] = rss_before
+        memory['peak_rss_bytes'] = _peak_rss_bytes()
+
+        results = {
+            'config': {
+                'queries': len(queries), 'k': k, 'words': options['words'], 'drop': options['drop'],
+                'dim': options['dim'], 'quantization': options['quantization'], 'reranker': reranker,
+                'seed': options['seed'],
+            },
+            'build': build,
+            'memory': memory,
+            'modes': {mode: self.summarize(mode_records, k) for mode, mode_records in records.items()},
+        }
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({**results, 'queries': records}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    # --- Search modes ---
+    @staticmethod
+    def vector_search(store, query, k):
+        """Embedding plus nearest neighbours in the video's shard only."""
+        started = time.perf_counter()
+        vector = rag_utils.get_embedding_function().embed_query(query['query'])
+        indices, _ = store.search(vector, k)
+        ms = (time.perf_counter() - started) * 1000
+        documents = [store.document(i) for i in indices.tolist()]
+        return Command.record(query, documents, ms)
+
+    @staticmethod
+    def router_search(store, query, k):
+        """The search query_router runs for a RAG query: hybrid retrieval, rerank and threshold."""
+        started = time.perf_counter()
+        scored_docs = rag_utils.retrieve_documents(store, query['query'], k=k)
+        ms = (time.perf_counter() - started) * 1000
+        return Command.record(query, [doc for doc, _ in scored_docs], ms)
+
+    @staticmethod
+    def record(query, documents, ms):
+        return {
+            **query,
+            'ms': round(ms, 4),
+            'rank': _hit_rank([(doc.metadata['start'], doc.metadata['end']) for doc in documents], query['target']),
+            'results': len(documents),
+        }
+
+    @staticmethod
+    def summarize(records, k):
+        ranks = [record['rank'] for record in records]
+        return {
+            'latency': latency_summary([record['ms'] for record in records]),
+            'recall_at_1': round(sum(1 for rank in ranks if rank == 1) / len(ranks), 4),
+            f'recall_at_{k}': round(sum(1 for rank in ranks if rank is not None) / len(ranks), 4),
+            'mrr': round(sum(1 / rank for rank in ranks if rank is not None) / len(ranks), 4),
+            'empty_results': sum(1 for record in records if not record['results']),
+        }
+
+    def report(self, results):
+        build, memory, k = results['build'], results['memory'], results['config']['k']
+        self.stdout.write(
+            f"Built {build['chunks']} chunks from {build['videos']} transcripts: read+chunk "
+            f"{build['read_and_chunk_seconds']:.2f}s, embed {build['embed_seconds']:.2f}s, "
+            f"write {build['write_seconds']:.2f}s, open {build['open_seconds']:.2f}s."
+        )
+        disk = memory['disk']
+        rss = memory['rss_after_open_bytes']
+        self.stdout.write(
+            f"Index on disk: {disk['total'] / 1e6:.1f}MB ({disk['vectors'] / 1e6:.1f}MB vectors)"
+            + (f"; RSS after opening all shards {rss / 1e6:.1f}MB" if rss else '')
+        )
+        for mode, summary in results['modes'].items():
+            latency = summary['latency']
+            self.stdout.write(
+                f"  {mode:<7} recall@1={summary['recall_at_1']:.3f}  recall@{k}={summary[f'recall_at_{k}']:.3f}  "
+                f"mrr={summary['mrr']:.3f}  p50={latency['p50_ms']:.3f}ms  p95={latency['p95_ms']:.3f}ms  "
+                f"p99={latency['p99_ms']:.3f}ms  empty={summary['empty_results']}"
+            )
@@ -0,0 +1,190 @@
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from langchain_core.documents import Document
+
+from core.mmap_index import MmapVectorShard
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _smaps_rollup():
+    """Returns this process's (USS, PSS) in bytes from /proc/self/smaps_rollup."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+def _measure_in_worker(load, queries, k, conn):
+    before = _smaps_rollup()
+    search = load()
+    for query in queries:
+        search(query, k)
+    after = _smaps_rollup()
+    conn.send((after[0] - before[0], after[1] - before[1]))
+    conn.close()
+
+
+def _worker_memory(load, queries, k):
+    """
+    Forks a worker that opens an index with load() (which returns a
+    search(query, k) function) and replays the queries. Returns how much its
+    USS and PSS grew, in bytes, or (None, None) where smaps_rollup is missing.
+    Run it while this process has the same index open, as a second worker would.
+    """
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return None, None
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(target=_measure_in_worker, args=(load, queries, k, sender))
+    worker.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    finally:
+        worker.join()
+
+
+def _mb(value):
+    return 'n/a' if value is None else f'{value / 1e6:.1f}MB'
+
+
+def _recall(found, truth):
+    """Mean fraction of the true top-k neighbours present in each result list."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+class Command(BaseCommand):
+    help = 'Compares recall, latency and memory of the memory-mapped shard formats against an in-memory flat FAISS index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=20000, help='Number of synthetic vectors to index.')
+        parser.add_argument('--dim', type=int, default=768, help='Vector dimension (text-embedding-004 uses 768).')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries to replay.')
+        parser.add_argument('--k', type=int, default=5, help='Neighbours per query.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--ivfpq', action='store_true', help='Also measure a FAISS IVF-PQ index for reference.')
+        parser.add_argument('--output', help='Optional path to write the results as JSON.')
+
+    def handle(self, *args, **options):
+        n, dim, k = options['vectors'], options['dim'], options['k']
+        rng = np.random.default_rng(options['seed'])
+
+        # Clustered unit vectors roughly resemble sentence embeddings.
+        centers = rng.normal(size=(max(1, n // 50), dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[rng.integers(0, n, options['queries'])] + 0.3 * rng.normal(size=(options['queries'], dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        squared = (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+        truth = np.argsort(squared, axis=1)[:, :k]
+
+        results = []
+        try:
+            import faiss
+        except ImportError:
+            faiss = None
+            self.stdout.write(self.style.WARNING('faiss is not installed; skipping the flat FAISS baseline.'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            if faiss is not None:
+                flat = faiss.IndexFlatL2(dim)
+                flat.add(vectors)
+                results.append(self._measure_faiss(
+                    'faiss flat (current, heap)', flat, queries, k, truth, n * dim * 4, os.path.join(tmp, 'flat.faiss')
+                ))
+                if options['ivfpq']:
+                    nlist = max(1, int(np.sqrt(n)))
+                    m = next(m for m in (96, 64, 48, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+                    ivfpq = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, m, 8)
+                    ivfpq.train(vectors)
+                    ivfpq.add(vectors)
+                    ivfpq.nprobe = min(nlist, 16)
+                    results.append(self._measure_faiss(
+                        'faiss IVF-PQ (heap)', ivfpq, queries, k, truth, n * m + nlist * dim * 4,
+                        os.path.join(tmp, 'ivfpq.faiss')
+                    ))
+
+            documents = [
+                Document(page_content=f'chunk {i}', metadata={'start': float(i), 'end': float(i + 1)}) for i in range(n)
+            ]
+            ids = [str(i) for i in range(n)]
+            for quantization in ('none', 'int8'):
+                path = os.path.join(tmp, quantization)
+                MmapVectorShard.write(path, vectors, documents, ids, quantization=quantization)
+                shard = MmapVectorShard(path)
+                found, timings = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    indices, _ = shard.search(query, k)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    found.append(indices)
+                # This process keeps the shard mapped, so the worker's pages
+                # come from the shared page cache as they would in production.
+                private_bytes, pss_bytes = _worker_memory(lambda: MmapVectorShard(path).search, queries, k)
+                results.append({
+                    'index': f'mmap {quantization} (shared page cache)',
+                    'recall_at_k': _recall(found, truth),
+                    'p50_ms': statistics.median(timings),
+                    'mean_ms': statistics.mean(timings),
+                    'vector_bytes': os.path.getsize(os.path.join(path, 'vectors.npy')),
+                    'disk_bytes': _directory_size(path),
+                    'private_bytes_per_worker': private_bytes,
+                    'pss_bytes_per_worker': pss_bytes,
+                })
+                del shard
+
+        self.stdout.write(f'{n} vectors x {dim} dims, {len(queries)} queries, recall@{k} against exact search:')
+        for row in results:
+            self.stdout.write(
+                f"  {row['index']:<36} recall={row['recall_at_k']:.3f}  p50={row['p50_ms']:.2f}ms  "
+                f"vectors={row['vector_bytes'] / 1e6:.1f}MB  private/worker={_mb(row['private_bytes_per_worker'])}  "
+                f"pss/worker={_mb(row['pss_bytes_per_worker'])}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'vectors': n, 'dim': dim, 'k': k, 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _measure_faiss(self, name, index, queries, k, truth, vector_bytes, path):
+        import faiss
+
+        timings, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, indices = index.search(query[None, :], k)
+            timings.append((time.perf_counter() - started) * 1000)
+            found.append(indices[0])
+        # Workers load the index from disk, as the FAISS shards were loaded.
+        faiss.write_index(index, path)
+
+        def load():
+            loaded = faiss.read_index(path)
+            return lambda query, k: loaded.search(query[None, :], k)
+
+        private_bytes, pss_bytes = _worker_memory(load, queries, k)
+        return {
+            'index': name,
+            'recall_at_k': _recall(found, truth),
+            'p50_ms': statistics.median(timings),
+            'mean_ms': statistics.mean(timings),
+            'vector_bytes': vector_bytes,
+            'disk_bytes': os.path.getsize(path),
+            'private_bytes_per_worker': private_bytes,
+            'pss_bytes_per_worker': pss_bytes,
+        }
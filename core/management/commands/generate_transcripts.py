@@ -1,110 +1,286 @@
+import glob
+import multiprocessing
 import os
-import re
-import csv
-import whisper
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
 import yt_dlp
-from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection
+from core.audio_cache import get_audio_cache
 from core.models import Video, Transcript
+from core.transcription import (
+    DEFAULT_MODEL_NAME, MAX_PIECE_SECONDS, init_worker, plan_pieces, stitch, threads_per_worker,
+    transcribe_file, transcribe_piece,
+)
 
-def sanitize_filename(title):
-    """Sanitizes a string to be used as a valid filename or directory name."""
-    return re.sub(r'[\\/*?:"<>|]', "", title)
+DEFAULT_DOWNLOAD_WORKERS = 4
 
 class Command(BaseCommand):
     help = 'Downloads new YouTube videos, transcribes them using Whisper, and saves them to the core_transcript table.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=DEFAULT_MODEL_NAME, help='Whisper model to load in each worker.')
+        parser.add_argument('--download-workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                            help='Parallel audio downloads.')
+        parser.add_argument('--transcribe-workers', type=int, default=os.cpu_count() or 1,
+                            help='Whisper worker processes (default: one per CPU core).')
+        parser.add_argument('--max-pending', type=int,
+                            help='Videos allowed between download and the database write at once '
+                                 '(default: the larger of --download-workers and 2 x --transcribe-workers).')
+        parser.add_argument('--audio-dir',
+                            help='Use local <youtube_id>.* audio files from this directory instead of downloading.')
+        parser.add_argument('--split-on-silence', action='store_true',
+                            help='Split each recording at silences and transcribe the pieces in parallel. '
+                                 'Uses every worker on a single long lecture.')
+        parser.add_argument('--max-piece-seconds', type=float, default=MAX_PIECE_SECONDS,
+                            help='Longest piece produced by --split-on-silence.')
+
     def handle(self, *args, **options):
         self.stdout.write('Starting transcript generation process...')
 
-        videos_to_process = Video.objects.filter(transcripts__isnull=True).distinct()
-        
+        videos_to_process = list(Video.objects.filter(transcripts__isnull=True).distinct().select_related('course'))
+
         if not videos_to_process:
             self.stdout.write(self.style.SUCCESS('All videos already have transcripts. No new transcripts to generate.'))
             return
 
-        self.stdout.write(f'Found {videos_to_process.count()} videos without transcripts.')
+        self.stdout.write(f'Found {len(videos_to_process)} videos without transcripts.')
+
+        # Three stages connected by futures and a queue:
+        #   download threads -> Whisper worker processes -> one DB writer thread.
+        # Every video holds a slot from download until its transcript is saved,
+        # so downloads never run more than max_pending videos ahead.
+        download_workers = max(1, options['download_workers'])
+        transcribe_workers = max(1, options['transcribe_workers'])
+        max_pending = options['max_pending'] or max(download_workers, 2 * transcribe_workers)
+        self.timings = {'download': [], 'split': [], 'transcribe': [], 'write': []}
+        self.audio_dir = options['audio_dir']
+        self.split = options['split_on_silence']
+        self.max_piece_seconds = options['max_piece_seconds']
+        # Audio is kept in the cache across runs, so a rerun after a crash
+        # skips every download that already finished.
+        self.audio_cache = get_audio_cache()
+        self.run_started = time.time()
+        # Pipeline threads and callbacks queue their messages; only this
+        # thread writes them to stdout.
+        self.messages = queue.Queue()
+        self.report = self.messages.put
+
+        slots = threading.BoundedSemaphore(max_pending)
+        write_queue = queue.Queue()
+        writer = threading.Thread(target=self.write_transcripts, args=(write_queue, slots), daemon=True)
+        writer.start()
+
+        pipeline_started = time.perf_counter()
+        # Whisper workers are spawned, not forked: this process already runs threads.
+        with ProcessPoolExecutor(
+            max_workers=transcribe_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(options['model'], threads_per_worker(transcribe_workers)),
+        ) as transcribers, ThreadPoolExecutor(max_workers=download_workers) as downloads:
+            for video in videos_to_process:
+                self.wait_for_slot(slots)
+                future = downloads.submit(self.download_video, video)
+                future.add_done_callback(partial(self.on_downloaded, video, transcribers, write_queue, slots))
+            # Split videos submit their pieces from callbacks, so the Whisper
+            # pool has to stay open until every video has given back its slot.
+            for _ in range(max_pending):
+                self.wait_for_slot(slots)
+        write_queue.put(None)
+        writer.join()
+        self.flush_messages()
+        evicted = self.audio_cache.evict()
+        if evicted:
+            self.stdout.write(f'Evicted {evicted} files from the audio cache.')
+
+        self.report_timings(time.perf_counter() - pipeline_started)
+        self.stdout.write(self.style.SUCCESS('\nFinished transcript generation process.'))
+
+    def wait_for_slot(self, slots):
+        """Takes a slot, writing out pipeline messages while waiting for one."""
+        while not slots.acquire(timeout=0.1):
+            self.flush_messages()
+        self.flush_messages()
 
-        # Load the Whisper model once
+    def flush_messages(self):
+        while True:
+            try:
+                self.stdout.write(self.messages.get_nowait())
+            except queue.Empty:
+                return
+
+    # --- Pipeline stages ---
+    def on_downloaded(self, video, transcribers, write_queue, slots, future):
+        """Hands a downloaded file to the Whisper pool, whole or to be split first."""
         try:
-            whisper_model = whisper.load_model("base")
+            video_path = future.result()
+            if not video_path:
+                slots.release()
+                return
+            if self.split:
+                # Decoding happens in the workers: a decoded 80-minute lecture
+                # is about 300MB, too much to hold per pending video here.
+                planning = transcribers.submit(plan_pieces, video_path, self.max_piece_seconds)
+                planning.add_done_callback(
+                    partial(self.on_planned, video, video_path, transcribers, write_queue, slots))
+                return
+            transcription = transcribers.submit(transcribe_file, video_path)
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Failed to load Whisper model: {e}"))
+            self.report(self.style.ERROR(f'  -> Could not queue "{video.title}" for transcription: {e}'))
+            slots.release()
             return
+        transcription.add_done_callback(partial(self.on_transcribed, video, video_path, write_queue, slots))
 
-        for video in videos_to_process:
-            self.stdout.write(f'\n--- Processing video: "{video.title}" ---')
+    def on_planned(self, video, video_path, transcribers, write_queue, slots, future):
+        """Queues the pieces of a split recording; each worker decodes only its piece."""
+        try:
+            pieces, seconds = future.result()
+        except Exception as e:
+            self.report(self.style.ERROR(f'  -> Error splitting audio for "{video.title}": {e}'))
+            slots.release()
+            return
+        if not pieces:
+            self.report(self.style.WARNING(f'  -> No audio decoded for "{video.title}". Skipping.'))
+            slots.release()
+            return
+        self.timings['split'].append(seconds)
+        self.report(f'  -> Split "{video.title}" into {len(pieces)} pieces.')
 
-            # 1. Download Video
-            video_path = self.download_video(video)
-            if not video_path:
-                continue
+        job = {'video': video, 'path': video_path, 'remaining': len(pieces), 'results': [],
+               'failed': False, 'lock': threading.Lock()}
+        submitted = 0
+        try:
+            for offset, duration in pieces:
+                transcribers.submit(transcribe_piece, video_path, offset, duration).add_done_callback(
+                    partial(self.on_piece_transcribed, job, offset, write_queue, slots))
+                submitted += 1
+        except Exception as e:
+            self.report(self.style.ERROR(f'  -> Could not queue "{video.title}" for transcription: {e}'))
+            with job['lock']:
+                job['failed'] = True
+                job['remaining'] -= len(pieces) - submitted
+                done = not job['remaining']
+            if done:
+                slots.release()
 
-            # 2. Transcribe Video
-            transcript_data = self.transcribe_with_whisper(video_path, whisper_model)
-            if not transcript_data:
-                continue
+    def on_transcribed(self, video, video_path, write_queue, slots, future):
+        try:
+            transcript_data, seconds = future.result()
+        except Exception as e:
+            self.report(self.style.ERROR(f'  -> Error transcribing "{video.title}": {e}'))
+            slots.release()
+            return
+        self.timings['transcribe'].append(seconds)
+        self.report(self.style.SUCCESS(f'  -> Transcribed "{video.title}" in {seconds:.1f}s.'))
+        write_queue.put((video, video_path, transcript_data))
 
-            # 3. Save Transcript to Database
-            self.save_transcript_to_db(transcript_data, video)
-            
-            # 4. (Optional) Clean up downloaded video file
-            try:
-                os.remove(video_path)
-                self.stdout.write(self.style.SUCCESS(f'  -> Cleaned up downloaded file: {os.path.basename(video_path)}'))
-            except OSError as e:
-                self.stdout.write(self.style.WARNING(f'  -> Could not remove video file: {e}'))
+    def on_piece_transcribed(self, job, offset, write_queue, slots, future):
+        """Collects piece results; the last piece stitches them and queues the write."""
+        video = job['video']
+        try:
+            segments, seconds = future.result()
+        except Exception as e:
+            self.report(self.style.ERROR(f'  -> Error transcribing a piece of "{video.title}": {e}'))
+            segments, seconds = None, 0.0
+        with job['lock']:
+            if segments is None:
+                job['failed'] = True
+            else:
+                job['results'].append((offset, segments, seconds))
+            job['remaining'] -= 1
+            if job['remaining']:
+                return
+        if job['failed']:
+            slots.release()
+            return
+        seconds = sum(s for _, _, s in job['results'])
+        self.timings['transcribe'].append(seconds)
+        self.report(self.style.SUCCESS(
+            f'  -> Transcribed "{video.title}" ({len(job["results"])} pieces, {seconds:.1f}s of worker time).'))
+        write_queue.put((video, job['path'], stitch([(o, segs) for o, segs, _ in job['results']])))
 
-        self.stdout.write(self.style.SUCCESS('\nFinished transcript generation process.'))
+    def write_transcripts(self, write_queue, slots):
+        """DB writer thread: saves finished transcripts one at a time."""
+        try:
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    return
+                video, video_path, transcript_data = item
+                # The slot goes back whatever happens; the main thread waits
+                # for every slot before it shuts the pipeline down.
+                try:
+                    started = time.perf_counter()
+                    self.save_transcript_to_db(transcript_data, video)
+                    self.timings['write'].append(time.perf_counter() - started)
+                    # Only audio not touched by this run may be evicted mid-run.
+                    self.audio_cache.evict(used_before=self.run_started)
+                except Exception as e:
+                    self.report(self.style.ERROR(f'  -> Error writing transcript for "{video.title}": {e}'))
+                finally:
+                    slots.release()
+        finally:
+            connection.close()
+
+    def report_timings(self, wall_seconds):
+        self.stdout.write(f'\nPipeline finished in {wall_seconds:.1f}s wall clock.')
+        for stage, seconds in self.timings.items():
+            if seconds:
+                self.stdout.write(
+                    f'  {stage:<10} {len(seconds):>4} videos  total {sum(seconds):.1f}s  '
+                    f'mean {sum(seconds) / len(seconds):.1f}s'
+                )
 
     def download_video(self, video):
         """Downloads a video file for a given Video object."""
-        self.stdout.write('  -> Downloading video...')
-        course_dir = sanitize_filename(video.course.title)
-        download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads', course_dir)
-        os.makedirs(download_dir, exist_ok=True)
-        
-        output_template = os.path.join(download_dir, f'{video.youtube_id}.%(ext)s')
+        started = time.perf_counter()
+        if self.audio_dir:
+            matches = sorted(glob.glob(os.path.join(self.audio_dir, f'{glob.escape(video.youtube_id)}.*')))
+            if not matches:
+                self.report(self.style.WARNING(f'  -> No local audio for "{video.title}". Skipping.'))
+                return None
+            self.timings['download'].append(time.perf_counter() - started)
+            return matches[0]
 
+        cached_path = self.audio_cache.get(video.youtube_id)
+        if cached_path:
+            self.timings['download'].append(time.perf_counter() - started)
+            self.report(f'  -> Using cached audio for "{video.title}".')
+            return cached_path
+
+        self.report(f'  -> Downloading "{video.title}"...')
+        # The native audio stream is kept as-is: Whisper decodes it through
+        # ffmpeg, so an MP3 transcode would only cost time.
         ydl_opts = {
             'format': 'bestaudio/best',
-            'outtmpl': output_template,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
+            'outtmpl': self.audio_cache.output_template(video.youtube_id),
+            'quiet': True,
+            # Keep the download time as mtime; the cache uses it for LRU order.
+            'updatetime': False,
         }
 
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(video.video_url, download=True)
-                # The final path will have the .mp3 extension after post-processing
-                final_filepath = os.path.join(download_dir, f'{video.youtube_id}.mp3')
+                final_filepath = ydl.prepare_filename(info)
                 if os.path.exists(final_filepath):
-                    self.stdout.write(self.style.SUCCESS(f'  -> Video downloaded successfully: {os.path.basename(final_filepath)}'))
+                    self.timings['download'].append(time.perf_counter() - started)
+                    self.report(self.style.SUCCESS(f'  -> Video downloaded successfully: {os.path.basename(final_filepath)}'))
                     return final_filepath
                 else:
-                    self.stdout.write(self.style.ERROR('  -> Downloaded file not found after processing.'))
+                    self.report(self.style.ERROR('  -> Downloaded file not found after processing.'))
                     return None
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'  -> Error downloading video: {e}'))
-            return None
-
-    def transcribe_with_whisper(self, audio_path, model):
-        """Transcribes an audio file using the pre-loaded Whisper model."""
-        self.stdout.write('  -> Transcribing with Whisper...')
-        try:
-            result = model.transcribe(audio_path, fp16=False)
-            self.stdout.write(self.style.SUCCESS('  -> Transcription successful.'))
-            return result.get('segments', [])
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'  -> Error during transcription: {e}'))
+            self.report(self.style.ERROR(f'  -> Error downloading video: {e}'))
             return None
 
     def save_transcript_to_db(self, transcript_data, video):
         """Saves transcript segments to the core_transcript table."""
-        self.stdout.write('  -> Saving transcript to database...')
         try:
             lines_to_create = []
             for segment in transcript_data:
@@ -113,12 +289,13 @@ class Command(BaseCommand):
                         video=video,
                         course=video.course,
                         start=segment['start'],
+                        duration=segment['end'] - segment['start'],
                         content=segment['text'].strip()
                     )
                 )
-            
+
             if lines_to_create:
                 Transcript.objects.bulk_create(lines_to_create)
-                self.stdout.write(self.style.SUCCESS(f'  -> Saved {len(lines_to_create)} transcript lines.'))
+                self.report(self.style.SUCCESS(f'  -> Saved {len(lines_to_create)} transcript lines for "{video.title}".'))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'  -> Error saving to database: {e}'))
\ No newline at end of file
+            self.report(self.style.ERROR(f'  -> Error saving to database: {e}'))
@@ -1,13 +1,24 @@
 from django.core.management.base import BaseCommand
-from core.rag_utils import create_or_update_vector_store
+from core.ingestion import create_or_update_vector_store
 
 class Command(BaseCommand):
     help = 'Loads video transcripts, creates embeddings, and stores them in the vector database.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Ignore the ingestion manifest and re-embed every video.'
+        )
+
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting the transcript ingestion process...'))
         try:
-            create_or_update_vector_store()
-            self.stdout.write(self.style.SUCCESS('Successfully ingested all transcripts into the vector store.'))
+            stats = create_or_update_vector_store(rebuild=options['rebuild'], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully synced the vector store: {stats['added']} added, {stats['updated']} updated, "
+                f"{stats['removed']} removed, {stats['skipped']} unchanged."
+            ))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'An error occurred during ingestion: {e}'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'An error occurred during ingestion: {e}'))
+            self.stdout.write(self.style.WARNING('Progress up to the last completed video was saved. Re-run to resume.'))
@@ -1,60 +1,110 @@
-
 import json
 from django.core.management.base import BaseCommand
-from django.db import connection
+from django.db import connection, transaction
 from core.models import Course, Video
+from core.playlist import bump_playlist_version
 
 class Command(BaseCommand):
-    help = 'Loads courses and videos from a JSON file into the database.'
-
-    def handle(self, *args, **options):
-        self.stdout.write('Clearing all existing course-related data...')
-        Video.objects.all().delete()
-        Course.objects.all().delete()
-        self.stdout.write(self.style.SUCCESS('Successfully cleared old data.'))
+    help = 'Loads courses and videos from a JSON file into the database, updating only what changed.'
 
-        self.stdout.write('Resetting database auto-increment counters...')
-        with connection.cursor() as cursor:
-            cursor.execute("ALTER TABLE core_course AUTO_INCREMENT = 1;")
-            cursor.execute("ALTER TABLE core_video AUTO_INCREMENT = 1;")
-        self.stdout.write(self.style.SUCCESS('Successfully reset counters.'))
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default='courses.json', help='Path of the catalogue JSON file.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete courses and videos missing from the file. This also deletes their '
+                                 'transcripts, notes and enrollments.')
 
+    def handle(self, *args, **options):
         try:
-            with open('courses.json', 'r') as f:
+            with open(options['file'], 'r') as f:
                 courses_data = json.load(f)
         except FileNotFoundError:
-            self.stdout.write(self.style.ERROR('courses.json not found in the root directory.'))
+            self.stdout.write(self.style.ERROR(f"{options['file']} not found."))
             return
         except json.JSONDecodeError:
-            self.stdout.write(self.style.ERROR('Error decoding courses.json. Please check its format.'))
+            self.stdout.write(self.style.ERROR(f"Error decoding {options['file']}. Please check its format."))
             return
 
+        # Rows are matched on course title and video youtube_id, so existing
+        # ids (and the notes, enrollments and embeddings that point at them)
+        # survive a reload.
+        with transaction.atomic():
+            courses = self.sync_courses(courses_data)
+            self.sync_videos(courses_data, courses)
+            if options['prune']:
+                self.prune(courses_data)
+
+        self.stdout.write(self.style.SUCCESS('Finished loading all courses and videos.'))
+
+    def sync_courses(self, courses_data):
+        """Creates new courses and updates changed ones. Returns {title: course}."""
+        existing = {course.title: course for course in Course.objects.all()}
+        to_create, to_update = [], []
         for course_data in courses_data:
-            # Use 'title' to find the course, as it's unique
-            course, created = Course.objects.update_or_create(
-                title=course_data['title'],
-                defaults={
-                    'description': course_data.get('description', ''),
-                    'image_url': course_data.get('image_url', '')
-                }
-            )
+            fields = {
+                'description': course_data.get('description', ''),
+                'image_url': course_data.get('image_url', ''),
+            }
+            course = existing.get(course_data['title'])
+            if course is None:
+                to_create.append(Course(title=course_data['title'], **fields))
+            elif any(getattr(course, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(course, name, value)
+                to_update.append(course)
+
+        if to_create:
+            Course.objects.bulk_create(to_create)
+            # MySQL does not return the new primary keys from a bulk insert.
+            existing.update({c.title: c for c in Course.objects.filter(title__in=[c.title for c in to_create])})
+        if to_update:
+            Course.objects.bulk_update(to_update, ['description', 'image_url'])
+            # Bulk writes do not send the signals that invalidate cached playlists.
+            for course in to_update:
+                bump_playlist_version(course.id)
 
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Created course: "{course.title}"'))
-            else:
-                self.stdout.write(self.style.WARNING(f'Updated course: "{course.title}"'))
+        for course in to_create:
+            self.stdout.write(self.style.SUCCESS(f'Created course: "{course.title}"'))
+        for course in to_update:
+            self.stdout.write(self.style.WARNING(f'Updated course: "{course.title}"'))
+        return existing
 
+    def sync_videos(self, courses_data, courses):
+        """Upserts only the videos that are new or whose fields changed."""
+        existing = {
+            youtube_id: (course_id, title, video_url)
+            for youtube_id, course_id, title, video_url
+            in Video.objects.values_list('youtube_id', 'course_id', 'title', 'video_url')
+        }
+        changed, total = [], 0
+        for course_data in courses_data:
+            course = courses[course_data['title']]
             for video_data in course_data.get('videos', []):
-                # Use 'youtube_id' to find the video, as it's unique
-                video, v_created = Video.objects.update_or_create(
-                    youtube_id=video_data['video_id'],
-                    defaults={
-                        'course': course,
-                        'title': video_data.get('title', 'Untitled Video'),
-                        'video_url': f"https://www.youtube.com/watch?v={video_data['video_id']}"
-                    }
-                )
-                if v_created:
-                    self.stdout.write(f'  - Added video: "{video.title}"')
-
-        self.stdout.write(self.style.SUCCESS('Finished loading all courses and videos.'))
\ No newline at end of file
+                youtube_id = video_data['video_id']
+                total += 1
+                row = (course.id, video_data.get('title', 'Untitled Video'), f"https://www.youtube.com/watch?v={youtube_id}")
+                if existing.get(youtube_id) != row:
+                    changed.append(Video(youtube_id=youtube_id, course_id=row[0], title=row[1], video_url=row[2]))
+
+        if changed:
+            # MySQL upserts on any unique key and rejects an explicit target.
+            unique_fields = ['youtube_id'] if connection.features.supports_update_conflicts_with_target else None
+            Video.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=['course', 'title', 'video_url'],
+            )
+            moved_from = {existing[v.youtube_id][0] for v in changed if v.youtube_id in existing}
+            for course_id in moved_from | {v.course_id for v in changed}:
+                bump_playlist_version(course_id)
+        for video in changed:
+            action = 'Updated' if video.youtube_id in existing else 'Added'
+            self.stdout.write(f'  - {action} video: "{video.title}"')
+        self.stdout.write(f'{len(changed)} videos added or updated, {total - len(changed)} unchanged.')
+
+    def prune(self, courses_data):
+        youtube_ids = {v['video_id'] for c in courses_data for v in c.get('videos', [])}
+        titles = {c['title'] for c in courses_data}
+        videos_deleted, _ = Video.objects.exclude(youtube_id__in=youtube_ids).delete()
+        courses_deleted, _ = Course.objects.exclude(title__in=titles).delete()
+        self.stdout.write(self.style.WARNING(f'Pruned rows no longer in the catalogue ({videos_deleted + courses_deleted} rows including cascades).'))
@@ -1,70 +1,122 @@
 import os
 import csv
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
 from core.models import Video, Transcript
 
+BATCH_SIZE = 2000
+DEFAULT_WORKERS = 4
+
 class Command(BaseCommand):
     help = 'Populates the database with new transcripts, skipping videos that already have them.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT.')
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Courses loaded in parallel.')
+
     def handle(self, *args, **options):
         self.stdout.write('Starting smart transcript population...')
-        videos_to_process = Video.objects.all()
-        self.stdout.write(f'Found {videos_to_process.count()} videos to check.')
-
-        for video in videos_to_process:
-            if Transcript.objects.filter(video=video).exists():
-                self.stdout.write(self.style.SUCCESS(f'Transcripts for "{video.title}" already exist. Skipping.'))
-                continue
-
-            self.stdout.write(f'Populating transcripts for "{video.title}"...')
-            file_path = os.path.join(settings.MEDIA_ROOT, 'transcripts', video.course.title, f'{video.youtube_id}.csv')
-            
-            if not os.path.exists(file_path):
-                self.stdout.write(self.style.WARNING(f'  -> CSV file not found. Skipping.'))
-                continue
-
-            try:
-                lines_to_create = []
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    reader = csv.reader(f)
-                    try:
-                        next(reader)
-                    except StopIteration:
-                        self.stdout.write(self.style.WARNING(f'  -> File is empty. Skipping.'))
-                        continue
-
-                    for i, row in enumerate(reader):
-                        start_str = None
-                        content = None
-                        
-                        if len(row) == 3:
-                            start_str, _, content = row
-                        elif len(row) == 2:
-                            start_str, content = row
-                        else:
-                            self.stdout.write(self.style.WARNING(f'  -> Skipping malformed row {i+2}. Expected 2 or 3 columns, found {len(row)}.'))
-                            continue
-                        
-                        try:
-                            start_time = float(start_str)
-                            lines_to_create.append(
-                                Transcript(
-                                    video=video,
-                                    course=video.course,
-                                    start=start_time,
-                                    content=content.strip()
-                                )
-                            )
-                        except (ValueError, TypeError):
-                            self.stdout.write(self.style.WARNING(f'  -> Could not parse start time "{start_str}" on row {i+2}. Skipping.'))
-                
-                if lines_to_create:
-                    Transcript.objects.bulk_create(lines_to_create)
-                    self.stdout.write(self.style.SUCCESS(f'  -> Successfully populated transcript.'))
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  -> Failed to process transcript: {e}'))
+        self.batch_size = options['batch_size']
+
+        # One anti-join finds every video without transcripts, with its course.
+        videos_to_process = list(
+            Video.objects
+            .filter(~Exists(Transcript.objects.filter(video=OuterRef('pk'))))
+            .select_related('course')
+            .order_by('course_id', 'id')
+        )
+        self.stdout.write(f'Found {len(videos_to_process)} videos without transcripts.')
+
+        courses = [list(videos) for _, videos in groupby(videos_to_process, key=lambda v: v.course_id)]
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            # Workers collect their messages; only this thread writes to stdout.
+            for lines in pool.map(self.populate_course, courses):
+                for line in lines:
+                    self.stdout.write(line)
 
         self.stdout.write(self.style.SUCCESS('Finished transcript population check.'))
 
+    def populate_course(self, videos):
+        """Worker: loads the CSVs of one course's videos and returns the lines to report."""
+        lines = []
+        try:
+            for video in videos:
+                self.populate_video(video, lines.append)
+        finally:
+            # Each worker thread has its own database connection.
+            connection.close()
+        return lines
+
+    def populate_video(self, video, report):
+        file_path = os.path.join(settings.MEDIA_ROOT, 'transcripts', video.course.title, f'{video.youtube_id}.csv')
+
+        if not os.path.exists(file_path):
+            report(self.style.WARNING(f'  -> CSV file for "{video.title}" not found. Skipping.'))
+            return
+
+        try:
+            created = 0
+            # A video's rows go in all together or not at all; a half-loaded
+            # transcript would be skipped by the next run.
+            with transaction.atomic():
+                rows = self.read_transcript_rows(file_path, video, report)
+                while True:
+                    batch = list(islice(rows, self.batch_size))
+                    if not batch:
+                        break
+                    Transcript.objects.bulk_create(batch)
+                    created += len(batch)
+            if created:
+                report(self.style.SUCCESS(f'  -> Populated {created} lines for "{video.title}".'))
+            else:
+                report(self.style.WARNING(f'  -> No transcript lines for "{video.title}". Skipping.'))
+        except Exception as e:
+            report(self.style.ERROR(f'  -> Failed to process transcript for "{video.title}": {e}'))
+
+    def read_transcript_rows(self, file_path, video, report):
+        """
+        Yields unsaved Transcript objects for each CSV row with a valid start
+        time. A missing or unparsable duration is stored as None.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            if next(reader, None) is None:
+                return
+
+            for i, row in enumerate(reader):
+                start_str = None
+                duration_str = None
+                content = None
+
+                if len(row) == 3:
+                    start_str, duration_str, content = row
+                elif len(row) == 2:
+                    start_str, content = row
+                else:
+                    report(self.style.WARNING(f'  -> Skipping malformed row {i+2} of {video.youtube_id}. Expected 2 or 3 columns, found {len(row)}.'))
+                    continue
+
+                try:
+                    start_time = float(start_str)
+                except (ValueError, TypeError):
+                    report(self.style.WARNING(f'  -> Could not parse start time "{start_str}" on row {i+2} of {video.youtube_id}. Skipping.'))
+                    continue
+
+                duration = None
+                if duration_str:
+                    try:
+                        duration = float(duration_str)
+                    except ValueError:
+                        report(self.style.WARNING(f'  -> Could not parse duration "{duration_str}" on row {i+2} of {video.youtube_id}. Keeping the line without it.'))
+
+                yield Transcript(
+                    video_id=video.id,
+                    course_id=video.course_id,
+                    start=start_time,
+                    duration=duration,
+                    content=content.strip()
+                )
@@ -0,0 +1,183 @@
+# core/metrics.py
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+
+# --- Constants ---
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestMetrics:
+    """Costs accumulated while handling one request."""
+
+    __slots__ = ('db_queries', 'db_seconds', 'template_seconds', 'stages')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.stages = {}
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def start_request():
+    """Starts collecting for the current context. Returns (metrics, token for end_request)."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+# --- Process-wide registry ---
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and latency histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.total, h.count)) for key, h in self._histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+registry = Registry()
+
+
+# --- Stage timing ---
+def record_stage(name, seconds):
+    """Adds time spent in a named stage (embed, search, llm, ...) to the request and the registry."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.stages[name] = metrics.stages.get(name, 0.0) + seconds
+    registry.observe('incuisenix_stage_seconds', {'stage': name}, seconds)
+
+
+# --- Database and template hooks ---
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_seconds += time.perf_counter() - started
+
+
+def _install_db_wrapper(sender, connection, **kwargs):
+    # Installed once per connection object, for every thread, so queries run
+    # through sync_to_async are counted too. Outside a request it only reads
+    # a context variable.
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Hooks query and template timing into Django. Safe to call more than once."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        from django.db import connections
+        from django.template.backends.django import Template
+
+        connection_created.connect(_install_db_wrapper, dispatch_uid='incuisenix_metrics_db')
+        for connection in connections.all(initialized_only=True):
+            _install_db_wrapper(None, connection)
+
+        # Top-level renders only; included templates are counted inside them.
+        render = Template.render
+
+        def timed_render(self, *args, **kwargs):
+            metrics = _current.get()
+            if metrics is None:
+                return render(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return render(self, *args, **kwargs)
+            finally:
+                metrics.template_seconds += time.perf_counter() - started
+
+        Template.render = timed_render
+        _installed = True
@@ -0,0 +1,91 @@
+# core/middleware.py
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget."""
+
+
+class MetricsMiddleware:
+    """
+    Measures every request: total time, database queries and their time,
+    template rendering and the assistant's stages (tracing.stage spans).
+    Results go to a Server-Timing header and to the process registry served
+    at /metrics/.
+
+    QUERY_BUDGETS maps URL names to a maximum query count. Going over it logs
+    a warning, or raises QueryBudgetExceeded when QUERY_BUDGETS_STRICT is set
+    (as in tests). Time spent streaming a response body after the view
+    returns only reaches the registry.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.strict = getattr(settings, 'QUERY_BUDGETS_STRICT', False)
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+        metrics.install()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, request_metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, request_metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, request_metrics, seconds):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        labels = {'view': view}
+
+        registry = metrics.registry
+        registry.inc('incuisenix_requests_total', {'view': view, 'status': str(response.status_code)})
+        registry.observe('incuisenix_request_seconds', labels, seconds)
+        registry.inc('incuisenix_db_queries_total', labels, request_metrics.db_queries)
+        registry.observe('incuisenix_db_seconds', labels, request_metrics.db_seconds)
+        if request_metrics.template_seconds:
+            registry.observe('incuisenix_template_seconds', labels, request_metrics.template_seconds)
+
+        if self.server_timing:
+            entries = [
+                f'db;dur={request_metrics.db_seconds * 1000:.1f};desc="{request_metrics.db_queries} queries"',
+                f'tpl;dur={request_metrics.template_seconds * 1000:.1f}',
+            ]
+            entries += [f'{name};dur={value * 1000:.1f}' for name, value in request_metrics.stages.items()]
+            entries.append(f'total;dur={seconds * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+
+        budget = self.budgets.get(view)
+        if budget is not None and request_metrics.db_queries > budget:
+            message = f"View '{view}' ran {request_metrics.db_queries} queries; its budget is {budget}."
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
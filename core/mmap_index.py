@@ -0,0 +1,144 @@
+# core/mmap_index.py
+
+import json
+import math
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .lexical_index import LexicalIndex
+
+# --- Constants ---
+HEADER_FILENAME = 'header.json'
+FORMAT_VERSION = 1
+QUANTIZATION_CHOICES = ('none', 'int8')
+# Rows scored per block when dequantizing int8 codes, to bound temporary memory.
+SEARCH_BLOCK_ROWS = 4096
+
+
+class MmapVectorShard:
+    """
+    Read-only vector shard stored as plain .npy arrays plus a JSON header.
+
+    Every array is opened with mmap_mode='r', so the OS page cache holds a
+    single copy shared by all worker processes instead of one heap copy each.
+    Vectors are stored as float32 or as int8 codes with a per-dimension scale.
+    Chunk texts live in one UTF-8 blob sliced by an offsets array; a Document
+    is only built for the hits a search returns. A BM25 index over the same
+    chunks (see lexical_index.py) is stored alongside.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILENAME), 'r', encoding='utf-8') as f:
+            self.header = json.load(f)
+        self.quantization = self.header['quantization']
+        self.ids = self.header['ids']
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        self.vectors = load('vectors.npy')
+        self.norms = load('norms.npy')
+        self.starts = load('starts.npy')
+        self.ends = load('ends.npy')
+        self.offsets = load('offsets.npy')
+        self.scales = load('scales.npy') if self.quantization == 'int8' else None
+        # np.memmap cannot map an empty file.
+        self.texts = np.memmap(os.path.join(path, 'texts.bin'), dtype=np.uint8, mode='r') \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self.lexical = LexicalIndex(path) if LexicalIndex.exists(path) else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Writing ---
+    @staticmethod
+    def write(path, vectors, documents, ids, quantization='none'):
+        """Writes vectors (n x d) and their documents to a new shard directory."""
+        if quantization not in QUANTIZATION_CHOICES:
+            raise ValueError(f"Unknown quantization '{quantization}'. Choose from {QUANTIZATION_CHOICES}.")
+        if not documents:
+            raise ValueError("A shard needs at least one document.")
+        os.makedirs(path, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+
+        if quantization == 'int8':
+            scales = np.abs(vectors).max(axis=0) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+            np.save(os.path.join(path, 'scales.npy'), scales.astype(np.float32))
+            np.save(os.path.join(path, 'vectors.npy'), codes)
+            stored = codes.astype(np.float32) * scales
+        else:
+            np.save(os.path.join(path, 'vectors.npy'), vectors)
+            stored = vectors
+        np.save(os.path.join(path, 'norms.npy'), np.einsum('ij,ij->i', stored, stored).astype(np.float32))
+
+        encoded = [doc.page_content.encode('utf-8') for doc in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        with open(os.path.join(path, 'texts.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'starts.npy'), np.array([d.metadata.get('start', 0) for d in documents], dtype=np.float64))
+        np.save(os.path.join(path, 'ends.npy'), np.array([d.metadata.get('end', 0) for d in documents], dtype=np.float64))
+
+        LexicalIndex.write(path, [doc.page_content for doc in documents])
+
+        # Metadata shared by every chunk of the shard (video id, title, ...).
+        shared = {
+            key: value for key, value in documents[0].metadata.items()
+            if key not in ('start', 'end') and all(d.metadata.get(key) == value for d in documents)
+        }
+        # The header is written last: its presence marks a complete shard.
+        with open(os.path.join(path, HEADER_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'quantization': quantization,
+                'dim': int(vectors.shape[1]),
+                'ids': list(ids),
+                'metadata': shared,
+            }, f)
+
+    # --- Reading ---
+    def text(self, i):
+        return bytes(self.texts[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def reconstruct(self, indices):
+        """Returns the (dequantized) float32 vectors for the given rows."""
+        rows = np.asarray(self.vectors[np.asarray(indices)], dtype=np.float32)
+        return rows * self.scales if self.quantization == 'int8' else rows
+
+    def document(self, i):
+        text = self.text(i)
+        metadata = dict(self.header['metadata'])
+        metadata['start'] = float(self.starts[i])
+        metadata['end'] = float(self.ends[i])
+        return Document(id=self.ids[i], page_content=text, metadata=metadata)
+
+    def _dot(self, query):
+        """Inner products of every stored vector with the query."""
+        if self.quantization != 'int8':
+            return self.vectors @ query
+        scaled_query = query * self.scales
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        return out
+
+    def search(self, query, k):
+        """Returns (indices, L2 distances) of the k nearest vectors."""
+        query = np.asarray(query, dtype=np.float32)
+        squared = self.norms - 2.0 * self._dot(query) + float(query @ query)
+        k = min(k, len(self))
+        top = np.argpartition(squared, k - 1)[:k]
+        top = top[np.argsort(squared[top])]
+        return top, np.sqrt(np.maximum(squared[top], 0.0))
+
+    @staticmethod
+    def relevance_score_fn(distance):
+        """Maps an L2 distance between unit vectors to a 0-1 relevance score."""
+        return 1.0 - distance / math.sqrt(2)
@@ -25,6 +25,7 @@ class Video(models.Model):
 class Transcript(models.Model):
     id = models.AutoField(primary_key=True)
     start = models.FloatField()
+    duration = models.FloatField(null=True, blank=True)
     content = models.TextField()
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='transcripts')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='transcripts')
@@ -32,6 +33,23 @@ class Transcript(models.Model):
     def __str__(self):
         return f'{self.video.title} - {self.start}'
 
+class TranscriptChunk(models.Model):
+    """Consecutive transcript segments grouped for retrieval (see core/chunking.py)."""
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='chunks')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    start = models.FloatField()
+    end = models.FloatField()
+    content = models.TextField()
+    token_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['video', 'index']
+        unique_together = ('video', 'index')
+
+    def __str__(self):
+        return f'{self.video.title} - chunk {self.index} ({self.start}-{self.end})'
+
 class Enrollment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
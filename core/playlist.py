@@ -0,0 +1,62 @@
+# core/playlist.py
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Video
+
+# --- Constants ---
+DEFAULT_TIMEOUT = 300
+VERSION_KEY = 'playlist_version:{course_id}'
+VIDEOS_KEY = 'course_videos:{course_id}:{version}'
+
+
+def get_timeout():
+    """
+    Cached playlists also expire after PLAYLIST_CACHE_TIMEOUT seconds, which
+    bounds staleness when the cache is per process (LocMemCache) and a change
+    was made by another process.
+    """
+    return getattr(settings, 'PLAYLIST_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def playlist_version(course_id):
+    """Returns the current cache version of a course's playlist."""
+    key = VERSION_KEY.format(course_id=course_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # add() so concurrent first requests agree on one version.
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_playlist_version(course_id):
+    """
+    Invalidates the cached video list and playlist fragments of a course once
+    the current transaction commits (immediately outside one). Bumping before
+    the commit would let a request cache the old rows under the new version.
+    """
+    key = VERSION_KEY.format(course_id=course_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def get_course_videos(course_id, version=None):
+    """Returns the course's videos ordered by id, from the cache when possible."""
+    if version is None:
+        version = playlist_version(course_id)
+    key = VIDEOS_KEY.format(course_id=course_id, version=version)
+    videos = cache.get(key)
+    if videos is None:
+        videos = list(
+            Video.objects
+            .filter(course_id=course_id)
+            .order_by('id')
+            .only('id', 'youtube_id', 'title', 'course_id')
+        )
+        cache.set(key, videos, get_timeout())
+    return videos
@@ -1,45 +1,75 @@
+import asyncio
 import os
 import re # Import the regular expression module
-import pandas as pd
+import threading
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from langchain_community.document_loaders import DataFrameLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain.schema import StrOutputParser
 
+from .embeddings import GeminiBatchEmbeddings
+from .embedding_cache import CachedEmbeddings, get_embedding_cache
+from .lexical_index import reciprocal_rank_fusion
+from .tracing import set_attribute, span, stage
+from .reranker import get_context_chunks, get_rerank_candidates, get_reranker, rerank
+from .chunking import estimate_tokens
+from .transcript_index import get_interval_index
+from .vector_shards import ShardCache, get_shard_cache_size
+
 # --- Constants ---
 FAISS_INDEX_PATH = os.path.join(settings.BASE_DIR, 'faiss_index')
 TRANSCRIPTS_PATH = os.path.join(settings.MEDIA_ROOT, 'transcripts')
 EMBEDDING_MODEL = "models/text-embedding-004"
 LLM_MODEL = "gemini-2.5-flash"
 
-# --- Global variable ---
-vector_store = None
-
-def get_vector_store():
-    """Loads the FAISS index from disk if it exists, otherwise returns None."""
-    global vector_store
-    if vector_store is None:
-        embedding_function = GoogleGenerativeAIEmbeddings(
-            model=EMBEDDING_MODEL,
-            google_api_key=settings.GEMINI_API_KEY
-        )
-        if os.path.exists(FAISS_INDEX_PATH):
-            print("Loading existing FAISS index from disk...")
-            vector_store = FAISS.load_local(
-                FAISS_INDEX_PATH,
-                embedding_function,
-                allow_dangerous_deserialization=True
-            )
-            print("FAISS index loaded.")
-        else:
-            print("No FAISS index found. It will be created during the ingestion process.")
-    return vector_store
+TIME_KEYWORDS = ['at this moment', 'right now', 'at this time', 'what is he saying', 'what does this mean']
+
+# Fixed answers returned without an LLM call. They describe a missing
+# transcript rather than answer the question, so they are never cached.
+NO_TRANSCRIPT_AT_TIMESTAMP_ANSWER = (
+    "I couldn't find the specific part of the transcript for that time. Please try a different timestamp."
+)
+FIXED_ANSWERS = frozenset({NO_TRANSCRIPT_AT_TIMESTAMP_ANSWER})
+
+# --- Global variables ---
+shard_cache = None
+embedding_function = None
+
+def get_embedding_function():
+    """
+    Returns the embedding function shared by ingestion and retrieval.
+    Texts already in the on-disk embedding cache never reach the API.
+    """
+    global embedding_function
+    if embedding_function is not None:
+        return embedding_function
+    client = GeminiBatchEmbeddings(
+        model=EMBEDDING_MODEL,
+        api_key=settings.GEMINI_API_KEY,
+        api_base=getattr(settings, 'GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta'),
+        batch_size=getattr(settings, 'EMBEDDING_BATCH_SIZE', 100),
+        max_in_flight=getattr(settings, 'EMBEDDING_MAX_IN_FLIGHT', 4),
+    )
+    embedding_function = CachedEmbeddings(client, get_embedding_cache(), EMBEDDING_MODEL)
+    return embedding_function
+
+def get_shard_cache():
+    """Returns the process-wide cache of per-video vector shards."""
+    global shard_cache
+    if shard_cache is None:
+        shard_cache = ShardCache(FAISS_INDEX_PATH, max_shards=get_shard_cache_size())
+    return shard_cache
+
+def get_vector_store(video_id):
+    """
+    Returns the memory-mapped shard holding a single video's transcripts,
+    opening it on first use. Returns None if the video has not been ingested.
+    """
+    return get_shard_cache().get(video_id)
 
-# ... (Data Ingestion functions remain the same) ...
+# Data ingestion lives in core/ingestion.py (create_or_update_vector_store).
 
 # --- NEW: Helper function to parse timestamps from a query ---
 def parse_timestamp_from_query(query):
@@ -65,10 +95,19 @@ def parse_timestamp_from_query(query):
     return seconds if seconds > 0 else None
 
 
-# --- RAG and General Chains (remain the same) ---
-def get_rag_chain(retriever):
-    """Creates a RAG chain with a specific retriever."""
-    prompt_template = """
+def classify_query(query, timestamp=0):
+    """
+    Decides whether a query is about a specific moment of the video.
+    Returns (is_time_sensitive, effective_timestamp).
+    """
+    query_timestamp = parse_timestamp_from_query(query)
+    effective_timestamp = query_timestamp if query_timestamp is not None else timestamp
+    is_time_sensitive = query_timestamp is not None or any(keyword in query.lower() for keyword in TIME_KEYWORDS)
+    return is_time_sensitive, effective_timestamp
+
+
+# --- RAG and General Chains ---
+RAG_PROMPT_TEMPLATE = """
     You are an expert AI assistant for the InCuiseNix e-learning platform.
     Your goal is to provide accurate and helpful answers.
     Answer the QUESTION based on the CONTEXT provided below from the video transcript.
@@ -78,93 +117,323 @@ def get_rag_chain(retriever):
     QUESTION:
     {question}
     """
-    prompt = PromptTemplate.from_template(prompt_template)
-    llm = ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=settings.GEMINI_API_KEY)
+GENERAL_PROMPT_TEMPLATE = "You are a helpful AI assistant. Answer the following question to the best of your ability.\nQuestion: {question}"
+
 
-    # The chain now formats the retrieved documents into the context
+def create_llm():
+    """Creates a new Gemini chat client. Prefer get_llm(), which reuses one."""
+    return ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=settings.GEMINI_API_KEY)
+
+
+def build_rag_answer_chain(llm):
+    """prompt | llm | parser for a RAG request whose input has "context" and "question"."""
+    return PromptTemplate.from_template(RAG_PROMPT_TEMPLATE) | llm | StrOutputParser()
+
+
+def build_general_chain(llm):
+    """Builds the general knowledge chain around an LLM client."""
     return (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
+        RunnablePassthrough()
+        | PromptTemplate.from_template(GENERAL_PROMPT_TEMPLATE)
         | llm
         | StrOutputParser()
     )
 
+
+# --- Process-wide client and chain registry ---
+# Building the Gemini client opens a new connection (and TLS handshake) on
+# first use, so one client and one compiled chain per kind are shared by
+# every request in the process.
+_registry = {}
+_registry_lock = threading.RLock()
+
+
+def _registered(name, factory):
+    obj = _registry.get(name)
+    if obj is None:
+        with _registry_lock:
+            obj = _registry.get(name)
+            if obj is None:
+                obj = factory()
+                _registry[name] = obj
+    return obj
+
+
+def get_llm():
+    """Returns the shared Gemini chat client."""
+    return _registered('llm', create_llm)
+
+
+def set_llm(llm):
+    """Replaces the shared chat client (e.g. with a fake model) and drops chains built on the old one."""
+    with _registry_lock:
+        _registry.clear()
+        _registry['llm'] = llm
+
+
+def reset_chain_registry():
+    with _registry_lock:
+        _registry.clear()
+
+
+def get_rag_chain():
+    """
+    Returns the shared RAG chain. Its input is {"context", "question"}; the
+    context comes from retrieve_documents, so the chain never searches itself.
+    """
+    return _registered('rag', lambda: build_rag_answer_chain(get_llm()))
+
 def get_general_chain():
-    """Creates a chain for general knowledge questions."""
-    general_prompt_template = "You are a helpful AI assistant. Answer the following question to the best of your ability.\nQuestion: {question}"
-    prompt = PromptTemplate.from_template(general_prompt_template)
-    llm = ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=settings.GEMINI_API_KEY)
-    
-    return (
-        RunnablePassthrough()
-        | prompt
-        | llm
-        | StrOutputParser()
+    """Returns the shared chain for general knowledge questions."""
+    return _registered('general', lambda: build_general_chain(get_llm()))
+
+
+# --- Retrieval stage ---
+# Hybrid retrieval: BM25 over the shard's chunks runs first. A confident,
+# clear-cut lexical hit answers on its own and skips the embedding call
+# (only when no query vector was computed already, e.g. by the answer cache);
+# otherwise BM25 and vector results are merged with reciprocal rank fusion.
+# An optional rerank stage (core/reranker.py) then keeps the best few chunks.
+def _lexical_stage(store, query, fetch_k):
+    """Returns (lexical_hits, skip_vector_search) where hits are [(index, score)]."""
+    if store.lexical is None:
+        return [], False
+    with stage('lexical'):
+        indices, scores = store.lexical.search(query, fetch_k)
+    hits = list(zip(indices.tolist(), scores.tolist()))
+    skip_confidence = getattr(settings, 'HYBRID_LEXICAL_SKIP_CONFIDENCE', 0.9)
+    confident = bool(hits) and hits[0][1] >= skip_confidence and (
+        len(hits) == 1 or hits[0][1] >= 1.5 * hits[1][1]
     )
+    return hits, confident
 
 
-# --- UPDATED: The Query Router is now much smarter ---
-def query_router(query, video_id=None, video_title=None, timestamp=0):
+def _fuse(store, lexical_hits, vector_hits, limit):
     """
-    Routes the query to the correct chain: Timestamp-based, RAG, or General.
+    Fuses lexical [(index, score)] and vector [(index, distance)] rankings
+    into at most limit [(index, relevance)] candidates. Each fused chunk keeps
+    the best of its lexical score and vector relevance, and only chunks above
+    RAG_RELEVANCE_THRESHOLD are returned.
     """
-    store = get_vector_store()
-    if not store:
-        print("FAISS index not found. Routing to general chain.")
-        return get_general_chain().invoke({"question": query})
+    threshold = getattr(settings, 'RAG_RELEVANCE_THRESHOLD', 0.3)
+    relevance = {i: score for i, score in lexical_hits}
+    for i, distance in vector_hits:
+        relevance[i] = max(relevance.get(i, 0.0), store.relevance_score_fn(distance))
+
+    order = reciprocal_rank_fusion([i for i, _ in vector_hits], [i for i, _ in lexical_hits])
+    return [(i, relevance[i]) for i in order[:limit] if relevance[i] >= threshold]
+
 
+def _select(store, query, query_vector, candidates, k):
+    """Reranks the candidates if a reranker is enabled and builds the top k documents."""
+    reranker = get_reranker()
+    if reranker is not None and len(candidates) > 1:
+        with stage('rerank'):
+            candidates = rerank(reranker, store, query, query_vector, candidates, k)
+    return [(store.document(i), relevance) for i, relevance in candidates[:k]]
+
+
+def _retrieval_sizes(k):
+    """
+    Returns (fetch_k, candidates, k). With a reranker, retrieval over-fetches
+    RAG_RERANK_CANDIDATES chunks and only the best RAG_CONTEXT_CHUNKS reach
+    the prompt.
+    """
+    fetch_k = getattr(settings, 'HYBRID_FETCH_K', 20)
+    if get_reranker() is None:
+        k = k or 5
+        return fetch_k, k, k
+    candidates = get_rerank_candidates()
+    return max(fetch_k, candidates), candidates, k or get_context_chunks()
+
+
+def retrieve_documents(store, query, k=None, query_vector=None):
+    """
+    Searches the video's shard with at most one query embedding; a
+    query_vector already computed (e.g. by the answer cache) is reused and
+    its vector hits are always fused in, even after a confident lexical hit.
+    Returns [(document, relevance)] for hits above RAG_RELEVANCE_THRESHOLD.
+    """
+    fetch_k, limit, k = _retrieval_sizes(k)
+    lexical_hits, confident = _lexical_stage(store, query, fetch_k)
+    if confident and query_vector is None:
+        set_attribute('lexical_shortcut', True)
+        return _select(store, query, query_vector, _fuse(store, lexical_hits, [], limit), k)
+
+    if query_vector is None:
+        with stage('embed'):
+            query_vector = get_embedding_function().embed_query(query)
+    with stage('search'):
+        indices, distances = store.search(query_vector, fetch_k)
+    candidates = _fuse(store, lexical_hits, list(zip(indices.tolist(), distances.tolist())), limit)
+    return _select(store, query, query_vector, candidates, k)
+
+
+async def aretrieve_documents(store, query, k=None, query_vector=None):
+    """
+    Async counterpart of retrieve_documents. The query embedding is awaited
+    on the event loop; the shard search and reranking are CPU work and run
+    in threads.
+    """
+    fetch_k, limit, k = _retrieval_sizes(k)
+    lexical_hits, confident = _lexical_stage(store, query, fetch_k)
+    if confident and query_vector is None:
+        set_attribute('lexical_shortcut', True)
+        return await asyncio.to_thread(_select, store, query, query_vector, _fuse(store, lexical_hits, [], limit), k)
+
+    if query_vector is None:
+        with stage('embed'):
+            query_vector = await get_embedding_function().aembed_query(query)
+    with stage('search'):
+        indices, distances = await asyncio.to_thread(store.search, query_vector, fetch_k)
+    candidates = _fuse(store, lexical_hits, list(zip(indices.tolist(), distances.tolist())), limit)
+    return await asyncio.to_thread(_select, store, query, query_vector, candidates, k)
+
+
+def format_documents(scored_docs):
+    """Joins retrieved chunks into the CONTEXT block of the RAG prompt."""
+    return "\n\n".join(doc.page_content for doc, _ in scored_docs)
+
+
+def _rag_or_general(scored_docs, query, video_title):
+    if scored_docs:
+        context = format_documents(scored_docs)
+        contextual_query = f"Regarding the video '{video_title}', {query}"
+        set_attribute('route', 'rag')
+        set_attribute('context_chunks', len(scored_docs))
+        set_attribute('context_tokens', estimate_tokens(context))
+        return get_rag_chain(), {"context": context, "question": contextual_query}
+    # No chunk passed the relevance threshold.
+    return _general(query, 'no_relevant_chunks')
+
+
+def _general(query, reason):
+    set_attribute('route', 'general')
+    set_attribute('route_reason', reason)
+    return get_general_chain(), {"question": query}
+
+
+# --- UPDATED: The Query Router is now much smarter ---
+def route_query(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """
+    Picks the chain for a query: Timestamp-based, RAG, or General.
+    Returns (chain, chain_input), or (None, answer) when the answer is fixed
+    and no LLM call is needed.
+    """
     # --- NEW: Time-sensitive routing logic ---
-    query_timestamp = parse_timestamp_from_query(query)
-    effective_timestamp = query_timestamp if query_timestamp is not None else timestamp
-    
-    time_keywords = ['at this moment', 'right now', 'at this time', 'what is he saying', 'what does this mean']
-    is_time_sensitive = query_timestamp is not None or any(keyword in query.lower() for keyword in time_keywords)
+    is_time_sensitive, effective_timestamp = classify_query(query, timestamp)
 
     if video_id and is_time_sensitive:
-        print(f"Time-sensitive query detected for timestamp: {effective_timestamp}s")
-        # For timestamp queries, we retrieve all docs for the video and filter in Python.
-        # This is more precise than a vector search for finding a specific time.
-        retriever = store.as_retriever(search_kwargs={'k': 300, 'filter': {'video_id': str(video_id)}})
-        all_video_docs = retriever.get_relevant_documents("") # Empty query gets all filtered docs
-        
-        target_doc = None
-        for doc in all_video_docs:
-            start_time = doc.metadata.get('start', 0)
-            end_time = doc.metadata.get('end', 0)
-            if start_time <= effective_timestamp < end_time:
-                target_doc = doc
-                break
+        set_attribute('route', 'timestamp')
+        set_attribute('timestamp', effective_timestamp)
+        # Timestamp lookups use the in-memory interval index instead of the
+        # vector store: a binary search with no embedding round trip. The
+        # context is the transcript window around the moment, not one segment.
+        with stage('timestamp_lookup'):
+            index = get_interval_index(video_id)
+            window = index.window_at(
+                float(effective_timestamp),
+                seconds=getattr(settings, 'ASSISTANT_TIMESTAMP_WINDOW', 60),
+                max_chars=getattr(settings, 'ASSISTANT_TIMESTAMP_WINDOW_MAX_CHARS', 4000),
+            ) if index else None
         
-        if target_doc:
-            context = target_doc.page_content
-            print(f"Found transcript chunk for the timestamp: '{context}'")
+        if window:
+            context = window['content']
+            set_attribute('context_tokens', estimate_tokens(context))
             # Create a very specific prompt for the LLM
             question_with_context = (
                 f"The user is watching a video titled '{video_title}'. "
                 f"At the moment {int(effective_timestamp // 60)} minutes and {int(effective_timestamp % 60)} seconds, "
-                f"the transcript says: '{context}'. "
+                f"the transcript around that moment says: '{context}'. "
                 f"Based *only* on this transcript snippet, answer the user's question: '{query}'"
             )
             # Use the general chain as it's good at direct instruction following
-            return get_general_chain().invoke({"question": question_with_context})
+            return get_general_chain(), {"question": question_with_context}
         else:
-            print("Could not find a transcript chunk for the specified timestamp.")
-            return "I couldn't find the specific part of the transcript for that time. Please try a different timestamp."
+            set_attribute('route_reason', 'no_transcript_at_timestamp')
+            return None, NO_TRANSCRIPT_AT_TIMESTAMP_ANSWER
 
     # --- Fallback to standard RAG and General logic ---
-    print("Standard query detected. Using semantic search.")
     if video_id:
-        retriever = store.as_retriever(
-            search_kwargs={'k': 5, 'filter': {'video_id': str(video_id)}}
-        )
-        relevant_docs = retriever.get_relevant_documents(query)
-        
-        if relevant_docs:
-            contextual_query = f"Regarding the video '{video_title}', {query}"
-            return get_rag_chain(retriever).invoke(contextual_query)
-        else:
-            print("No relevant documents found for the query. Using general knowledge.")
-            return get_general_chain().invoke({"question": query})
+        store = get_vector_store(video_id)
+        if not store:
+            return _general(query, 'no_shard')
+
+        # One embedding and one search; the hits are reused as the LLM context.
+        return _rag_or_general(retrieve_documents(store, query, query_vector=query_vector), query, video_title)
+
+    return _general(query, 'no_video')
+
+
+def query_router(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """
+    Routes the query to the correct chain and returns the complete answer.
+    """
+    with span('assistant.query', video_id=video_id, streaming=False):
+        chain, chain_input = route_query(query, video_id, video_title, timestamp, query_vector)
+        if chain is None:
+            return chain_input
+        with stage('llm'):
+            return chain.invoke(chain_input)
+
+
+def stream_query_router(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """
+    Same routing as query_router, but yields the answer as text chunks
+    while the LLM generates them.
+    """
+    with span('assistant.query', video_id=video_id, streaming=True):
+        chain, chain_input = route_query(query, video_id, video_title, timestamp, query_vector)
+        if chain is None:
+            yield chain_input
+            return
+        with stage('llm'):
+            for chunk in chain.stream(chain_input):
+                if chunk:
+                    yield chunk
+
+
+# --- Async variants for the ASGI assistant view ---
+async def aroute_query(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """
+    Async counterpart of route_query. Retrieval awaits the embedding call
+    instead of blocking a worker thread.
+    """
+    is_time_sensitive, effective_timestamp = classify_query(query, timestamp)
+
+    if video_id and is_time_sensitive:
+        # The interval index is cached in memory; only its first build touches the DB.
+        return await sync_to_async(route_query)(query, video_id, video_title, timestamp)
+
+    if video_id:
+        store = await sync_to_async(get_vector_store, thread_sensitive=False)(video_id)
+        if not store:
+            return _general(query, 'no_shard')
+
+        scored_docs = await aretrieve_documents(store, query, query_vector=query_vector)
+        return _rag_or_general(scored_docs, query, video_title)
+
+    return _general(query, 'no_video')
+
+
+async def aquery_router(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """Async counterpart of query_router, using ainvoke."""
+    with span('assistant.query', video_id=video_id, streaming=False):
+        chain, chain_input = await aroute_query(query, video_id, video_title, timestamp, query_vector)
+        if chain is None:
+            return chain_input
+        with stage('llm'):
+            return await chain.ainvoke(chain_input)
+
 
-    print("No video_id provided. Routing to general knowledge chain.")
-    return get_general_chain().invoke({"question": query})
\ No newline at end of file
+async def astream_query_router(query, video_id=None, video_title=None, timestamp=0, query_vector=None):
+    """Async counterpart of stream_query_router, using astream."""
+    with span('assistant.query', video_id=video_id, streaming=True):
+        chain, chain_input = await aroute_query(query, video_id, video_title, timestamp, query_vector)
+        if chain is None:
+            yield chain_input
+            return
+        with stage('llm'):
+            async for chunk in chain.astream(chain_input):
+                if chunk:
+                    yield chunk
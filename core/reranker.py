@@ -0,0 +1,126 @@
+# core/reranker.py
+
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_CANDIDATES = 50
+DEFAULT_CONTEXT_CHUNKS = 3
+DEFAULT_CROSS_ENCODER_BATCH_SIZE = 32
+# Weights of the lexical scorer: vector cosine, idf-weighted query term
+# coverage, and coverage of adjacent query term pairs (phrase matches).
+LEXICAL_WEIGHTS = (0.6, 0.3, 0.1)
+
+
+def _bigrams(tokens):
+    return set(zip(tokens, tokens[1:]))
+
+
+class LexicalReranker:
+    """
+    Dependency-free reranker scoring all candidates in one vectorized pass:
+    cosine similarity of the stored chunk vectors to the query vector, plus
+    how much of the query (weighted by idf) and its word pairs each chunk
+    contains. The cosine term is dropped when there is no query vector.
+    """
+
+    def __init__(self, weights=LEXICAL_WEIGHTS):
+        self.weights = np.asarray(weights, dtype=np.float32)
+
+    def score(self, store, query, query_vector, indices):
+        query_tokens = tokenize(query)
+        terms = list(dict.fromkeys(query_tokens))
+        pairs = list(_bigrams(query_tokens))
+        chunk_tokens = [tokenize(store.text(i)) for i in indices]
+
+        features = np.zeros((len(indices), 3), dtype=np.float32)
+        if query_vector is not None:
+            vectors = store.reconstruct(indices)
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+            features[:, 0] = (vectors @ query_vector) / np.maximum(norms, 1e-12)
+        if terms:
+            presence = np.array([[t in set(tokens) for t in terms] for tokens in chunk_tokens], dtype=np.float32)
+            idf = store.lexical.idf(terms) if store.lexical is not None else np.ones(len(terms), dtype=np.float32)
+            features[:, 1] = presence @ idf / max(float(idf.sum()), 1e-12)
+        if pairs:
+            pair_presence = np.array([[p in _bigrams(tokens) for p in pairs] for tokens in chunk_tokens], dtype=np.float32)
+            features[:, 2] = pair_presence.mean(axis=1)
+
+        weights = self.weights if query_vector is not None else self.weights * np.array([0, 1, 1], dtype=np.float32)
+        return features @ weights
+
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a sentence-transformers CrossEncoder on CPU."""
+
+    def __init__(self, model_name, batch_size=DEFAULT_CROSS_ENCODER_BATCH_SIZE):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device='cpu')
+        self.batch_size = batch_size
+
+    def score(self, store, query, query_vector, indices):
+        pairs = [(query, store.text(i)) for i in indices]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+
+def rerank(reranker, store, query, query_vector, candidates, k):
+    """Reorders [(index, relevance)] candidates by reranker score and keeps the best k."""
+    if len(candidates) <= 1:
+        return candidates[:k]
+    scores = reranker.score(store, query, query_vector, [i for i, _ in candidates])
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [candidates[i] for i in order]
+
+
+# --- Process-wide rerankers, one per RAG_RERANKER kind ---
+_rerankers = {}
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Returns the reranker selected by RAG_RERANKER ('lexical', 'cross-encoder'
+    or None to disable). The cross-encoder needs sentence-transformers; if it
+    cannot be loaded the lexical reranker is used instead.
+    """
+    kind = getattr(settings, 'RAG_RERANKER', None)
+    if not kind:
+        return None
+    reranker = _rerankers.get(kind)
+    if reranker is None:
+        with _reranker_lock:
+            reranker = _rerankers.get(kind)
+            if reranker is None:
+                reranker = _rerankers[kind] = _create_reranker(kind)
+    return reranker
+
+
+def _create_reranker(kind):
+    if kind == 'cross-encoder':
+        model_name = getattr(settings, 'RAG_RERANKER_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        try:
+            return CrossEncoderReranker(
+                model_name,
+                batch_size=getattr(settings, 'RAG_RERANKER_BATCH_SIZE', DEFAULT_CROSS_ENCODER_BATCH_SIZE),
+            )
+        except Exception as e:
+            logger.warning(f"Could not load cross-encoder '{model_name}' ({e}); using the lexical reranker.")
+    elif kind != 'lexical':
+        logger.warning(f"Unknown RAG_RERANKER '{kind}'; using the lexical reranker.")
+    return LexicalReranker()
+
+
+def get_rerank_candidates():
+    return getattr(settings, 'RAG_RERANK_CANDIDATES', DEFAULT_CANDIDATES)
+
+
+def get_context_chunks():
+    return getattr(settings, 'RAG_CONTEXT_CHUNKS', DEFAULT_CONTEXT_CHUNKS)
@@ -0,0 +1,17 @@
+# core/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Course, Video
+from .playlist import bump_playlist_version
+
+
+@receiver([post_save, post_delete], sender=Video)
+def invalidate_video_playlist(sender, instance, **kwargs):
+    bump_playlist_version(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course_playlist(sender, instance, **kwargs):
+    bump_playlist_version(instance.pk)
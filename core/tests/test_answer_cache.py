@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document
+
+from core import answer_cache, ingestion, rag_utils, tracing
+from core.answer_cache import AnswerCache
+from core.benchmarking import HashingEmbeddings
+from core.mmap_index import MmapVectorShard
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.embeddings = CountingEmbeddings()
+        patcher = mock.patch.object(rag_utils, 'embedding_function', self.embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Hashing embeddings are cruder than Gemini's, so near-duplicates score lower.
+        self.cache = AnswerCache(similarity_threshold=0.8)
+
+    def test_content_question_is_embedded_once_and_matched_semantically(self):
+        answer, vector = self.cache.get(1, 'what is a python decorator')
+        self.assertIsNone(answer)
+        self.assertIsNotNone(vector)
+        self.cache.set(1, 'what is a python decorator', 0, 'A function wrapper.', vector)
+
+        answer, _ = self.cache.get(1, 'what is a python decorator exactly')
+        self.assertEqual(answer, 'A function wrapper.')
+        self.assertEqual(len(self.embeddings.queries), 2)
+
+    async def test_async_lookup_matches_semantically(self):
+        answer, vector = await self.cache.aget(1, 'what is a python decorator')
+        self.assertIsNone(answer)
+        self.cache.set(1, 'what is a python decorator', 0, 'A function wrapper.', vector)
+
+        answer, _ = await self.cache.aget(1, 'what is a python decorator exactly')
+        self.assertEqual(answer, 'A function wrapper.')
+
+    def test_query_embedding_is_timed_as_the_embed_stage(self):
+        with mock.patch.object(tracing, 'logger'), mock.patch.object(tracing.metrics, 'record_stage') as record:
+            with tracing.span('assistant.request') as root:
+                self.cache.get(1, 'what is a python decorator')
+        self.assertEqual(list(root.stage_ms), ['embed'])
+        self.assertEqual([c.args[0] for c in record.call_args_list], ['embed'])
+
+    def test_timestamp_question_is_not_embedded(self):
+        answer, vector = self.cache.get(1, 'what is said at 1:40')
+        self.assertIsNone(answer)
+        self.assertIsNone(vector)
+        self.assertEqual(self.embeddings.queries, [])
+
+    def test_question_without_video_is_not_embedded(self):
+        answer, vector = self.cache.get(None, 'what is a closure')
+        self.assertIsNone(answer)
+        self.assertIsNone(vector)
+        self.assertEqual(self.embeddings.queries, [])
+
+    def test_exact_hits_still_work_without_embeddings(self):
+        self.cache.set(1, 'what is said at 1:40', 0, 'Loops.', None)
+        answer, _ = self.cache.get(1, 'What is said at 1:40?')
+        self.assertEqual(answer, 'Loops.')
+
+    def test_fixed_fallback_answers_are_not_cached(self):
+        self.cache.set(1, 'what is said at 99:00', 0, rag_utils.NO_TRANSCRIPT_AT_TIMESTAMP_ANSWER)
+        answer, _ = self.cache.get(1, 'what is said at 99:00')
+        self.assertIsNone(answer)
+
+    def test_ingestion_invalidation_drops_video_answers(self):
+        with mock.patch.object(answer_cache, '_cache', self.cache):
+            self.cache.set(1, 'what is said at 1:40', 0, 'Loops.')
+            self.cache.set(2, 'what is said at 1:40', 0, 'Classes.')
+            answer_cache.invalidate_video_answers(1)
+        self.assertIsNone(self.cache.get(1, 'what is said at 1:40')[0])
+        self.assertEqual(self.cache.get(2, 'what is said at 1:40')[0], 'Classes.')
+
+
+
+class ManifestSyncTests(SimpleTestCase):
+    """Answers are dropped when another process re-ingests their video."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(ingestion, 'MANIFEST_PATH', os.path.join(tmp.name, 'ingest_manifest.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = AnswerCache(semantic=False)
+        self.write_manifest({'1': 'a', '2': 'b'}, mtime=1)
+        self.cache.set(1, 'what is said at 1:40', 0, 'Loops.')
+        self.cache.set(2, 'what is said at 1:40', 0, 'Classes.')
+
+    def write_manifest(self, hashes, mtime):
+        manifest = ingestion._empty_manifest()
+        manifest['videos'] = {vid: {'hash': h} for vid, h in hashes.items()}
+        ingestion.save_manifest(manifest)
+        os.utime(ingestion.MANIFEST_PATH, (mtime, mtime))
+        self.cache._manifest_checked_at = 0.0
+
+    def test_changed_video_hash_drops_its_answers(self):
+        self.assertEqual(self.cache.get(1, 'what is said at 1:40')[0], 'Loops.')
+        self.write_manifest({'1': 'a2', '2': 'b'}, mtime=2)
+        self.assertIsNone(self.cache.get(1, 'what is said at 1:40')[0])
+        self.assertEqual(self.cache.get(2, 'what is said at 1:40')[0], 'Classes.')
+
+    async def test_async_lookup_reads_the_manifest_off_the_event_loop(self):
+        threads = []
+        sync = self.cache._sync_with_manifest
+
+        def recording_sync():
+            threads.append(threading.current_thread())
+            sync()
+
+        with mock.patch.object(self.cache, '_sync_with_manifest', recording_sync):
+            answer, _ = await self.cache.aget(1, 'what is said at 1:40')
+        self.assertEqual(answer, 'Loops.')
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_manifest_keeps_only_hashes(self):
+        manifest = ingestion._empty_manifest()
+        manifest['videos'] = {'1': {'hash': 'a', 'ids': ['1:0', '1:1']}}
+        ingestion.save_manifest(manifest)
+        self.assertEqual(ingestion.load_manifest()['videos'], {'1': {'hash': 'a'}})
+
+
+@override_settings(RAG_RELEVANCE_THRESHOLD=0.0, HYBRID_LEXICAL_SKIP_CONFIDENCE=0.5)
+class QueryVectorReuseTests(SimpleTestCase):
+    def setUp(self):
+        self.embeddings = HashingEmbeddings(dim=64)
+        texts = ['decorators wrap a function', 'generators yield values lazily', 'classes bundle state']
+        documents = [
+            Document(page_content=text, metadata={'start': float(i), 'end': float(i + 1)})
+            for i, text in enumerate(texts)
+        ]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        MmapVectorShard.write(tmp.name, self.embeddings.embed_documents(texts), documents, ['0', '1', '2'])
+        self.store = MmapVectorShard(tmp.name)
+        failing = mock.Mock(embed_query=mock.Mock(side_effect=AssertionError('embedded twice')))
+        patcher = mock.patch.object(rag_utils, 'embedding_function', failing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retrieval_reuses_a_precomputed_query_vector(self):
+        query = 'how do generators produce values'
+        hits = rag_utils.retrieve_documents(self.store, query, query_vector=self.embeddings.embed_query(query))
+        self.assertEqual(hits[0][0].page_content, 'generators yield values lazily')
+
+    def assert_vector_hits_are_fused(self, retrieve):
+        # A confident lexical match for chunk 0, with a vector pointing at chunk 2.
+        query = 'decorators wrap a function'
+        self.assertTrue(rag_utils._lexical_stage(self.store, query, 20)[1])
+        vector = self.embeddings.embed_query('classes bundle state')
+        with mock.patch.object(self.store, 'search', wraps=self.store.search) as search:
+            hits = retrieve(query, vector)
+        search.assert_called_once()
+        texts = [document.page_content for document, _ in hits]
+        self.assertEqual(texts[0], 'decorators wrap a function')
+        self.assertIn('classes bundle state', texts)
+
+    def test_confident_lexical_hit_still_fuses_a_precomputed_vector(self):
+        self.assert_vector_hits_are_fused(
+            lambda query, vector: rag_utils.retrieve_documents(self.store, query, query_vector=vector))
+
+    def test_async_confident_lexical_hit_still_fuses_a_precomputed_vector(self):
+        self.assert_vector_hits_are_fused(
+            lambda query, vector: async_to_sync(rag_utils.aretrieve_documents)(self.store, query, query_vector=vector))
@@ -0,0 +1,35 @@
+from django.test import SimpleTestCase
+
+from core.chunking import LAST_SEGMENT_DURATION, chunk_segments, segment_intervals
+
+
+class SegmentIntervalsTests(SimpleTestCase):
+    def test_durations_become_ends_clipped_at_the_next_start(self):
+        segments = segment_intervals([(0, 5.0, ' loops '), (2, 1.0, 'repeat'), (8, 1.0, 'code')])
+        self.assertEqual(segments, [(0.0, 2.0, 'loops'), (2.0, 3.0, 'repeat'), (8.0, 9.0, 'code')])
+
+    def test_missing_or_zero_durations_run_to_the_next_start(self):
+        segments = segment_intervals([(0, None, 'a'), (4, 0, 'b'), (10, None, 'c')])
+        self.assertEqual(segments, [(0.0, 4.0, 'a'), (4.0, 10.0, 'b'), (10.0, 10.0 + LAST_SEGMENT_DURATION, 'c')])
+
+
+class ChunkSegmentsTests(SimpleTestCase):
+    # Each 40-character segment is 10 tokens.
+    segments = [(0.0, 1.0, 'a' * 40), (1.0, 2.0, 'b' * 40), (5.0, 6.0, 'c' * 40), (6.0, 7.0, 'd' * 40)]
+
+    def test_breaks_at_a_pause_once_the_chunk_is_big_enough(self):
+        chunks = chunk_segments(self.segments, max_tokens=100, min_tokens=15, pause_seconds=2)
+        self.assertEqual([(c['start'], c['end'], c['token_count']) for c in chunks], [(0.0, 2.0, 20), (5.0, 7.0, 20)])
+        self.assertEqual(chunks[0]['content'], 'a' * 40 + ' ' + 'b' * 40)
+
+    def test_short_chunks_run_through_a_pause(self):
+        chunks = chunk_segments(self.segments, max_tokens=100, min_tokens=30, pause_seconds=2)
+        self.assertEqual([(c['start'], c['end'], c['token_count']) for c in chunks], [(0.0, 7.0, 40)])
+
+    def test_breaks_at_the_token_budget(self):
+        chunks = chunk_segments(self.segments, max_tokens=25, min_tokens=100, pause_seconds=2)
+        self.assertEqual([c['token_count'] for c in chunks], [20, 20])
+
+    def test_oversized_segment_is_a_chunk_of_its_own_and_empty_ones_are_skipped(self):
+        chunks = chunk_segments([(0.0, 1.0, 'a' * 200), (1.0, 2.0, ''), (2.0, 3.0, 'b' * 8)], max_tokens=25)
+        self.assertEqual([(c['start'], c['end'], c['token_count']) for c in chunks], [(0.0, 1.0, 50), (2.0, 3.0, 2)])
@@ -0,0 +1,47 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core import embedding_cache
+from core.embedding_cache import EmbeddingCache, text_hash
+
+MODEL = 'models/text-embedding-004|document'
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'cache.sqlite3')
+
+    def put(self, cache, texts):
+        cache.put_many(MODEL, [text_hash(t) for t in texts], [[float(i), 1.0] for i in range(len(texts))])
+
+    def test_fresh_hits_do_not_write(self):
+        cache = EmbeddingCache(self.path)
+        self.put(cache, ['a', 'b'])
+        before = cache._conn.total_changes
+        self.assertEqual(cache.get_many(MODEL, [text_hash('a'), text_hash('c')]), [[0.0, 1.0], None])
+        self.assertEqual(cache._conn.total_changes, before)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_stale_hits_refresh_last_used_in_one_write(self):
+        cache = EmbeddingCache(self.path)
+        self.put(cache, ['a', 'b', 'c'])
+        cache._conn.execute('UPDATE embeddings SET last_used = 0')
+        before = cache._conn.total_changes
+        cache.get_many(MODEL, [text_hash('a'), text_hash('b')])
+        self.assertEqual(cache._conn.total_changes - before, 2)
+        stale = cache._conn.execute('SELECT COUNT(*) FROM embeddings WHERE last_used = 0').fetchone()[0]
+        self.assertEqual(stale, 1)
+
+    @mock.patch.object(embedding_cache, 'COUNT_REFRESH_INSERTS', 5)
+    def test_eviction_counts_rows_written_by_other_processes(self):
+        first, second = EmbeddingCache(self.path, max_entries=10), EmbeddingCache(self.path, max_entries=10)
+        self.put(first, [f'first {i}' for i in range(6)])
+        # second still believes the file is empty; its count is re-read before evicting.
+        self.put(second, [f'second {i}' for i in range(6)])
+        self.assertEqual(second._count_rows(), 9)
+        self.assertEqual(second.evictions, 3)
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.benchmarking import FakeEmbeddingServer, HashingEmbeddings
+from core.embedding_cache import CachedEmbeddings, EmbeddingCache
+from core.embeddings import EmbeddingAPIError, GeminiBatchEmbeddings, _AdaptiveLimiter
+
+MODEL = 'models/text-embedding-004'
+
+
+class GeminiBatchEmbeddingsTests(SimpleTestCase):
+    def setUp(self):
+        self.reference = HashingEmbeddings(dim=32)
+        self.server = FakeEmbeddingServer(self.reference).start()
+        self.addCleanup(self.server.stop)
+
+    def make_client(self, **kwargs):
+        options = {'batch_size': 100, 'max_in_flight': 4, 'max_retries': 3, 'backoff_base': 0.001}
+        return GeminiBatchEmbeddings(MODEL, 'test-key', api_base=self.server.url, **{**options, **kwargs})
+
+    def texts(self, n, prefix='chunk'):
+        return [f'{prefix} number {i} about loops' for i in range(n)]
+
+    def test_batches_and_keeps_order(self):
+        texts = self.texts(250)
+        vectors, stats = self.make_client().embed_texts_with_stats(texts)
+
+        self.assertEqual(sorted(self.server.batch_sizes), [50, 100, 100])
+        self.assertEqual(vectors, self.reference.embed_documents(texts))
+        self.assertEqual((stats['chunks'], stats['batches'], stats['retries']), (250, 3, 0))
+
+    def test_retries_throttling_and_server_errors(self):
+        self.server.failures = [429, 503]
+        with self.assertLogs('core.embeddings', 'WARNING'):
+            vectors, stats = self.make_client().embed_texts_with_stats(self.texts(3))
+
+        self.assertEqual(vectors, self.reference.embed_documents(self.texts(3)))
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_retry_after_is_honoured(self):
+        self.server.failures = [(429, '0.2')]
+        with self.assertLogs('core.embeddings', 'WARNING'):
+            _, stats = self.make_client().embed_texts_with_stats(self.texts(1))
+        self.assertGreaterEqual(stats['seconds'], 0.2)
+
+    def test_retry_after_is_capped_at_max_backoff(self):
+        self.server.failures = [(429, '3600')]
+        with self.assertLogs('core.embeddings', 'WARNING'), mock.patch('core.embeddings.time.sleep') as sleep:
+            self.make_client(max_backoff=2.0).embed_texts(self.texts(1))
+        sleep.assert_called_once_with(2.0)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.failures = [400]
+        with self.assertRaises(EmbeddingAPIError) as raised:
+            self.make_client().embed_texts(self.texts(1))
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.failures = [503] * 3
+        with self.assertRaises(EmbeddingAPIError), self.assertLogs('core.embeddings', 'WARNING'):
+            self.make_client(max_retries=2).embed_texts(self.texts(1))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_throttling_shrinks_the_limiter_and_success_grows_it(self):
+        self.server.failures = [429, 429]
+        client = self.make_client()
+        with self.assertLogs('core.embeddings', 'WARNING'):
+            client.embed_texts(self.texts(1))
+        # 4 -> 2 -> 1 on the two 429s, then back to 2 after one success at limit 1.
+        self.assertEqual(client._limiter.limit, 2)
+
+    def test_concurrent_calls_report_their_own_stats(self):
+        client = self.make_client(batch_size=10)
+        sizes = [5, 15, 25, 35, 45, 55]
+        with ThreadPoolExecutor(max_workers=len(sizes)) as pool:
+            results = list(pool.map(lambda n: client.embed_texts_with_stats(self.texts(n, f'call{n}')), sizes))
+
+        for n, (vectors, stats) in zip(sizes, results):
+            self.assertEqual(len(vectors), n)
+            self.assertEqual(stats['chunks'], n)
+            self.assertEqual(stats['batches'], -(-n // 10))
+            self.assertEqual(stats['retries'], 0)
+
+
+    async def test_async_batches_and_keeps_order(self):
+        texts = self.texts(250)
+        vectors, stats = await self.make_client().aembed_texts_with_stats(texts)
+
+        self.assertEqual(sorted(self.server.batch_sizes), [50, 100, 100])
+        self.assertEqual(vectors, self.reference.embed_documents(texts))
+        self.assertEqual((stats['chunks'], stats['batches'], stats['retries']), (250, 3, 0))
+
+    async def test_async_retries_throttling_and_server_errors(self):
+        self.server.failures = [429, 503]
+        client = self.make_client()
+        with self.assertLogs('core.embeddings', 'WARNING'):
+            vector = await client.aembed_query('loops repeat code')
+
+        self.assertEqual(vector, self.reference.embed_query('loops repeat code'))
+        self.assertEqual(self.server.requests, 3)
+
+    async def test_async_client_errors_are_not_retried(self):
+        self.server.failures = [400]
+        with self.assertRaises(EmbeddingAPIError):
+            await self.make_client().aembed_documents(self.texts(1))
+        self.assertEqual(self.server.requests, 1)
+
+    async def test_async_path_does_not_fall_back_to_the_sync_client(self):
+        client = self.make_client()
+        with mock.patch.object(client, '_embed_batch', side_effect=AssertionError('used the sync client')):
+            vectors = await client.aembed_documents(self.texts(3))
+        self.assertEqual(len(vectors), 3)
+
+    async def test_cached_embeddings_await_the_client_on_a_miss_only(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cached = CachedEmbeddings(self.make_client(), EmbeddingCache(os.path.join(tmp.name, 'cache.sqlite3')), MODEL)
+
+        first = await cached.aembed_query('what is a loop')
+        second = await cached.aembed_query('what is a loop')
+        documents = await cached.aembed_documents(['what is a loop', 'what is a list'])
+
+        self.assertEqual(first, second)
+        self.assertEqual(first, self.reference.embed_query('what is a loop'))
+        self.assertEqual(len(documents), 2)
+        # One query request, then one document batch (documents are cached separately).
+        self.assertEqual(self.server.requests, 2)
+
+    async def test_cached_embeddings_keep_sqlite_off_the_event_loop(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cached = CachedEmbeddings(self.make_client(), EmbeddingCache(os.path.join(tmp.name, 'cache.sqlite3')), MODEL)
+        threads = []
+
+        def recording(method):
+            def wrapper(*args):
+                threads.append(threading.current_thread())
+                return method(*args)
+            return wrapper
+
+        with mock.patch.object(cached, '_lookup', recording(cached._lookup)), \
+                mock.patch.object(cached, '_fill', recording(cached._fill)):
+            await cached.aembed_query('what is a loop')
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_async_client_is_closed_with_its_event_loop(self):
+        client = self.make_client()
+
+        async def embed():
+            await client.aembed_query('loops repeat code')
+            return (await client._async_client())[0]
+
+        http_clients = [asyncio.run(embed()) for _ in range(2)]
+        self.assertIsNot(http_clients[0], http_clients[1])
+        self.assertTrue(all(c.is_closed for c in http_clients))
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def test_halves_on_throttle_and_grows_additively(self):
+        limiter = _AdaptiveLimiter(8)
+        for expected in (4, 2, 1, 1):
+            limiter.acquire()
+            limiter.release(throttled=True)
+            self.assertEqual(limiter.limit, expected)
+
+        # Grows by one after `limit` consecutive successes.
+        for expected in (2, 2, 3):
+            limiter.acquire()
+            limiter.release(throttled=False)
+            self.assertEqual(limiter.limit, expected)
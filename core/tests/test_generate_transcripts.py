@@ -0,0 +1,147 @@
+import io
+import os
+import queue
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from core import transcription
+from core.management.commands.generate_transcripts import Command
+from core.models import Course, Transcript, Video
+
+AUDIO_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'audio')
+# lecture01.wav: 16 kHz mono, a 1s tone, 0.5s of silence, a 1s tone, 0.5s of silence.
+
+
+def read_wav(audio_path, offset=0.0, duration=None):
+    """Stands in for ffmpeg: decodes the WAV fixture, or a piece of it."""
+    with wave.open(audio_path) as f:
+        samples = np.frombuffer(f.readframes(f.getnframes()), np.int16).astype(np.float32) / 32768.0
+    start = int(offset * transcription.SAMPLE_RATE)
+    end = None if duration is None else start + int(round(duration * transcription.SAMPLE_RATE))
+    return samples[start:end]
+
+
+class FakeWhisper:
+    """Returns one segment per half second of audio it is given."""
+
+    def transcribe(self, audio, fp16=False):
+        if isinstance(audio, str):
+            audio = read_wav(audio)
+        seconds = len(audio) / transcription.SAMPLE_RATE
+        starts = np.arange(0.0, seconds, 0.5)
+        return {'segments': [
+            {'start': start, 'end': min(start + 0.5, seconds), 'text': f' words at {start:.1f} '} for start in starts
+        ]}
+
+
+class ThreadRecordingOutput(io.StringIO):
+    """Records which threads wrote to the command's stdout."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def write(self, text):
+        self.threads.add(threading.current_thread())
+        return super().write(text)
+
+
+def thread_pool(max_workers, mp_context=None, initializer=None, initargs=()):
+    # Threads share the patched model, unlike spawned Whisper workers.
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+class GenerateTranscriptsTests(TransactionTestCase):
+    """Runs the whole pipeline on the fixture audio through --audio-dir."""
+
+    def setUp(self):
+        course = Course.objects.create(title='Python', description='Basics', image_url='https://example.com/p.png')
+        self.video = Video.objects.create(
+            youtube_id='lecture01', title='Lecture 1', video_url='https://example.com/1', course=course)
+        self.missing = Video.objects.create(
+            youtube_id='lecture02', title='Lecture 2', video_url='https://example.com/2', course=course)
+
+        self.decoded = []
+
+        def load_audio(audio_path, offset=0.0, duration=None):
+            self.decoded.append((os.path.basename(audio_path), offset, duration))
+            return read_wav(audio_path, offset, duration)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for patcher in (
+            mock.patch('core.management.commands.generate_transcripts.ProcessPoolExecutor', thread_pool),
+            mock.patch.object(transcription, '_model', FakeWhisper()),
+            mock.patch.object(transcription, 'load_audio', load_audio),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        audio_cache = override_settings(AUDIO_CACHE_DIR=tmp.name)
+        audio_cache.enable()
+        self.addCleanup(audio_cache.disable)
+
+    def generate(self, **options):
+        out = ThreadRecordingOutput()
+        call_command('generate_transcripts', audio_dir=AUDIO_DIR, transcribe_workers=2, stdout=out, **options)
+        # Pipeline threads queue their messages; only the main thread writes them.
+        self.assertEqual(out.threads, {threading.current_thread()})
+        return out.getvalue()
+
+    def test_transcribes_local_audio(self):
+        output = self.generate()
+
+        lines = list(Transcript.objects.filter(video=self.video).order_by('start'))
+        self.assertEqual([line.start for line in lines], [0.0, 0.5, 1.0, 1.5, 2.0, 2.5])
+        self.assertEqual(lines[0].content, 'words at 0.0')
+        self.assertTrue(all(line.duration == 0.5 for line in lines))
+        self.assertFalse(Transcript.objects.filter(video=self.missing).exists())
+        self.assertIn('No local audio for "Lecture 2"', output)
+        self.assertIn('Finished transcript generation process.', output)
+
+    def test_split_on_silence_decodes_each_piece_in_the_workers(self):
+        output = self.generate(split_on_silence=True, max_piece_seconds=1.0)
+
+        # One whole decode to plan the cuts, then one decode per piece.
+        self.assertEqual(self.decoded[0], ('lecture01.wav', 0.0, None))
+        pieces = sorted(self.decoded[1:])
+        self.assertEqual([offset for _, offset, _ in pieces], [0.0, 1.0, 2.0])
+        self.assertTrue(all(duration <= 1.0 for _, _, duration in pieces))
+        self.assertIn('Split "Lecture 1" into 3 pieces.', output)
+
+        starts = list(Transcript.objects.filter(video=self.video).order_by('id').values_list('start', flat=True))
+        self.assertEqual(starts, [0.0, 0.5, 1.0, 1.5, 2.0, 2.5])
+
+
+class WriterTests(TransactionTestCase):
+    def test_a_failed_write_gives_back_its_slot(self):
+        course = Course.objects.create(title='Python', description='Basics', image_url='https://example.com/p.png')
+        video = Video.objects.create(
+            youtube_id='lecture01', title='Lecture 1', video_url='https://example.com/1', course=course)
+        command = Command()
+        command.timings = {'write': []}
+        command.run_started = 0.0
+        command.messages = queue.Queue()
+        command.report = command.messages.put
+        command.audio_cache = mock.Mock(**{'evict.side_effect': OSError('disk gone')})
+
+        slots = threading.BoundedSemaphore(2)
+        slots.acquire()
+        slots.acquire()
+        write_queue = queue.Queue()
+        write_queue.put((video, 'lecture01.wav', [{'start': 0.0, 'end': 1.0, 'text': ' hello '}]))
+        write_queue.put((video, 'lecture01.wav', []))
+        write_queue.put(None)
+        command.write_transcripts(write_queue, slots)
+
+        self.assertTrue(slots.acquire(blocking=False))
+        self.assertTrue(slots.acquire(blocking=False))
+        self.assertEqual(Transcript.objects.filter(video=video).count(), 1)
+        messages = list(command.messages.queue)
+        self.assertEqual(sum('Error writing transcript for "Lecture 1": disk gone' in m for m in messages), 2)
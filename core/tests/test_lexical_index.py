@@ -0,0 +1,49 @@
+import tempfile
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from core import rag_utils
+from core.lexical_index import LexicalIndex
+
+CHUNKS = [
+    'we now open the terminal window',
+    'python functions return values to the caller',
+    'lists and dictionaries store collections of data',
+    'a for loop repeats the code in its body',
+]
+
+
+@override_settings(HYBRID_LEXICAL_SKIP_CONFIDENCE=0.9)
+class LexicalIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        LexicalIndex.write(tmp.name, CHUNKS)
+        self.index = LexicalIndex(tmp.name)
+        self.store = SimpleNamespace(lexical=self.index)
+
+    def test_full_match_scores_near_one(self):
+        indices, scores = self.index.search('open the terminal window', 5)
+        self.assertEqual(indices[0], 0)
+        self.assertGreater(scores[0], 0.9)
+
+    def test_out_of_vocabulary_terms_lower_the_score(self):
+        for query in ('explain monads terminal', 'how does quantum entanglement relate to the terminal'):
+            with self.subTest(query=query):
+                indices, scores = self.index.search(query, 5)
+                self.assertEqual(indices[0], 0)
+                self.assertLess(scores[0], 0.5)
+
+    def test_partially_out_of_vocabulary_query_does_not_take_the_shortcut(self):
+        _, confident = rag_utils._lexical_stage(self.store, 'explain monads terminal', 20)
+        self.assertFalse(confident)
+
+    def test_confident_match_takes_the_shortcut(self):
+        _, confident = rag_utils._lexical_stage(self.store, 'we now open the terminal window', 20)
+        self.assertTrue(confident)
+
+    def test_query_with_no_known_terms_returns_nothing(self):
+        indices, scores = self.index.search('monads', 5)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(scores), 0)
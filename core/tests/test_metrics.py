@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+
+class MetricsEndpointTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_disabled_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_endpoint_requires_the_bearer_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('incuisenix_requests_total', response.content.decode())
+
+    def test_server_timing_is_off_by_default(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertNotIn('Server-Timing', response)
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+
+from core.models import Course, Video
+from core.playlist import get_course_videos, playlist_version
+
+
+class PlaylistVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(title='Python', description='Basics', image_url='https://example.com/p.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def add_video(self, n):
+        return Video.objects.create(
+            youtube_id=f'video{n}', title=f'Lecture {n}', video_url=f'https://example.com/{n}', course=self.course)
+
+    def test_version_is_bumped_only_when_the_transaction_commits(self):
+        before = playlist_version(self.course.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                self.add_video(1)
+                # A request during the transaction still sees the old version.
+                self.assertEqual(playlist_version(self.course.id), before)
+        self.assertTrue(callbacks)
+        self.assertNotEqual(playlist_version(self.course.id), before)
+
+    def test_cached_playlist_is_refreshed_after_a_commit(self):
+        self.assertEqual(get_course_videos(self.course.id), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            video = self.add_video(1)
+        self.assertEqual([v.id for v in get_course_videos(self.course.id)], [video.id])
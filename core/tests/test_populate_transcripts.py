@@ -0,0 +1,64 @@
+import io
+import os
+import tempfile
+import threading
+
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from core.models import Course, Transcript, Video
+
+CSV = '''start,duration,text
+0.0,2.5,hello and welcome
+2.5,n/a,today we cover loops
+abc,1.0,this row has no start time
+5.0,,a for loop repeats
+7.0,only two columns
+'''
+
+
+class MainThreadOutput(io.StringIO):
+    """Records which threads wrote to the command's stdout."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def write(self, text):
+        self.threads.add(threading.current_thread())
+        return super().write(text)
+
+
+class PopulateTranscriptsTests(TransactionTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        for n in range(3):
+            course = Course.objects.create(title=f'Course {n}', description='', image_url='https://example.com/c.png')
+            Video.objects.create(youtube_id=f'video{n}', title=f'Lecture {n}', video_url='https://example.com/v', course=course)
+            os.makedirs(os.path.join(tmp.name, 'transcripts', course.title))
+            with open(os.path.join(tmp.name, 'transcripts', course.title, f'video{n}.csv'), 'w', encoding='utf-8') as f:
+                f.write(CSV)
+
+    def test_keeps_rows_with_unparsable_durations(self):
+        out = MainThreadOutput()
+        call_command('populate_transcripts', workers=3, stdout=out)
+
+        lines = Transcript.objects.filter(video__youtube_id='video0').order_by('start')
+        self.assertEqual(
+            [(line.start, line.duration) for line in lines],
+            [(0.0, 2.5), (2.5, None), (5.0, None), (7.0, None)],
+        )
+        output = out.getvalue()
+        self.assertIn('Could not parse duration "n/a" on row 3 of video0. Keeping the line without it.', output)
+        self.assertIn('Could not parse start time "abc" on row 4 of video0. Skipping.', output)
+        self.assertEqual(Transcript.objects.count(), 12)
+
+    def test_only_the_main_thread_writes_output(self):
+        out = MainThreadOutput()
+        call_command('populate_transcripts', workers=3, stdout=out)
+        self.assertEqual(out.threads, {threading.current_thread()})
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import answer_cache, rag_utils
+from core.answer_cache import AnswerCache
+from core.benchmarking import FakeChatModel, HashingEmbeddings
+from core.middleware import QueryBudgetExceeded
+from core.models import Course, Enrollment, TranscriptChunk, Video
+from core.transcript_index import invalidate_interval_index
+
+
+@override_settings(QUERY_BUDGETS_STRICT=True)
+class QueryBudgetTests(TestCase):
+    """Runs the budgeted views in strict mode, so going over budget fails the test."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='secret-password')
+        cls.course = Course.objects.create(title='Python', description='Basics', image_url='https://example.com/p.png')
+        cls.videos = [
+            Video.objects.create(
+                youtube_id=f'video{i}', title=f'Lecture {i}', video_url=f'https://example.com/{i}', course=cls.course,
+            )
+            for i in range(3)
+        ]
+        Enrollment.objects.create(user=cls.user, course=cls.course)
+        TranscriptChunk.objects.bulk_create([
+            TranscriptChunk(video=cls.videos[0], course=cls.course, index=i, start=i * 30.0, end=(i + 1) * 30.0,
+                            content=f'part {i} of the lecture', token_count=5)
+            for i in range(4)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        invalidate_interval_index()
+        self.addCleanup(invalidate_interval_index)
+        rag_utils.set_llm(FakeChatModel())
+        self.addCleanup(rag_utils.reset_chain_registry)
+        for attribute, value in (('embedding_function', HashingEmbeddings(dim=64)), ('shard_cache', None)):
+            patcher = mock.patch.object(rag_utils, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(answer_cache, '_cache', AnswerCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.user)
+
+    def ask(self, **payload):
+        response = self.client.post(reverse('assistant_api'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['answer']
+
+    def test_video_player_stays_within_budget(self):
+        url = reverse('video_player', args=[self.course.id])
+        # Cold cache first, then the cached playlist.
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, {'vid': self.videos[1].id}).status_code, 200)
+
+    def test_assistant_api_stays_within_budget_on_every_route(self):
+        video = self.videos[0]
+        self.ask(query='What is a list?')
+        self.ask(query='What is said at 0:45?', video_id=video.id, video_title=video.title)
+        self.ask(query='Explain the lecture', video_id=video.id, video_title=video.title)
+
+    @override_settings(QUERY_BUDGETS={'video_player': 1})
+    def test_strict_mode_fails_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('video_player', args=[self.course.id]))
@@ -0,0 +1,89 @@
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document
+
+from core import rag_utils, reranker
+from core.benchmarking import HashingEmbeddings
+from core.mmap_index import MmapVectorShard
+from core.reranker import LexicalReranker, get_reranker, rerank
+
+TEXTS = [
+    'python loops repeat code',
+    'immutable tuples hold values',
+    'python classes bundle state',
+    'python functions return values',
+    'comprehension builds a list',
+    'list comprehension builds values',
+]
+
+
+class RerankerSettingsTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(reranker._rerankers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reranker_is_off_by_default(self):
+        self.assertIsNone(get_reranker())
+        # Without a reranker the prompt keeps the 5 best retrieved chunks.
+        self.assertEqual(rag_utils._retrieval_sizes(None)[1:], (5, 5))
+
+    @override_settings(RAG_RERANKER='lexical', RAG_RERANK_CANDIDATES=50, RAG_CONTEXT_CHUNKS=3)
+    def test_enabled_reranker_over_fetches_candidates(self):
+        self.assertIsInstance(get_reranker(), LexicalReranker)
+        self.assertEqual(rag_utils._retrieval_sizes(None)[1:], (50, 3))
+
+    def test_one_reranker_per_kind(self):
+        with mock.patch.object(reranker, '_create_reranker', side_effect=lambda kind: mock.Mock(kind=kind)):
+            with override_settings(RAG_RERANKER='lexical'):
+                lexical = get_reranker()
+            with override_settings(RAG_RERANKER='cross-encoder'):
+                cross_encoder = get_reranker()
+                self.assertIs(get_reranker(), cross_encoder)
+            with override_settings(RAG_RERANKER='lexical'):
+                self.assertIs(get_reranker(), lexical)
+        self.assertEqual((lexical.kind, cross_encoder.kind), ('lexical', 'cross-encoder'))
+
+
+class LexicalRerankerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.embeddings = HashingEmbeddings(dim=64)
+        cls.tmp = tempfile.TemporaryDirectory()
+        documents = [Document(page_content=text, metadata={'start': float(i), 'end': float(i + 1)})
+                     for i, text in enumerate(TEXTS)]
+        MmapVectorShard.write(cls.tmp.name, cls.embeddings.embed_documents(TEXTS), documents,
+                              [str(i) for i in range(len(TEXTS))])
+        cls.store = MmapVectorShard(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def reorder(self, query, indices, query_vector=None, k=10):
+        candidates = [(i, 1.0) for i in indices]
+        return [i for i, _ in rerank(LexicalReranker(), self.store, query, query_vector, candidates, k)]
+
+    def test_rare_query_terms_outweigh_common_ones(self):
+        # Both chunks match one of the two words; 'python' is in most chunks, 'immutable' in one.
+        self.assertEqual(self.reorder('python immutable', [0, 1]), [1, 0])
+
+    def test_adjacent_query_words_earn_a_phrase_bonus(self):
+        # Both chunks contain both words; only chunk 5 has them side by side.
+        self.assertEqual(self.reorder('list comprehension', [4, 5]), [5, 4])
+
+    def test_without_a_query_vector_only_lexical_features_count(self):
+        scores = LexicalReranker().score(self.store, 'python immutable', None, [0, 1, 4])
+        self.assertEqual(scores[2], 0.0)
+        self.assertGreater(scores[1], scores[0])
+
+    def test_query_vector_similarity_reorders_candidates(self):
+        vector = self.embeddings.embed_query(TEXTS[2])
+        self.assertEqual(self.reorder('unrelated words', [0, 1, 2], vector)[0], 2)
+
+    def test_keeps_the_best_k(self):
+        self.assertEqual(self.reorder('list comprehension', [0, 4, 5], k=2), [5, 4])
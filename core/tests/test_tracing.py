@@ -0,0 +1,59 @@
+import contextvars
+import logging
+import threading
+from logging.handlers import QueueHandler
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core import tracing
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((threading.current_thread(), record.getMessage()))
+
+
+class LogQueueTests(SimpleTestCase):
+    def test_trace_lines_are_written_by_the_listener_thread(self):
+        recorder = RecordingHandler()
+        test_logger = logging.getLogger('core.tests.tracing')
+        test_logger.setLevel(logging.INFO)
+        test_logger.propagate = False
+        test_logger.addHandler(recorder)
+        self.addCleanup(setattr, test_logger, 'handlers', [])
+        for patcher in (mock.patch.object(tracing, 'logger', test_logger),
+                        mock.patch.object(tracing, '_log_listener', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        tracing.start_log_queue()
+        self.assertEqual([type(h) for h in test_logger.handlers], [QueueHandler])
+        with tracing.span('assistant.query', route='rag'):
+            pass
+        tracing.stop_log_queue()
+
+        [(thread, message)] = recorder.records
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertIn('"route": "rag"', message)
+
+
+class SpanContextTests(SimpleTestCase):
+    def test_exiting_in_another_context_leaves_that_context_alone(self):
+        with mock.patch.object(tracing, '_finish'):
+            with tracing.span('assistant.query') as root:
+                child = tracing.span('assistant.stream').__enter__()
+
+                def exit_elsewhere():
+                    child.__exit__(None, None, None)
+                    return tracing.current_span()
+
+                # A fresh context never had the child set, so it must not end up holding the parent.
+                self.assertIsNone(contextvars.Context().run(exit_elsewhere))
+                self.assertIs(tracing.current_span(), child)
+                child.__exit__(None, None, None)
+                self.assertIs(tracing.current_span(), root)
@@ -0,0 +1,118 @@
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core import transcript_index
+from core.benchmarking import HashingEmbeddings, use_corpus_index
+from core.transcript_index import VideoIntervalIndex, get_interval_index, invalidate_interval_index
+
+
+def make_index():
+    # Four 10-character segments with a pause from 4s to 6s.
+    return VideoIntervalIndex([0.0, 2.0, 6.0, 8.0], [2.0, 4.0, 8.0, 10.0], ['a' * 10, 'b' * 10, 'c' * 10, 'd' * 10])
+
+
+class LookupTests(SimpleTestCase):
+    def test_timestamps_inside_segments(self):
+        index = make_index()
+        self.assertEqual([index.lookup(t) for t in (0.0, 1.9, 2.0, 9.9)], [0, 0, 1, 3])
+
+    def test_a_pause_belongs_to_the_earlier_segment(self):
+        self.assertEqual(make_index().lookup(5.0), 1)
+
+    def test_outside_the_transcript(self):
+        index = make_index()
+        self.assertIsNone(index.lookup(-1.0))
+        self.assertIsNone(index.lookup(10.0))
+        self.assertIsNone(VideoIntervalIndex([], [], []).lookup(0.0))
+
+
+class WindowTests(SimpleTestCase):
+    def test_window_covers_the_overlapping_segments(self):
+        index = make_index()
+        self.assertEqual(index.window_at(5.0, seconds=1), {'start': 2.0, 'end': 4.0, 'content': 'b' * 10})
+        self.assertEqual(index.window_at(5.0, seconds=2), {'start': 2.0, 'end': 8.0, 'content': 'b' * 10 + ' ' + 'c' * 10})
+        self.assertEqual(index.window_at(5.0, seconds=10)['content'], ' '.join(ch * 10 for ch in 'abcd'))
+
+    def test_no_window_outside_the_transcript(self):
+        self.assertIsNone(make_index().window_at(10.0))
+
+    def test_long_window_is_narrowed_around_the_timestamp(self):
+        window = make_index().window_at(7.0, seconds=100, max_chars=25)
+        self.assertEqual(window, {'start': 6.0, 'end': 10.0, 'content': 'c' * 10 + ' ' + 'd' * 10})
+        window = make_index().window_at(3.0, seconds=100, max_chars=25)
+        self.assertEqual(window, {'start': 2.0, 'end': 8.0, 'content': 'b' * 10 + ' ' + 'c' * 10})
+
+    def test_a_single_long_segment_is_cut(self):
+        index = VideoIntervalIndex([0.0], [5.0], ['x' * 50])
+        self.assertEqual(index.window_at(1.0, max_chars=20)['content'], 'x' * 20)
+
+
+class IndexCacheTests(SimpleTestCase):
+    def setUp(self):
+        invalidate_interval_index()
+        self.addCleanup(invalidate_interval_index)
+
+    @override_settings(VECTOR_SHARD_CACHE_SIZE=2)
+    def test_least_recently_used_indexes_are_evicted(self):
+        with mock.patch.object(transcript_index, '_build_index', side_effect=lambda video_id: make_index()) as build:
+            first = get_interval_index(1)
+            get_interval_index(2)
+            self.assertIs(get_interval_index(1), first)
+            get_interval_index(3)
+            self.assertIs(get_interval_index(1), first)
+            get_interval_index(2)
+        self.assertEqual([c.args[0] for c in build.call_args_list], [1, 2, 3, 2])
+
+    def test_a_slow_build_does_not_block_other_videos(self):
+        started, release = threading.Event(), threading.Event()
+
+        def build(video_id):
+            if video_id == 1:
+                started.set()
+                release.wait(5)
+            return make_index()
+
+        with mock.patch.object(transcript_index, '_build_index', side_effect=build):
+            slow = threading.Thread(target=get_interval_index, args=(1,))
+            slow.start()
+            started.wait(5)
+            began = time.monotonic()
+            self.assertIsNotNone(get_interval_index(2))
+            self.assertLess(time.monotonic() - began, 1)
+            release.set()
+            slow.join()
+
+    def test_a_build_overlapping_an_invalidation_is_not_cached(self):
+        invalidations = []
+
+        def build(video_id):
+            # Ingestion invalidates from another thread while this build reads the old chunks.
+            invalidation = threading.Thread(target=invalidate_interval_index, args=(video_id,))
+            invalidation.start()
+            invalidation.join(5)
+            invalidations.append(not invalidation.is_alive())
+            return make_index()
+
+        with mock.patch.object(transcript_index, '_build_index', side_effect=build) as mocked:
+            get_interval_index(1)
+            get_interval_index(1)
+        self.assertEqual(invalidations, [True, True])
+        self.assertEqual(mocked.call_count, 2)
+
+    @override_settings(VECTOR_SHARD_CACHE_SIZE=2)
+    def test_corpus_indexes_are_pinned_for_a_benchmark_run(self):
+        chunks = [{'start': 0.0, 'end': 5.0, 'content': 'loops repeat code'}]
+        videos = [{'video_id': n, 'chunks': chunks} for n in range(1, 5)]
+        ttl = transcript_index.INDEX_TTL_SECONDS
+        with mock.patch.object(transcript_index, '_build_index', side_effect=AssertionError('read the database')), \
+                use_corpus_index(tempfile.gettempdir(), videos, HashingEmbeddings()):
+            first = get_interval_index(1)
+            with mock.patch.object(transcript_index.time, 'monotonic', return_value=first.built_at + 10 ** 6):
+                self.assertIs(get_interval_index(1), first)
+            self.assertEqual([get_interval_index(n).segment_at(1.0)['content'] for n in range(1, 5)],
+                             ['loops repeat code'] * 4)
+        self.assertEqual(transcript_index.INDEX_TTL_SECONDS, ttl)
@@ -0,0 +1,279 @@
+# core/tracing.py
+
+import atexit
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+SERVICE_NAME = 'incuisenix'
+EXPORT_QUEUE_SIZE = 10000
+
+
+class Span:
+    """
+    One timed operation. Spans nest through a context variable; the root span
+    of a trace logs a one-line JSON summary with the time spent in each
+    child stage, and finished traces go to the file exporter if configured.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'attributes', 'events',
+                 'start_ns', 'end_ns', 'status', 'stage', 'children', 'stage_ms', '_token')
+
+    def __init__(self, name, parent=None, stage=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.stage = stage
+        self.status = 'OK'
+        self.children = []
+        self.stage_ms = {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        return self
+
+    def event(self, name, **attributes):
+        """Records a point-in-time annotation, e.g. a routing decision."""
+        self.events.append((time.time_ns(), name, attributes))
+        logger.debug(f"{self.name}: {name} {attributes or ''}")
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    # --- Context manager protocol ---
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.status = 'ERROR'
+            self.attributes['error'] = f'{exc_type.__name__}: {exc}'
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in another context (e.g. an async generator closed late).
+            # The variable was never set in this context, so there is nothing
+            # to undo here; the context that set it is left untouched.
+            pass
+        _finish(self)
+        return False
+
+
+_current_span = ContextVar('current_span', default=None)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def span(name, **attributes):
+    """Starts a span as a child of the current one (or a new trace)."""
+    return Span(name, parent=_current_span.get(), attributes=attributes)
+
+
+def stage(name, **attributes):
+    """A span whose latency is also reported as a request stage (Server-Timing, /metrics/)."""
+    return Span(name, parent=_current_span.get(), stage=name, attributes=attributes)
+
+
+def set_attribute(key, value):
+    """Sets an attribute on the root span of the current trace, if any."""
+    current = _current_span.get()
+    if current is None:
+        return
+    while current.parent is not None:
+        current = current.parent
+    current.set(key, value)
+
+
+def _finish(finished):
+    seconds = finished.duration_ms / 1000
+    if finished.stage:
+        metrics.record_stage(finished.stage, seconds)
+
+    parent = finished.parent
+    if parent is not None:
+        parent.children.append(finished)
+        # Roll stage latencies up so the root sees the whole request.
+        if finished.stage:
+            parent.stage_ms[finished.stage] = parent.stage_ms.get(finished.stage, 0.0) + finished.duration_ms
+        for name, ms in finished.stage_ms.items():
+            parent.stage_ms[name] = parent.stage_ms.get(name, 0.0) + ms
+        return
+    if finished.stage:
+        # A stage run outside any traced operation (a script, a benchmark)
+        # only feeds the metrics; logging it would give one line per stage.
+        return
+
+    logger.info(json.dumps({
+        'trace_id': finished.trace_id,
+        'span': finished.name,
+        'status': finished.status,
+        'duration_ms': round(finished.duration_ms, 2),
+        'stages_ms': {name: round(ms, 2) for name, ms in finished.stage_ms.items()},
+        **finished.attributes,
+    }, default=str))
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.export(finished)
+
+
+# --- Log output off the request thread ---
+_log_listener = None
+
+
+def start_log_queue():
+    """
+    Moves the handlers configured for this logger (LOGGING in settings)
+    behind a QueueHandler, so a request only enqueues its JSON line and a
+    QueueListener thread does the writing. Called once from CoreConfig.ready.
+    """
+    global _log_listener
+    handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+    if _log_listener is not None or not handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    _log_listener.start()
+    atexit.register(stop_log_queue)
+
+
+def stop_log_queue():
+    """Writes the lines still queued and stops the listener thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+# --- OTLP-style JSON lines exporter ---
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(s):
+    return {
+        'traceId': s.trace_id,
+        'spanId': s.span_id,
+        'parentSpanId': s.parent.span_id if s.parent else '',
+        'name': s.name,
+        'kind': 1,
+        'startTimeUnixNano': str(s.start_ns),
+        'endTimeUnixNano': str(s.end_ns),
+        'attributes': _otlp_attributes(s.attributes),
+        'events': [
+            {'timeUnixNano': str(t), 'name': name, 'attributes': _otlp_attributes(attrs)}
+            for t, name, attrs in s.events
+        ],
+        'status': {'code': 1 if s.status == 'OK' else 2},
+    }
+
+
+def _flatten(root):
+    spans, pending = [], [root]
+    while pending:
+        s = pending.pop()
+        spans.append(_otlp_span(s))
+        pending.extend(s.children)
+    return spans
+
+
+class FileSpanExporter:
+    """
+    Appends each finished trace as one OTLP/JSON ExportTraceServiceRequest
+    per line, the format the OpenTelemetry Collector's file receiver reads.
+    Writing happens on a background thread; when the queue is full, traces
+    are dropped rather than slowing requests down.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name='span-exporter', daemon=True).start()
+
+    def export(self, root):
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            roots = [self._queue.get()]
+            while not self._queue.empty() and len(roots) < 100:
+                roots.append(self._queue.get_nowait())
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for root in roots:
+                        f.write(json.dumps(self._payload(root)) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write traces to {self.path}: {e}")
+            for _ in roots:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued trace has been written."""
+        self._queue.join()
+
+    @staticmethod
+    def _payload(root):
+        return {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{'scope': {'name': 'core.tracing'}, 'spans': _flatten(root)}],
+        }]}
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """Returns the file exporter if TRACING_EXPORT_PATH is set, else None."""
+    global _exporter
+    path = getattr(settings, 'TRACING_EXPORT_PATH', None)
+    if not path:
+        return None
+    if _exporter is None or _exporter.path != str(path):
+        with _exporter_lock:
+            if _exporter is None or _exporter.path != str(path):
+                _exporter = FileSpanExporter(path)
+    return _exporter
@@ -0,0 +1,192 @@
+# core/transcript_index.py
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .chunking import get_video_chunks
+from .vector_shards import get_shard_cache_size
+
+# --- Constants ---
+INDEX_TTL_SECONDS = getattr(settings, 'TRANSCRIPT_INDEX_TTL', 600)
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_WINDOW_MAX_CHARS = 4000
+SEGMENT_SEPARATOR = ' '
+
+
+class VideoIntervalIndex:
+    """
+    Sorted transcript intervals for a single video, built from the same
+    TranscriptChunk rows that ingestion embeds.
+    Lookups use binary search over the segment start times.
+
+    The segment texts are also joined into one string with a prefix array of
+    character offsets, so the text of any run of consecutive segments is a
+    single slice.
+    """
+
+    def __init__(self, starts, ends, texts):
+        self.starts = starts
+        self.ends = ends
+        self.texts = texts
+        self.offsets = [0]
+        for text in texts:
+            self.offsets.append(self.offsets[-1] + len(text) + len(SEGMENT_SEPARATOR))
+        self.corpus = SEGMENT_SEPARATOR.join(texts) + SEGMENT_SEPARATOR if texts else ''
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Builds an index from chunk dicts (start, end, content) sorted by start time."""
+        starts, ends, texts = [], [], []
+        for chunk in chunks:
+            starts.append(float(chunk['start']))
+            ends.append(float(chunk['end']))
+            texts.append(chunk['content'])
+        return cls(starts, ends, texts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, timestamp):
+        """
+        Returns the segment index whose interval contains the timestamp,
+        or None if the timestamp falls outside the transcript. A timestamp in
+        a pause between two segments belongs to the earlier one.
+        """
+        i = bisect.bisect_right(self.starts, timestamp) - 1
+        if i < 0 or (i == len(self) - 1 and timestamp >= self.ends[i]):
+            return None
+        return i
+
+    def segment_at(self, timestamp):
+        """Returns a dict with start, end and content for the timestamp, or None."""
+        i = self.lookup(timestamp)
+        if i is None:
+            return None
+        return {'start': self.starts[i], 'end': self.ends[i], 'content': self.texts[i]}
+
+    def window_at(self, timestamp, seconds=DEFAULT_WINDOW_SECONDS, max_chars=DEFAULT_WINDOW_MAX_CHARS):
+        """
+        Returns a dict with start, end and content for the segments overlapping
+        timestamp +/- seconds, or None if no segment contains the timestamp.
+        If the window is longer than max_chars it is narrowed, on segment
+        boundaries, around the segment at the timestamp.
+        """
+        i = self.lookup(timestamp)
+        if i is None:
+            return None
+        first = min(bisect.bisect_right(self.ends, timestamp - seconds), i)
+        last = max(bisect.bisect_left(self.starts, timestamp + seconds) - 1, i)
+
+        lo, hi = self.offsets[first], self.offsets[last + 1]
+        if hi - lo > max_chars:
+            middle = (self.offsets[i] + self.offsets[i + 1]) // 2
+            lo = max(lo, min(middle - max_chars // 2, hi - max_chars))
+            first = min(bisect.bisect_left(self.offsets, lo), i)
+            last = min(max(bisect.bisect_right(self.offsets, self.offsets[first] + max_chars) - 2, i), last)
+            lo, hi = self.offsets[first], self.offsets[last + 1]
+            # A single segment longer than max_chars is cut.
+            hi = min(hi, lo + max_chars)
+
+        return {
+            'start': self.starts[first],
+            'end': self.ends[last],
+            'content': self.corpus[lo:hi].strip(),
+        }
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at > INDEX_TTL_SECONDS
+
+
+# --- Process-wide index cache ---
+# Least recently used first; capped like the vector shard cache, since each
+# queried video needs both.
+_indexes = OrderedDict()
+_lock = threading.Lock()
+# One lock per video being built, so a slow build never blocks other videos.
+_build_locks = {}
+# Bumped by every invalidation; a build that overlapped one is not cached.
+_generation = 0
+
+
+def _build_index(video_id):
+    return VideoIntervalIndex.from_chunks(get_video_chunks(video_id))
+
+
+def _cached_index(video_id):
+    """Returns the fresh cached index for a video, or None (caller holds _lock)."""
+    index = _indexes.get(video_id)
+    if index is None or index.is_stale():
+        return None
+    _indexes.move_to_end(video_id)
+    return index
+
+
+def _store_index(video_id, index):
+    """Caches an index, evicting the least recently used ones (caller holds _lock)."""
+    _indexes[video_id] = index
+    _indexes.move_to_end(video_id)
+    while len(_indexes) > get_shard_cache_size():
+        _indexes.popitem(last=False)
+
+
+def get_interval_index(video_id):
+    """
+    Returns the interval index for a video, building it from the stored
+    transcript chunks on first use. Returns None for an invalid video id.
+    """
+    try:
+        video_id = int(video_id)
+    except (TypeError, ValueError):
+        return None
+
+    with _lock:
+        index = _cached_index(video_id)
+        if index is not None:
+            return index
+        build_lock = _build_locks.setdefault(video_id, threading.Lock())
+
+    with build_lock:
+        with _lock:
+            index = _cached_index(video_id)
+            generation = _generation
+        if index is not None:
+            return index
+        try:
+            index = _build_index(video_id)
+        finally:
+            with _lock:
+                _build_locks.pop(video_id, None)
+        with _lock:
+            if generation == _generation:
+                _store_index(video_id, index)
+    return index
+
+
+def invalidate_interval_index(video_id=None):
+    """Drops the cached index for one video, or for all videos if none is given."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if video_id is None:
+            _indexes.clear()
+        else:
+            try:
+                _indexes.pop(int(video_id), None)
+            except (TypeError, ValueError):
+                pass
+
+
+def prime_interval_index(video_id, chunks):
+    """
+    Caches an index built from the given chunk dicts instead of the database,
+    e.g. for the CSV corpus of the benchmark commands.
+    """
+    index = VideoIntervalIndex.from_chunks(chunks)
+    with _lock:
+        _store_index(int(video_id), index)
+    return index
@@ -0,0 +1,156 @@
+# core/transcription.py
+#
+# Runs inside the worker processes of generate_transcripts. Keep it free of
+# Django imports: workers are started with the 'spawn' method and should not
+# need the project settings.
+
+import os
+import subprocess
+import time
+
+import numpy as np
+
+# --- Constants ---
+DEFAULT_MODEL_NAME = 'base'
+# whisper.load_audio always resamples to 16 kHz mono float32.
+SAMPLE_RATE = 16000
+# Silence detection: 30 ms frames are silent when their energy is this many
+# dB below the loud end (95th percentile) of the recording.
+FRAME_SECONDS = 0.03
+SILENCE_DB = -35.0
+MIN_SILENCE_SECONDS = 0.5
+# Pieces are cut at silences and kept between these lengths where possible.
+MIN_PIECE_SECONDS = 30.0
+MAX_PIECE_SECONDS = 300.0
+
+# --- Per-process state ---
+# Each worker loads its own Whisper model once, in init_worker.
+_model = None
+
+
+def init_worker(model_name=DEFAULT_MODEL_NAME, threads=1):
+    """Process pool initializer: limits torch threads and preloads the model."""
+    global _model
+    import torch
+    import whisper
+
+    torch.set_num_threads(max(1, threads))
+    _model = whisper.load_model(model_name)
+
+
+def _segments(result, offset=0.0):
+    return [
+        {'start': float(s['start']) + offset, 'end': float(s['end']) + offset, 'text': s['text'].strip()}
+        for s in result.get('segments', [])
+    ]
+
+
+def transcribe_file(audio_path):
+    """
+    Transcribes one audio file with the worker's model.
+    Returns (segments, seconds) where segments are dicts with start, end and text.
+    """
+    started = time.perf_counter()
+    result = _model.transcribe(audio_path, fp16=False)
+    return _segments(result), time.perf_counter() - started
+
+
+def transcribe_piece(audio_path, offset, duration):
+    """
+    Transcribes one piece of a split recording, decoding only that piece.
+    Segment times are shifted by offset (the piece's start in seconds) so
+    they refer to the whole recording.
+    """
+    started = time.perf_counter()
+    result = _model.transcribe(load_audio(audio_path, offset, duration), fp16=False)
+    return _segments(result, offset), time.perf_counter() - started
+
+
+def plan_pieces(audio_path, max_seconds=MAX_PIECE_SECONDS):
+    """
+    Decodes a recording and finds where to split it. Runs in a worker so the
+    parent never holds decoded audio; returns ([(offset, duration)], seconds).
+    """
+    started = time.perf_counter()
+    pieces = split_on_silence(load_audio(audio_path), max_seconds=max_seconds)
+    return pieces, time.perf_counter() - started
+
+
+# --- Silence splitting ---
+def load_audio(audio_path, offset=0.0, duration=None):
+    """
+    Decodes any format ffmpeg understands to 16 kHz mono float32 samples,
+    the same way whisper.load_audio does, optionally only duration seconds
+    starting at offset.
+    """
+    cmd = ['ffmpeg', '-nostdin', '-threads', '0']
+    if offset:
+        cmd += ['-ss', f'{offset:.3f}']
+    if duration is not None:
+        cmd += ['-t', f'{duration:.3f}']
+    cmd += ['-i', audio_path, '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-']
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode(errors='replace')}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def find_silences(audio, sample_rate=SAMPLE_RATE):
+    """Returns the sample positions in the middle of each long enough silence."""
+    frame = int(sample_rate * FRAME_SECONDS)
+    frames = len(audio) // frame
+    if frames == 0:
+        return []
+    energy = np.sqrt(np.mean(np.square(audio[:frames * frame].reshape(frames, frame)), axis=1))
+    level = 20 * np.log10(energy + 1e-10)
+    silent = level < np.percentile(level, 95) + SILENCE_DB
+
+    # Start and end frames of each run of silent frames.
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_frames = int(MIN_SILENCE_SECONDS / FRAME_SECONDS)
+    long_runs = (run_ends - run_starts) >= min_frames
+    return [int((a + b) // 2 * frame) for a, b in zip(run_starts[long_runs], run_ends[long_runs])]
+
+
+def split_on_silence(audio, sample_rate=SAMPLE_RATE, min_seconds=MIN_PIECE_SECONDS, max_seconds=MAX_PIECE_SECONDS):
+    """
+    Splits a recording at silences into pieces of at most max_seconds
+    (cutting mid-speech only when no silence is available) and at least
+    min_seconds where possible. Returns [(offset_seconds, duration_seconds)].
+    """
+    min_len, max_len = int(min_seconds * sample_rate), int(max_seconds * sample_rate)
+    boundaries, candidate = [0], None
+    for cut in find_silences(audio, sample_rate) + [len(audio)]:
+        while cut - boundaries[-1] > max_len:
+            if candidate is not None and candidate - boundaries[-1] >= min_len:
+                boundaries.append(candidate)
+            else:
+                boundaries.append(boundaries[-1] + max_len)
+            candidate = None
+        candidate = cut
+    if boundaries[-1] < len(audio):
+        boundaries.append(len(audio))
+    return [(start / sample_rate, (end - start) / sample_rate) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def stitch(pieces):
+    """
+    Joins the segments of transcribed pieces, given as [(offset, segments)],
+    into one list ordered by time with no overlapping segments.
+    """
+    stitched = []
+    for _, segments in sorted(pieces, key=lambda piece: piece[0]):
+        for segment in segments:
+            if not segment['text']:
+                continue
+            if stitched and segment['start'] < stitched[-1]['end']:
+                stitched[-1]['end'] = max(stitched[-1]['start'], segment['start'])
+            stitched.append(dict(segment))
+    return stitched
+
+
+def threads_per_worker(workers):
+    """Splits the machine's cores evenly between transcription workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
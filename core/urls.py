@@ -1,7 +1,8 @@
 # core/urls.py
 
+from django.conf import settings
 from django.urls import path
-from .views import auth_views, content_views, api_views
+from .views import auth_views, content_views, api_views, metrics_views
 
 urlpatterns = [
     # --- Content Page URLs ---
@@ -26,7 +27,14 @@ urlpatterns = [
     path('api/notes/edit/<int:note_id>/', api_views.edit_note_view, name='edit_note'),
     path('api/notes/delete/<int:note_id>/', api_views.delete_note_view, name='delete_note'),
     
-    # AI Assistant API URL
-    path('api/assistant/', api_views.AssistantAPIView.as_view(), name='assistant_api'),
+    # AI Assistant API URL (async view when served under ASGI)
+    path(
+        'api/assistant/',
+        api_views.assistant_async_view if settings.ASSISTANT_ASYNC else api_views.AssistantAPIView.as_view(),
+        name='assistant_api'
+    ),
+
+    # Prometheus metrics (see core/middleware.py)
+    path('metrics/', metrics_views.metrics_view, name='metrics'),
 ]
 handler404 = 'core.views.custom_404_view'
\ No newline at end of file
@@ -0,0 +1,101 @@
+# core/vector_shards.py
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .mmap_index import MmapVectorShard, HEADER_FILENAME
+
+# --- Constants ---
+SHARDS_DIRNAME = 'videos'
+DEFAULT_SHARD_CACHE_SIZE = 64
+
+
+def shards_root(index_path):
+    return os.path.join(index_path, SHARDS_DIRNAME)
+
+
+def shard_path(index_path, video_id):
+    return os.path.join(shards_root(index_path), str(video_id))
+
+
+def save_shard(index_path, video_id, vectors, documents, ids, quantization='none'):
+    """
+    Writes a video's shard to a temporary directory and swaps it into place,
+    so readers never see a half-written shard.
+    """
+    path = shard_path(index_path, video_id)
+    tmp_path, old_path = path + '.tmp', path + '.old'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    MmapVectorShard.write(tmp_path, vectors, documents, ids, quantization=quantization)
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def delete_shard(index_path, video_id):
+    shutil.rmtree(shard_path(index_path, video_id), ignore_errors=True)
+
+
+class ShardCache:
+    """
+    Lazily opens per-video shards and keeps the most recently used ones
+    mapped. A shard is reopened when its header on disk changes, which
+    picks up re-ingestion done by another process.
+    """
+
+    def __init__(self, index_path, max_shards=DEFAULT_SHARD_CACHE_SIZE):
+        self.index_path = index_path
+        self.max_shards = max_shards
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, video_id):
+        """Returns the MmapVectorShard for a video, or None if it has no shard."""
+        video_id = str(video_id)
+        try:
+            mtime = os.path.getmtime(os.path.join(shard_path(self.index_path, video_id), HEADER_FILENAME))
+        except OSError:
+            self.invalidate(video_id)
+            return None
+
+        with self._lock:
+            cached = self._shards.get(video_id)
+            if cached is not None and cached[1] == mtime:
+                self._shards.move_to_end(video_id)
+                return cached[0]
+
+        store = MmapVectorShard(shard_path(self.index_path, video_id))
+        with self._lock:
+            self._shards[video_id] = (store, mtime)
+            self._shards.move_to_end(video_id)
+            self.loads += 1
+            while len(self._shards) > self.max_shards:
+                self._shards.popitem(last=False)
+                self.evictions += 1
+        return store
+
+    def invalidate(self, video_id=None):
+        with self._lock:
+            if video_id is None:
+                self._shards.clear()
+            else:
+                self._shards.pop(str(video_id), None)
+
+    def stats(self):
+        return {'loaded': len(self._shards), 'loads': self.loads, 'evictions': self.evictions}
+
+
+def get_shard_cache_size():
+    return getattr(settings, 'VECTOR_SHARD_CACHE_SIZE', DEFAULT_SHARD_CACHE_SIZE)
+
+
+def get_quantization():
+    return getattr(settings, 'VECTOR_INDEX_QUANTIZATION', 'none')
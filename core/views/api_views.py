@@ -2,7 +2,7 @@
 
 import json
 import logging
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
@@ -17,7 +17,9 @@ from rest_framework import status
 # Relative imports from the same app
 from ..models import Enrollment, Course, Video, Note
 from ..forms import NoteForm
-from ..rag_utils import query_router
+from ..rag_utils import query_router, stream_query_router, aquery_router, astream_query_router
+from ..answer_cache import get_answer_cache
+from ..tracing import set_attribute, span
 
 logger = logging.getLogger(__name__)
 
@@ -98,11 +100,13 @@ def delete_note_view(request, note_id):
     note.delete()
     return JsonResponse({'status': 'success', 'message': 'Note deleted successfully.'})
 
-# ... (AssistantAPIView remains the same) ...
+# --- AI Assistant API View ---
+
 class AssistantAPIView(APIView):
     """
     API View to handle queries to the AI assistant.
     Passes all context to the query_router.
+    With "stream": true the answer is sent as NDJSON lines while it is generated.
     """
     permission_classes = [IsAuthenticated]
 
@@ -119,13 +123,27 @@ class AssistantAPIView(APIView):
                 {'error': 'Query not provided.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if request.data.get('stream'):
+            return self.stream_answer(query, video_id, video_title, timestamp)
+
         try:
-            answer = query_router(
-                query=query,
-                video_id=video_id,
-                video_title=video_title,
-                timestamp=timestamp
-            )
+            # The request span covers the cache lookup (and its query
+            # embedding) as well as the router's own span.
+            with span('assistant.request', video_id=video_id, streaming=False):
+                cache = get_answer_cache()
+                answer, query_vector = cache.get(video_id, query, timestamp)
+                if answer is not None:
+                    set_attribute('route', 'cached')
+                    logger.info(f"Answer cache hit (hit rate {cache.stats()['hit_rate']:.0%})")
+                else:
+                    answer = query_router(
+                        query=query,
+                        video_id=video_id,
+                        video_title=video_title,
+                        timestamp=timestamp,
+                        query_vector=query_vector
+                    )
+                    cache.set(video_id, query, timestamp, answer, query_vector)
             return Response({'answer': answer}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"An error occurred in AssistantAPIView: {e}", exc_info=True)
@@ -133,39 +151,119 @@ class AssistantAPIView(APIView):
                 {'error': 'An error occurred while processing your request.'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-# --- AI Assistant API View ---
 
-class AssistantAPIView(APIView):
+    def stream_answer(self, query, video_id, video_title, timestamp):
+        """
+        Streams the answer as newline-delimited JSON: one {"token": ...} line
+        per chunk, then {"done": true}, or {"error": ...} if generation fails.
+        """
+        def events():
+            try:
+                with span('assistant.request', video_id=video_id, streaming=True):
+                    cache = get_answer_cache()
+                    answer, query_vector = cache.get(video_id, query, timestamp)
+                    if answer is not None:
+                        set_attribute('route', 'cached')
+                        yield json.dumps({'token': answer}) + '\n'
+                    else:
+                        chunks = []
+                        for chunk in stream_query_router(
+                            query=query,
+                            video_id=video_id,
+                            video_title=video_title,
+                            timestamp=timestamp,
+                            query_vector=query_vector
+                        ):
+                            chunks.append(chunk)
+                            yield json.dumps({'token': chunk}) + '\n'
+                        cache.set(video_id, query, timestamp, ''.join(chunks), query_vector)
+                yield json.dumps({'done': True}) + '\n'
+            except Exception as e:
+                logger.error(f"An error occurred while streaming in AssistantAPIView: {e}", exc_info=True)
+                yield json.dumps({'error': 'An error occurred while processing your request.'}) + '\n'
+
+        response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies such as nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+# --- Async AI Assistant View (served under ASGI) ---
+
+@require_POST
+async def assistant_async_view(request):
     """
-    API View to handle queries to the AI assistant.
-    Passes all context to the query_router.
+    Async version of AssistantAPIView for the ASGI application. While the
+    LLM call is in flight, the request waits on the event loop instead of
+    holding a worker thread. Accepts the same payload and "stream" flag.
     """
-    permission_classes = [IsAuthenticated]
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=403)
 
-    def post(self, request, *args, **kwargs):
-        query = request.data.get('query')
-        video_id = request.data.get('video_id')
-        video_title = request.data.get('video_title')
-        timestamp = request.data.get('timestamp', 0)
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
 
-        logger.info(f"API Request: query='{query}', video_id='{video_id}', timestamp='{timestamp}'")
+    query = data.get('query')
+    video_id = data.get('video_id')
+    video_title = data.get('video_title')
+    timestamp = data.get('timestamp', 0)
 
-        if not query:
-            return Response(
-                {'error': 'Query not provided.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        try:
-            answer = query_router(
-                query=query,
-                video_id=video_id,
-                video_title=video_title,
-                timestamp=timestamp
-            )
-            return Response({'answer': answer}, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.error(f"An error occurred in AssistantAPIView: {e}", exc_info=True)
-            return Response(
-                {'error': 'An error occurred while processing your request.'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+    logger.info(f"Async API Request: query='{query}', video_id='{video_id}', timestamp='{timestamp}'")
+
+    if not query:
+        return JsonResponse({'error': 'Query not provided.'}, status=400)
+
+    cache = get_answer_cache()
+
+    if data.get('stream'):
+        async def events():
+            try:
+                with span('assistant.request', video_id=video_id, streaming=True):
+                    answer, query_vector = await cache.aget(video_id, query, timestamp)
+                    if answer is not None:
+                        set_attribute('route', 'cached')
+                        yield json.dumps({'token': answer}) + '\n'
+                    else:
+                        chunks = []
+                        async for chunk in astream_query_router(
+                            query=query,
+                            video_id=video_id,
+                            video_title=video_title,
+                            timestamp=timestamp,
+                            query_vector=query_vector
+                        ):
+                            chunks.append(chunk)
+                            yield json.dumps({'token': chunk}) + '\n'
+                        cache.set(video_id, query, timestamp, ''.join(chunks), query_vector)
+                yield json.dumps({'done': True}) + '\n'
+            except Exception as e:
+                logger.error(f"An error occurred while streaming in assistant_async_view: {e}", exc_info=True)
+                yield json.dumps({'error': 'An error occurred while processing your request.'}) + '\n'
+
+        response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    try:
+        with span('assistant.request', video_id=video_id, streaming=False):
+            answer, query_vector = await cache.aget(video_id, query, timestamp)
+            if answer is not None:
+                set_attribute('route', 'cached')
+            else:
+                answer = await aquery_router(
+                    query=query,
+                    video_id=video_id,
+                    video_title=video_title,
+                    timestamp=timestamp,
+                    query_vector=query_vector
+                )
+                cache.set(video_id, query, timestamp, answer, query_vector)
+        return JsonResponse({'answer': answer})
+    except Exception as e:
+        logger.error(f"An error occurred in assistant_async_view: {e}", exc_info=True)
+        return JsonResponse({'error': 'An error occurred while processing your request.'}, status=500)
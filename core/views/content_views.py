@@ -1,9 +1,12 @@
 # core/views/content_views.py
 
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from ..models import Enrollment, Course, Video, Note # Use relative imports
+from django.db.models import Exists, OuterRef
+from ..models import Enrollment, Course, Note # Use relative imports
 from ..forms import NoteForm # Use relative imports
+from ..playlist import get_course_videos, get_timeout, playlist_version
 
 def home(request):
     return render(request, 'core/home.html')
@@ -33,21 +36,35 @@ def courses_list_view(request):
 
 @login_required
 def video_player_view(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
+    # One query for the course and the enrollment check.
+    course = get_object_or_404(
+        Course.objects.annotate(
+            is_enrolled=Exists(Enrollment.objects.filter(user=request.user, course=OuterRef('pk')))
+        ),
+        id=course_id,
+    )
     
-    if not Enrollment.objects.filter(user=request.user, course=course).exists():
+    if not course.is_enrolled:
         return redirect('dashboard')
     
-    all_videos = course.videos.all().order_by('id')
+    # The video list is cached per course and invalidated by core/signals.py.
+    version = playlist_version(course.id)
+    all_videos = get_course_videos(course.id, version)
     video_obj = None 
     
     video_id_from_url = request.GET.get('vid')
     if video_id_from_url:
-        video_obj = get_object_or_404(Video, id=video_id_from_url, course=course)
-    elif all_videos.exists():
-        video_obj = all_videos.first()
+        video_obj = next((v for v in all_videos if str(v.id) == video_id_from_url), None)
+        if video_obj is None:
+            raise Http404("No Video matches the given query.")
+    elif all_videos:
+        video_obj = all_videos[0]
 
-    notes = Note.objects.filter(user=request.user, video=video_obj) if video_obj else []
+    notes = (
+        Note.objects
+        .filter(user=request.user, video=video_obj)
+        .only('id', 'title', 'content', 'video_timestamp', 'created_at')
+    ) if video_obj else []
     form = NoteForm()
 
     context = {
@@ -56,5 +73,7 @@ def video_player_view(request, course_id):
         'video': video_obj,
         'notes': notes,
         'form': form,
+        'playlist_version': version,
+        'playlist_timeout': get_timeout(),
     }
-    return render(request, 'core/video_player.html', context)
\ No newline at end of file
+    return render(request, 'core/video_player.html', context)
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Set ASSISTANT_ASYNC=true when serving with this entry point so the AI
+assistant endpoint runs as an async view.
 """
 
 import os
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -143,3 +144,109 @@ SESSION_SAVE_EVERY_REQUEST = True
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 
 LOGIN_URL = 'home'
+
+# --- AI Assistant ---
+# Seconds before a cached per-video transcript interval index is rebuilt.
+TRANSCRIPT_INDEX_TTL = 600
+
+# Embedding client: batches of up to 100 texts, with a bounded number of
+# concurrent requests that shrinks automatically on 429/5xx responses.
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_MAX_IN_FLIGHT = 4
+
+# On-disk embedding cache shared by ingestion and query retrieval.
+EMBEDDING_CACHE_PATH = BASE_DIR / 'embedding_cache.sqlite3'
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+
+# Assistant answer cache: exact and semantic (embedding similarity) matches
+# per video, with time-sensitive questions bucketed by playback position.
+ASSISTANT_CACHE_TTL = 3600
+ASSISTANT_CACHE_MAX_ENTRIES = 2000
+ASSISTANT_CACHE_SIMILARITY = 0.92
+ASSISTANT_CACHE_TIMESTAMP_BUCKET = 15
+ASSISTANT_CACHE_SEMANTIC = True
+
+# Serve /api/assistant/ with the async view. Enable when running under the
+# ASGI application (e.g. `uvicorn incuisenix.asgi:application`).
+ASSISTANT_ASYNC = os.getenv('ASSISTANT_ASYNC', 'false').lower() == 'true'
+
+# Minimum relevance score (0-1) for a retrieved chunk to be used as RAG
+# context. If no chunk reaches it, the question goes to the general chain.
+RAG_RELEVANCE_THRESHOLD = 0.3
+
+# Number of per-video vector shards kept mapped per process (LRU).
+VECTOR_SHARD_CACHE_SIZE = 64
+# Shard vector format: 'none' (float32) or 'int8' (scalar quantized, 4x smaller).
+# Changing it re-indexes on the next ingest_transcripts run.
+VECTOR_INDEX_QUANTIZATION = 'none'
+
+# Hybrid BM25 + vector retrieval: candidates fetched from each ranking before
+# fusion, and the lexical score above which the query embedding is skipped.
+HYBRID_FETCH_K = 20
+HYBRID_LEXICAL_SKIP_CONFIDENCE = 0.9
+
+# Rerank stage: over-fetch RAG_RERANK_CANDIDATES chunks and send only the best
+# RAG_CONTEXT_CHUNKS to the LLM. 'lexical' runs anywhere; 'cross-encoder'
+# needs sentence-transformers and RAG_RERANKER_MODEL. Off by default, so the
+# prompt keeps the 5 best retrieved chunks; enable it with the env variable.
+RAG_RERANKER = os.getenv('RAG_RERANKER') or None
+RAG_RERANKER_MODEL = os.getenv('RAG_RERANKER_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RAG_RERANK_CANDIDATES = 50
+RAG_CONTEXT_CHUNKS = 3
+
+# Timestamp questions get the transcript within +/- this many seconds of the
+# moment as context, capped at ASSISTANT_TIMESTAMP_WINDOW_MAX_CHARS.
+ASSISTANT_TIMESTAMP_WINDOW = 60
+ASSISTANT_TIMESTAMP_WINDOW_MAX_CHARS = 4000
+
+# Downloaded lecture audio kept for generate_transcripts reruns, with the
+# least recently used files evicted past AUDIO_CACHE_MAX_BYTES.
+AUDIO_CACHE_DIR = MEDIA_ROOT / 'audio_cache'
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+
+# Cache for the video player's playlist fragments. Set REDIS_URL to share it
+# between worker processes so invalidations reach every worker; the default
+# per-process cache relies on PLAYLIST_CACHE_TIMEOUT to pick up changes.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+PLAYLIST_CACHE_TIMEOUT = 300
+
+# Request metrics (core/middleware.py): Server-Timing headers and /metrics/.
+# Both are off by default: Server-Timing exposes query counts and timings to
+# every client, and /metrics/ only exists once METRICS_TOKEN is set.
+# QUERY_BUDGETS caps the DB queries per URL name; over budget logs a warning,
+# or raises when QUERY_BUDGETS_STRICT is on (enable it in tests).
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'false').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+QUERY_BUDGETS = {
+    'video_player': 6,
+    'assistant_api': 4,
+}
+QUERY_BUDGETS_STRICT = os.getenv('QUERY_BUDGETS_STRICT', 'false').lower() == 'true'
+
+# Assistant tracing (core/tracing.py): each query logs one JSON line with its
+# route, context size and per-stage latency. Set TRACING_EXPORT_PATH to also
+# write OTLP/JSON traces to that file for an OpenTelemetry Collector. The
+# handlers below are moved behind a queue at startup (tracing.start_log_queue),
+# so requests never wait on the stream.
+TRACING_EXPORT_PATH = os.getenv('TRACING_EXPORT_PATH', '')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.tracing': {
+            'handlers': ['console'],
+            'level': os.getenv('TRACING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
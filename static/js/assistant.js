@@ -53,23 +53,21 @@ document.addEventListener('DOMContentLoaded', function() {
                     query: query, 
                     video_id: videoId,
                     video_title: videoTitle,
-                    timestamp: timestamp // Add the current timestamp
+                    timestamp: timestamp, // Add the current timestamp
+                    stream: true // Receive tokens as they are generated
                 })
             });
 
-            removeLoadingIndicator();
-            
             if (!response.ok) {
+                removeLoadingIndicator();
                 const errorData = await response.json();
                 const errorMessage = errorData.error || `An unexpected error occurred. Status: ${response.status}`;
                 throw new Error(errorMessage);
             }
 
-            const data = await response.json();
-
-            if (data.answer) {
-                appendMessage(data.answer, 'assistant');
-            } else {
+            const answer = await readAnswerStream(response);
+            if (!answer) {
+                removeLoadingIndicator();
                 appendMessage('Sorry, an error occurred. The assistant did not provide a valid answer.', 'assistant');
             }
 
@@ -80,6 +78,44 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     };
 
+    // Reads the NDJSON stream ({"token"}, {"done"} or {"error"} per line) and
+    // renders the answer progressively. Returns the full answer text.
+    async function readAnswerStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let messageElement = null;
+
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            if (event.error) {
+                throw new Error(event.error);
+            }
+            if (event.token) {
+                if (!messageElement) {
+                    removeLoadingIndicator();
+                    messageElement = appendMessage('', 'assistant');
+                }
+                answer += event.token;
+                messageElement.innerHTML = converter.makeHtml(answer);
+                chatBox.scrollTop = chatBox.scrollHeight;
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer);
+        return answer;
+    }
+
     if (assistantForm) {
         assistantForm.addEventListener('submit', handleSubmit);
     }
@@ -97,6 +133,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         chatBox.appendChild(messageElement);
         chatBox.scrollTop = chatBox.scrollHeight;
+        return messageElement;
     }
 
     function showLoadingIndicator() {